@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+REGISTRY_PATH = "agent_registry.json"
+DEFAULT_VALIDATE_TTL = 86400
+
+
+def agent_fingerprint(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def is_missing_agent(error):
+    return getattr(error, "status_code", None) == 404
+
+
+# --- Agent Registry ---
+# Remembers which remote agent was created for which local config (model,
+# instructions, completion args, ...). An agent is reused as long as its
+# config fingerprint matches; it is only re-validated with a
+# `beta.agents.get` call once the TTL has passed, and only recreated when the
+# config changed or the remote agent is gone.
+class AgentRegistry:
+    def __init__(self, path=REGISTRY_PATH, validate_ttl=None):
+        self.path = path
+        self.validate_ttl = (
+            validate_ttl if validate_ttl is not None
+            else float(os.getenv("AGENT_VALIDATE_TTL", DEFAULT_VALIDATE_TTL))
+        )
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def _store(self, name, agent_id, fingerprint):
+        entries = self._load()
+        entries[name] = {"agent_id": agent_id, "fingerprint": fingerprint, "validated_at": time.time()}
+        self._save(entries)
+
+    def get_agent_id(self, client, name, config, legacy_id=None):
+        from llm_client import get_llm
+
+        fingerprint = agent_fingerprint(config)
+        with self._lock:
+            entry = self._load().get(name)
+            if entry is None and legacy_id:
+                # IDs saved before the registry existed were created from the same config.
+                entry = {"agent_id": legacy_id, "fingerprint": fingerprint, "validated_at": 0}
+
+            if entry and entry["fingerprint"] == fingerprint:
+                if time.time() - entry["validated_at"] < self.validate_ttl:
+                    return entry["agent_id"]
+                try:
+                    get_llm(client).call("beta.agents.get_async", label=f"validate {name}", agent_id=entry["agent_id"])
+                    self._store(name, entry["agent_id"], fingerprint)
+                    print(f"✅ Loaded valid agent ID: {entry['agent_id']}")
+                    return entry["agent_id"]
+                except Exception as e:
+                    print(f"⚠️ Agent ID {entry['agent_id']} is invalid or inaccessible: {e}")
+            elif entry:
+                print(f"🔧 Agent config for '{name}' changed; creating a new agent.")
+
+            try:
+                agent = get_llm(client).call("beta.agents.create_async", label=f"create {name}", idempotent=False, **config)
+            except Exception as e:
+                print(f"❌ Error creating agent: {e}")
+                return None
+            print(f"✅ Created agent with ID: {agent.id}")
+            self._store(name, agent.id, fingerprint)
+            return agent.id
+
+    def invalidate(self, name):
+        with self._lock:
+            entries = self._load()
+            if entries.pop(name, None) is not None:
+                self._save(entries)
+
+
+_default_registry = None
+
+
+def get_agent_registry():
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = AgentRegistry()
+    return _default_registry
@@ -1,9 +1,14 @@
 import os
-import yaml
-import glob
-import requests
+import threading
 from dotenv import load_dotenv
-from mistralai import Mistral  # NEW import style
+from llm_client import get_llm
+from report_index import latest_reports, report_for_path
+from report_store import load_report_header
+from log_scan import SEVERITY_SCANNER
+from conversation_memory import get_memory, seed_inputs
+from agent_registry import get_agent_registry
+from notifier import get_notifier
+from tracing import span, start_tracing, write_trace
 
 load_dotenv()
 
@@ -11,12 +16,6 @@ MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 AGENT_ID_FILE = "agent_id.txt"
 CONVERSATION_ID_FILE = "conversation_id.txt"
 
-def get_mistral_client():
-    api_key = os.getenv("MISTRAL_API_KEY")
-    if not api_key:
-        raise ValueError("MISTRAL_API_KEY environment variable is not set.")
-    return Mistral(api_key=api_key)
-
 def save_agent_id(agent_id):
     with open(AGENT_ID_FILE, "w") as f:
         f.write(agent_id)
@@ -37,36 +36,55 @@ def load_conversation_id():
             return f.read().strip()
     return None
 
-def create_network_architect_agent(client):
-    try:
-        agent = client.beta.agents.create(
-            model="pixtral-12b-2409",
-            description="Expert network engineer and security architect agent.",
-            name="Network Architect Assistant",
-            instructions=(
-                "You are a helpful expert network engineering and security architect who can diagnose and troubleshoot network issues extremely well, "
-                "including anticipating possible issues in the future. You will be coordinating actions among team members in order to keep the network "
-                "up and running in good health at all times. When asked a question, provide a clear, direct answer without adding extra action plans or long explanations unless specifically requested. If you don’t have enough info, ask for clarification instead of assuming. Keep your responses concise and focused."
-            ),
-            completion_args={
-                "temperature": 0.3,
-                "top_p": 0.95,
-            },
-        )
-        print(f"✅ Created agent with ID: {agent.id}")
-        return agent.id
-    except Exception as e:
-        print(f"❌ Error creating agent: {e}")
-        return None
+def clear_conversation_id():
+    if os.path.exists(CONVERSATION_ID_FILE):
+        os.remove(CONVERSATION_ID_FILE)
 
-def is_valid_agent_id(client, agent_id):
+def begin_turn(client, inputs):
+    # Rolls the conversation over once it is too large (see
+    # conversation_memory.py); a fresh conversation is seeded with the digest.
+    memory = get_memory()
+    conversation_id = load_conversation_id()
+    reason = memory.rollover_reason(conversation_id) if conversation_id else None
+    if reason:
+        print(f"🗜️ Rolling over conversation {conversation_id} ({reason})...")
+        try:
+            memory.rollover(client, conversation_id)
+            clear_conversation_id()
+            conversation_id = None
+        except Exception as e:
+            print(f"⚠️ Could not build the memory digest, keeping the current conversation: {e}")
+    if conversation_id is None:
+        digest = memory.latest_digest()
+        if digest:
+            inputs = seed_inputs(digest, inputs)
+    return conversation_id, inputs
+
+def end_turn(conversation_id, agent_id, inputs, reply, usage, label):
+    if not conversation_id:
+        return
+    save_conversation_id(conversation_id)
     try:
-        # Ensure the get method is called with only the agent_id
-        agent = client.beta.agents.get(agent_id=agent_id)
-        return True  # Agent exists and is accessible
+        get_memory().record_turn(conversation_id, agent_id, inputs, reply, usage, label)
     except Exception as e:
-        print(f"⚠️ Agent ID {agent_id} is invalid or inaccessible: {e}")
-        return False  # Agent does not exist or is not accessible
+        print(f"⚠️ Could not record the conversation turn: {e}")
+
+# Any change here gives a new fingerprint, so agent_registry.py creates a
+# fresh remote agent on the next run; otherwise the saved one is reused.
+NETWORK_ARCHITECT_AGENT = {
+    "model": "pixtral-12b-2409",
+    "description": "Expert network engineer and security architect agent.",
+    "name": "Network Architect Assistant",
+    "instructions": (
+        "You are a helpful expert network engineering and security architect who can diagnose and troubleshoot network issues extremely well, "
+        "including anticipating possible issues in the future. You will be coordinating actions among team members in order to keep the network "
+        "up and running in good health at all times. When asked a question, provide a clear, direct answer without adding extra action plans or long explanations unless specifically requested. If you don’t have enough info, ask for clarification instead of assuming. Keep your responses concise and focused."
+    ),
+    "completion_args": {
+        "temperature": 0.3,
+        "top_p": 0.95,
+    },
+}
 
 
 
@@ -74,29 +92,33 @@ WEBEX_TOKEN = os.getenv("WEBEX_BOT_TOKEN")
 WEBEX_SPACE = os.getenv("WEBEX_SPACE")
 ALEXANDER_WEBEX_ID = os.getenv("ALEXANDER_WEBEX_ID")
 
-SEVERITY_KEYWORDS = [
-    "CRITICAL", "FAILURE", "OUTAGE", "DOWN", "MAJOR ISSUE",
-    "HIGH IMPACT", "DATA LOSS", "UNABLE TO CONNECT", "NOT RESPONSIVE"
-]
-
 def get_latest_yaml(device_type):
-    output_dir = os.path.join("output", device_type)
-    files = glob.glob(os.path.join(output_dir, "*.yaml"))
-    files.sort(key=os.path.getmtime, reverse=True)
-    return files[0] if files else None
+    reports = latest_reports(device_type, 1)
+    return reports[0]["path"] if reports else None
 
 def load_summary_from_yaml(path):
-    with open(path, "r") as f:
-        data = yaml.safe_load(f)
-        return (
-            data.get("summary", ""),
-            data.get("timestamp", ""),
-            data.get("device_type", "unknown"),
-        )
+    # The index holds the summary, so the raw outputs never need parsing here.
+    report = report_for_path(path)
+    if report:
+        return report["summary"] or "", report["timestamp"], report["device_type"]
+    data = load_report_header(path)
+    return (
+        data.get("summary") or "",
+        data.get("timestamp", ""),
+        data.get("device_type", "unknown"),
+    )
+
+def load_findings(path):
+    # Rule findings are indexed with the report; only reports indexed before
+    # that need their header parsed.
+    report = report_for_path(path)
+    if report and report["findings"] is not None:
+        return report["findings"]["findings"], report["findings"]["findings_alerted"]
+    data = load_report_header(path)
+    return data.get("findings") or [], bool(data.get("findings_alerted"))
 
 def is_critical(summary):
-    summary_tail = summary[-2000:].upper()
-    return any(keyword in summary_tail for keyword in SEVERITY_KEYWORDS)
+    return SEVERITY_SCANNER.search(summary)
 
 
 
@@ -108,68 +130,110 @@ def extract_agent_reply(response):
     return agent_reply
 
 
-def send_agent_update(client, agent_id, summary, device_type, timestamp):
-    try:
-        input_text = (
-            f"A network scan of Cisco `{device_type}` devices was completed at `{timestamp}`. "
-            f"Here is the raw issue summary:\n\n{summary}\n\n"
-            "Please identify the most critical issues first, especially unreachable devices, outages, or total failures. "
-            "Summarize key points in priority order. Avoid repeating similar issues unless they impact different systems. "
-            "Keep the summary focused and high signal."
-        )
+def _reply_text(content):
+    if isinstance(content, list):
+        return "".join(getattr(chunk, "text", "") or "" for chunk in content)
+    return content if isinstance(content, str) else ""
 
 
-        conversation_id = load_conversation_id()
-
-        if conversation_id:
-            response = client.beta.conversations.append(
-                conversation_id=conversation_id,
-                inputs=input_text,
-                store=True
-            )
-        else:
-            response = client.beta.conversations.start(
-                agent_id=agent_id,
-                inputs=input_text,
-                store=True
+def send_agent_update(client, agent_id, summary, device_type, timestamp):
+    with span("agent.update", device_type=device_type, summary_chars=len(summary)) as update_span:
+        try:
+            input_text = (
+                f"A network scan of Cisco `{device_type}` devices was completed at `{timestamp}`. "
+                f"Here is the raw issue summary:\n\n{summary}\n\n"
+                "Please identify the most critical issues first, especially unreachable devices, outages, or total failures. "
+                "Summarize key points in priority order. Avoid repeating similar issues unless they impact different systems. "
+                "Keep the summary focused and high signal."
             )
 
-        conversation_id = getattr(response, "conversation_id", None)
-        if conversation_id:
-            save_conversation_id(conversation_id)
 
-        agent_reply = extract_agent_reply(response)
+            conversation_id, inputs = begin_turn(client, input_text)
+
+            llm = get_llm(client)
+            if conversation_id:
+                response = llm.call(
+                    "beta.conversations.append_async",
+                    label=f"agent update {device_type}",
+                    conversation_id=conversation_id,
+                    inputs=inputs,
+                    store=True,
+                    idempotent=False,
+                )
+            else:
+                response = llm.call(
+                    "beta.conversations.start_async",
+                    label=f"agent update {device_type}",
+                    agent_id=agent_id,
+                    inputs=inputs,
+                    store=True,
+                    idempotent=False,
+                )
 
-        print(f"🧠 Agent received update for {device_type}.")
-        print(f"🤖 Agent reply:\n{agent_reply}")
+            conversation_id = getattr(response, "conversation_id", None) or conversation_id
+            agent_reply = extract_agent_reply(response)
+            end_turn(
+                conversation_id, agent_id, input_text, _reply_text(agent_reply),
+                getattr(response, "usage", None), f"agent update {device_type}",
+            )
 
-        return conversation_id
+            print(f"🧠 Agent received update for {device_type}.")
+            print(f"🤖 Agent reply:\n{agent_reply}")
 
-    except Exception as e:
-        print(f"⚠️ Failed to update agent: {e}")
-        return None
+            return conversation_id
 
+        except Exception as e:
+            update_span.fail(e)
+            print(f"⚠️ Failed to update agent: {e}")
+            return None
 
 
 
-def send_webex_message(recipient, message, is_room=False):
-    url = "https://webexapis.com/v1/messages"
-    headers = {
-        "Authorization": f"Bearer {WEBEX_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {"markdown": message}
-    if is_room:
-        payload["roomId"] = recipient
-    else:
-        payload["toPersonId"] = recipient
 
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code != 200:
-        print(f"❌ Failed to send Webex message: {response.status_code} {response.text}")
+def send_webex_message(recipient, message, is_room=False, dedup_key=None, on_delivered=None):
+    # Queued on the shared notifier (notifier.py): pooled session, timeouts,
+    # retries and dedup happen on its background worker.
+    with span("webex.send", room=is_room, bytes=len(message)) as send_span:
+        queued = get_notifier().send(
+            recipient, message, is_room=is_room, dedup_key=dedup_key, on_delivered=on_delivered
+        )
+        send_span.set(queued=queued)
+        return queued
+
+def flush_notifications():
+    # Sends the coalesced per-run digest and waits until the queue is drained.
+    notifier = get_notifier()
+    notifier.flush_digests()
+    notifier.flush()
+
+def send_findings_alert(device_type, findings):
+    # Sent straight after collection, before any LLM call, for findings the
+    # local rule engine rates critical. Returns an event that is set once
+    # Webex accepted the alert, or None if nothing was queued.
+    critical = [finding for finding in findings if finding.severity == "critical"]
+    if not critical:
+        return None
+    indicators = "\n".join(str(finding) for finding in critical[:10])
+    if len(critical) > 10:
+        indicators += f"\n... {len(critical) - 10} more"
+    alert_msg = f"""🚨 **Critical Network Issue Detected (local checks)**
+Deterministic checks on freshly collected `{device_type}` outputs found:
+{indicators}
+A full AI analysis will follow.
+"""
+    dedup_key = f"findings|{device_type}|" + "|".join(sorted(str(finding) for finding in critical))
+    delivered = threading.Event()
+    if not send_webex_message(ALEXANDER_WEBEX_ID, alert_msg, dedup_key=dedup_key, on_delivered=delivered.set):
+        return None
+    print(f"📨 Critical findings alert queued for {device_type}.")
+    return delivered
+
+def findings_alert_delivered(delivery):
+    # Only an alert Webex accepted counts as sent; otherwise collaborate()
+    # pages on the rule findings itself.
+    return bool(delivery and delivery.wait(get_notifier().timeout))
 
 def interactive_chat(client, agent_id):
-    conversation_id = load_conversation_id()
     print("\n💬 Starting interactive chat with the agent. Type 'exit' or 'quit' to stop.\n")
 
     while True:
@@ -179,57 +243,76 @@ def interactive_chat(client, agent_id):
             break
 
         try:
-            if conversation_id:
-                response = client.beta.conversations.append(
-                    conversation_id=conversation_id,
-                    inputs=user_input,
-                    store=True
-                )
-            else:
-                response = client.beta.conversations.start(
-                    agent_id=agent_id,
-                    inputs=user_input,
-                    store=True
-                )
-            conversation_id = getattr(response, "conversation_id", None)
-            if conversation_id:
-                save_conversation_id(conversation_id)
-
-            agent_reply = extract_agent_reply(response)
-            print(f"Agent: {agent_reply}\n")
+            # The reply streams in as it is generated; Ctrl-C cuts it short
+            # and returns to the prompt with the conversation intact.
+            conversation_id, inputs = begin_turn(client, user_input)
+            print("Agent: ", end="", flush=True)
+            result = get_llm(client).converse_stream(
+                inputs,
+                agent_id=agent_id,
+                conversation_id=conversation_id,
+                label="chat",
+                store=True,
+            )
+            print("\n")
+            end_turn(result.conversation_id, agent_id, user_input, result.text, result.usage, "chat")
 
         except Exception as e:
             print(f"⚠️ Error during chat: {e}")
 
-def main(device_type):
-    mistral_client = get_mistral_client()
-
-    agent_id = load_agent_id()
-
-    # Check if the loaded agent ID is valid
-    if agent_id and is_valid_agent_id(mistral_client, agent_id):
-        print(f"✅ Loaded valid agent ID: {agent_id}")
-    else:
-        print("No saved agent ID found or existing agent ID is invalid. Creating a new network architect agent...")
-        agent_id = create_network_architect_agent(mistral_client)
-        if agent_id:
-            save_agent_id(agent_id)
-        else:
-            print("❌ Could not create agent; aborting.")
-            return
-
-    latest_yaml = get_latest_yaml(device_type)
+def ensure_agent(mistral_client):
+    # Validated against the API at most once per AGENT_VALIDATE_TTL, not on every call.
+    previous_id = load_agent_id()
+    agent_id = get_agent_registry().get_agent_id(
+        mistral_client, "network_architect", NETWORK_ARCHITECT_AGENT, legacy_id=previous_id
+    )
+    if agent_id and agent_id != previous_id:
+        save_agent_id(agent_id)
+        # The saved conversation belongs to the old agent; carry its memory over instead.
+        conversation_id = load_conversation_id()
+        if previous_id and conversation_id:
+            print("🗜️ Agent changed; the next turn starts a new conversation seeded with the memory digest.")
+            try:
+                get_memory().rollover(mistral_client, conversation_id)
+            except Exception as e:
+                print(f"⚠️ Could not build the memory digest: {e}")
+            clear_conversation_id()
+    return agent_id
+
+
+# --- Collaboration Step ---
+# Called in-process by mistral.py's pipeline (interactive=False, digest=True:
+# the team message joins one digest per run) and from the command line
+# (interactive=True, which ends in the chat loop).
+def collaborate(device_type, mistral_client=None, report_path=None, interactive=False, digest=False):
+    mistral_client = mistral_client or get_llm().client
+
+    agent_id = ensure_agent(mistral_client)
+    if not agent_id:
+        print("❌ Could not create agent; aborting.")
+        return False
+
+    latest_yaml = report_path or get_latest_yaml(device_type)
     if not latest_yaml:
         print(f"❌ No YAML files found for {device_type}")
-        return
+        return False
 
     yaml_filename = os.path.basename(latest_yaml)
     chat_link = os.getenv("LE_CHAT_URL")
     summary, timestamp, device_type_loaded = load_summary_from_yaml(latest_yaml)
 
-    critical_issue_found = is_critical(summary)
-
-    send_agent_update(mistral_client, agent_id, summary, device_type_loaded, timestamp)
+    # Findings from the local rule engine (preanalysis.py) saved with the report.
+    findings, findings_alerted = load_findings(latest_yaml)
+    rule_critical = [f for f in findings if f.get("severity") == "critical"]
+    critical_issue_found = bool(rule_critical) or is_critical(summary)
+
+    send_agent_update(
+        mistral_client,
+        agent_id,
+        summary or "No AI summary is available for this scan (the analysis call failed); the raw outputs were saved.",
+        device_type_loaded,
+        timestamp,
+    )
 
     short_issue = (
         "⚠️ Critical issue detected — Alexander has been notified directly."
@@ -244,17 +327,21 @@ def main(device_type):
 💬 [Open La Chat]({chat_link})
 """
 
-    send_webex_message(WEBEX_SPACE, team_msg, is_room=True)
+    if digest:
+        get_notifier().add_to_digest(
+            WEBEX_SPACE,
+            f"✅ **Network Analysis Completed**\n💬 [Open La Chat]({chat_link})",
+            f"- `{device_type_loaded}` at `{timestamp}`: {short_issue} 📁 `output/{device_type_loaded}/{yaml_filename}`",
+        )
+    else:
+        send_webex_message(WEBEX_SPACE, team_msg, is_room=True)
 
     if critical_issue_found:
-        summary_tail = summary[-2000:]
-        matching_lines = [
-            line.strip()
-            for line in summary_tail.splitlines()
-            if any(keyword in line.upper() for keyword in SEVERITY_KEYWORDS)
-        ]
+        matching_lines = SEVERITY_SCANNER.matching_lines(summary, limit=5)
+        rule_lines = [f"[{f['severity'].upper()}] {f['device']}: {f['detail']}" for f in rule_critical]
         context_excerpt = (
-            "\n".join(matching_lines[:5]) if matching_lines else "Critical indicators found in summary tail."
+            "\n".join((rule_lines + matching_lines)[:5]) if rule_lines or matching_lines
+            else "Critical indicators found in summary."
         )
         critical_msg = f"""🚨 **Critical Network Issue Detected**
 A major issue was found during the analysis of `{device_type_loaded}` devices at `{timestamp}`.
@@ -263,22 +350,28 @@ A major issue was found during the analysis of `{device_type_loaded}` devices at
 🗂 **Report**: `output/{device_type_loaded}/{yaml_filename}`
 💬 [Discuss in La Chat]({chat_link})
 """
-        send_webex_message(ALEXANDER_WEBEX_ID, critical_msg)
-        print("📨 Notifications sent.")
+        # Rule findings were already alerted on straight after collection;
+        # only page again if the LLM summary itself reads as critical.
+        if is_critical(summary) or not findings_alerted:
+            send_webex_message(
+                ALEXANDER_WEBEX_ID, critical_msg, dedup_key=f"critical|{device_type_loaded}|{context_excerpt}"
+            )
+        print("📨 Notifications queued.")
 
     # Start interactive chat session
-    interactive_chat(mistral_client, agent_id)
+    if interactive:
+        interactive_chat(mistral_client, agent_id)
+    return True
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) != 2:
-        print("Usage: python analyze_and_collab.py <device_type>")
-    else:
-        main(sys.argv[1])
+
+def main(device_type):
+    start_tracing("collab")
+    collaborate(device_type, interactive=True)
+    flush_notifications()
+    write_trace()
 
 if __name__ == "__main__":
     import sys
-    if len(sys.argv) != 2:
-        print("Usage: python analyze_and_collab.py <device_type>")
-    else:
-        main(sys.argv[1])
\ No newline at end of file
+    from cli import main as cli_main
+
+    cli_main(["collab", *sys.argv[1:]])
\ No newline at end of file
@@ -0,0 +1,168 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+NOW = "2026-01-01T00:00:00Z"
+
+
+def _reply(prompt_chars, words):
+    return f"Stand-in analysis of a {prompt_chars}-character prompt. " + " ".join(
+        random.choice(["interface", "CRITICAL", "stable", "vlan", "memory", "ok", "down", "uplink"]) for _ in range(words)
+    )
+
+
+def _agent(agent_id, body=None):
+    body = body or {}
+    return {
+        "object": "agent", "id": agent_id, "version": 1, "created_at": NOW, "updated_at": NOW,
+        "model": body.get("model", "pixtral-12b-2409"), "name": body.get("name", "Stand-in Agent"),
+        "instructions": body.get("instructions"), "description": body.get("description"),
+    }
+
+
+# --- Stand-in API ---
+# Enough of the Mistral chat/agents/conversations endpoints (plus the Webex
+# messages endpoint) for the SDK to parse responses, with configurable
+# latency and a configurable share of 429s carrying Retry-After.
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.2
+    error_rate = 0.0
+    reply_words = 200
+    stats = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, route):
+        with self.lock:
+            self.stats[route] = self.stats.get(route, 0) + 1
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _events(self, events):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for name, payload in events:
+            prefix = f"event: {name}\n" if name else ""
+            self.wfile.write(f"{prefix}data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+        if not events or not events[0][0]:
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.lock:
+                return self._json(200, dict(self.stats))
+        match = re.fullmatch(r"/v1/agents/([^/]+)", self.path)
+        if match:
+            self._count("agents.get")
+            return self._json(200, _agent(match.group(1)))
+        self._json(404, {"message": "not found"})
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/v1/messages":
+            self._count("webex.messages")
+            return self._json(200, {"id": uuid.uuid4().hex})
+
+        if self.error_rate and random.random() < self.error_rate:
+            self._count("rate_limited")
+            return self._json(429, {"message": "rate limited"}, {"Retry-After": "0.1"})
+        time.sleep(self.latency)
+        prompt_chars = len(json.dumps(body))
+        usage = {"prompt_tokens": prompt_chars // 3, "completion_tokens": self.reply_words, "total_tokens": prompt_chars // 3 + self.reply_words}
+        text = _reply(prompt_chars, self.reply_words)
+
+        if self.path == "/v1/chat/completions":
+            self._count("chat.stream" if body.get("stream") else "chat.complete")
+            if body.get("stream"):
+                words = text.split(" ")
+                chunks = [
+                    (None, {"id": "c", "object": "chat.completion.chunk", "created": 0, "model": body.get("model"),
+                            "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]})
+                    for word in words
+                ]
+                chunks[-1][1]["usage"] = usage
+                return self._events(chunks)
+            return self._json(200, {
+                "id": uuid.uuid4().hex, "object": "chat.completion", "created": 0, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        if self.path == "/v1/agents":
+            self._count("agents.create")
+            return self._json(200, _agent("ag_" + uuid.uuid4().hex[:12], body))
+
+        match = re.fullmatch(r"/v1/conversations(?:/([^/]+))?", self.path)
+        if match:
+            conversation_id = match.group(1) or "conv_" + uuid.uuid4().hex[:12]
+            self._count(f"conversations.{'append' if match.group(1) else 'start'}{'.stream' if body.get('stream') else ''}")
+            if body.get("stream"):
+                events = [("conversation.response.started",
+                           {"type": "conversation.response.started", "conversation_id": conversation_id, "created_at": NOW})]
+                events += [("message.output.delta",
+                            {"type": "message.output.delta", "id": "m", "content": word + " ", "output_index": 0,
+                             "content_index": 0, "created_at": NOW, "role": "assistant"})
+                           for word in text.split(" ")]
+                events.append(("conversation.response.done",
+                               {"type": "conversation.response.done", "usage": usage, "created_at": NOW}))
+                return self._events(events)
+            return self._json(200, {
+                "object": "conversation.response", "conversation_id": conversation_id,
+                "outputs": [{"object": "entry", "type": "message.output", "role": "assistant", "content": text,
+                             "id": uuid.uuid4().hex, "created_at": NOW, "completed_at": NOW}],
+                "usage": usage,
+            })
+
+        self._json(404, {"message": "not found"})
+
+
+def serve(host="127.0.0.1", port=0, latency=0.2, error_rate=0.0, reply_words=200):
+    handler = type("Handler", (StandinHandler,), {
+        "latency": latency, "error_rate": error_rate, "reply_words": reply_words, "stats": {},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mistral-standin", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Mistral (and Webex) HTTP APIs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429")
+    parser.add_argument("--reply-words", type=int, default=200)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, latency=args.latency_ms / 1000, error_rate=args.error_rate, reply_words=args.reply_words)
+    print(f"ready {server.server_address[1]}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,270 @@
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.jsonl")
+PHASES = ["collect", "aggregate", "analyze", "save", "collaborate"]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _raise_fd_limit():
+    # One SSH transport per device; 1000 devices outgrow the usual 1024 soft limit.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+# --- Worker: one fleet size, one fresh process ---
+# Runs in a scratch working directory so reports, caches, indexes and the
+# agent registry start empty, and in its own process so peak RSS belongs to
+# this fleet size alone. Prints one JSON line with the per-phase results.
+def run_worker(devices, ssh_port, device_type, shards=0):
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    from ssh_standin import inventory
+    from collector import collect_fleet, load_collection_settings
+    from mistral import collect_device_info, aggregate_device_info, plan_analysis, run_analysis, save_output
+    from analyze_and_collab import collaborate, flush_notifications
+    from preanalysis import run_rules
+    from mistral_auth import get_mistral_client
+    from ssh_pool import get_ssh_pool
+    from llm_client import get_llm
+    from sharding import ShardCoordinator, load_shard_settings
+
+    _raise_fd_limit()
+    fleet = inventory(devices, ssh_port, device_type)
+    results = []
+
+    def record(phase, wall, samples, extra=None):
+        results.append({
+            "phase": phase,
+            "wall_s": wall,
+            "items_per_s": devices / wall if wall else 0.0,
+            "p50_ms": _percentile(samples, 50) * 1000,
+            "p99_ms": _percentile(samples, 99) * 1000,
+            "samples": len(samples),
+            "peak_rss_mb": _peak_rss_mb(),
+            **(extra or {}),
+        })
+
+    def llm_latencies(since):
+        return [call["latency"] for call in get_llm().calls[since:]]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        if shards:
+            coordinator = ShardCoordinator({**load_shard_settings(), "workers": shards}).start()
+            coordinator.submit(device_type, fleet)
+            outputs, timing = coordinator.collect(device_type)
+            coordinator.close()
+        else:
+            fleet_outputs, timing = collect_fleet(
+                {device_type: fleet}, collect_fn=collect_device_info, **load_collection_settings()
+            )
+            outputs = fleet_outputs[device_type]
+        failed = sum(1 for entry in timing["devices"] if entry["status"] != "ok")
+        record("collect", time.perf_counter() - started,
+               [entry["seconds"] for entry in timing["devices"]], {"failed": failed})
+
+        started = time.perf_counter()
+        samples = []
+        for name, device_outputs in outputs.items():
+            device_started = time.perf_counter()
+            aggregate_device_info({name: device_outputs}, device_type)
+            samples.append(time.perf_counter() - device_started)
+        findings = run_rules(device_type, outputs, None)
+        plan = plan_analysis(device_type, outputs, findings=findings)
+        record("aggregate", time.perf_counter() - started, samples, {"findings": len(findings)})
+
+        mistral_client = get_mistral_client()
+        since = len(get_llm().calls)
+        started = time.perf_counter()
+        summary = run_analysis(mistral_client, device_type, plan)
+        record("analyze", time.perf_counter() - started, llm_latencies(since),
+               {"llm_calls": len(get_llm().calls) - since, "failed": int(summary is None)})
+
+        started = time.perf_counter()
+        report_path = save_output(device_type, outputs, summary, plan["metadata"])
+        wall = time.perf_counter() - started
+        record("save", wall, [wall], {"report_bytes": os.path.getsize(report_path)})
+
+        since = len(get_llm().calls)
+        started = time.perf_counter()
+        ok = collaborate(device_type, mistral_client, report_path, interactive=False, digest=True)
+        flush_notifications()
+        record("collaborate", time.perf_counter() - started, llm_latencies(since),
+               {"llm_calls": len(get_llm().calls) - since, "failed": int(not ok)})
+
+        get_ssh_pool().close_all()
+
+    print(json.dumps({"devices": devices, "phases": results}))
+
+
+# --- Driver ---
+def _start_standin(script, *args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, script), "--port", "0", *args],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline().split()
+    if not line or line[0] != "ready":
+        process.kill()
+        raise RuntimeError(f"{script} did not start")
+    return process, int(line[1])
+
+
+def _fetch_stats(api_url):
+    import urllib.request
+
+    with urllib.request.urlopen(f"{api_url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def _settings_key(settings):
+    # Runs are only compared with runs made with the same settings; the list
+    # of sizes does not matter, since each run is keyed by its own size.
+    return json.dumps({key: value for key, value in (settings or {}).items() if key != "sizes"}, sort_keys=True)
+
+
+def _previous_runs(path):
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                run = json.loads(line)
+                settings = _settings_key(run.get("settings"))
+                for phase in run["phases"]:
+                    previous[(settings, run["devices"], phase["phase"])] = phase
+    return previous
+
+
+def print_table(runs, previous, settings):
+    settings = _settings_key(settings)
+    print(f"\n{'devices':>7}  {'phase':<12}{'wall_s':>9}{'items/s':>10}{'p50_ms':>10}{'p99_ms':>10}{'rss_mb':>9}  vs last")
+    for run in runs:
+        for phase in run["phases"]:
+            before = previous.get((settings, run["devices"], phase["phase"]))
+            change = (
+                f"{(phase['wall_s'] / before['wall_s'] - 1) * 100:+.0f}%"
+                if before and before["wall_s"] else "-"
+            )
+            print(
+                f"{run['devices']:>7}  {phase['phase']:<12}{phase['wall_s']:>9.2f}{phase['items_per_s']:>10.1f}"
+                f"{phase['p50_ms']:>10.1f}{phase['p99_ms']:>10.1f}{phase['peak_rss_mb']:>9.1f}  {change}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local SSH and Mistral stand-ins.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--device-type", default="nxos")
+    parser.add_argument("--ssh-latency-ms", type=float, default=20)
+    parser.add_argument("--ssh-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output-scale", type=float, default=1.0, help="Multiplier for canned output size")
+    parser.add_argument("--api-latency-ms", type=float, default=200)
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="Share of Mistral calls answered with 429")
+    parser.add_argument("--max-workers", type=int, default=None, help="COLLECT_MAX_WORKERS for the run")
+    parser.add_argument("--shards", type=int, default=0, help="Collect through this many shard worker processes")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON lines file the runs are appended to")
+    parser.add_argument("--no-record", action="store_true", help="Print the table without appending to --results")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ssh-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.ssh_port, args.device_type, args.shards)
+        return
+
+    _raise_fd_limit()
+    ssh, ssh_port = _start_standin(
+        "ssh_standin.py", "--devices", str(max(args.sizes)), "--latency-ms", str(args.ssh_latency_ms),
+        "--failure-rate", str(args.ssh_failure_rate), "--scale", str(args.output_scale),
+    )
+    api, api_port = _start_standin(
+        "mistral_standin.py", "--latency-ms", str(args.api_latency_ms), "--error-rate", str(args.api_error_rate),
+    )
+    api_url = f"http://127.0.0.1:{api_port}"
+    env = {
+        **os.environ,
+        "MISTRAL_API_KEY": "bench",
+        "MISTRAL_SERVER_URL": api_url,
+        "MISTRAL_CACHE": "off",
+        "MISTRAL_RPM": "100000",
+        "MISTRAL_TPM": "1000000000",
+        "WEBEX_API_URL": f"{api_url}/v1",
+        "WEBEX_BOT_TOKEN": "bench",
+        "WEBEX_SPACE": "bench-space",
+        "ALEXANDER_WEBEX_ID": "bench-person",
+        "LE_CHAT_URL": "http://localhost/chat",
+    }
+    if args.max_workers:
+        env["COLLECT_MAX_WORKERS"] = str(args.max_workers)
+
+    runs = []
+    try:
+        for size in args.sizes:
+            print(f"⏱️ Benchmarking {size} devices...")
+            with tempfile.TemporaryDirectory(prefix="mistral-bench-") as workdir:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+                     "--ssh-port", str(ssh_port), "--device-type", args.device_type, "--shards", str(args.shards)],
+                    cwd=workdir, env=env, capture_output=True, text=True,
+                )
+            if completed.returncode != 0:
+                print(f"❌ Run with {size} devices failed:\n{completed.stderr[-2000:]}")
+                continue
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        api_calls = _fetch_stats(api_url)
+    finally:
+        ssh.terminate()
+        api.terminate()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("worker", "ssh_port", "results", "no_record")}
+    previous = _previous_runs(args.results)
+    print_table(runs, previous, settings)
+    print(f"\n📊 Stand-in API calls: {json.dumps(api_calls, sort_keys=True)}")
+
+    if runs and not args.no_record:
+        with open(args.results, "a") as f:
+            for run in runs:
+                f.write(json.dumps({
+                    "at": datetime.now().isoformat(timespec="seconds"),
+                    "revision": _git_revision(),
+                    "settings": settings,
+                    **run,
+                }) + "\n")
+        print(f"💾 Results appended to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import random
+import socket
+import threading
+import time
+
+import paramiko
+
+
+# --- Canned Cisco Output ---
+# Roughly NX-OS shaped so the parsers, rule checks and metric extraction do
+# real work; `scale` multiplies the number of interfaces and log lines.
+def canned_outputs(device_index, scale=1.0):
+    interfaces = max(1, int(48 * scale))
+    log_lines = max(1, int(500 * scale))
+    rng = random.Random(device_index)
+
+    interface_blocks = []
+    for port in range(1, interfaces + 1):
+        up = rng.random() > 0.1
+        interface_blocks.append(
+            f"Ethernet1/{port} is {'up' if up else 'down'}{'' if up else ' (Link not connected)'}\n"
+            f"  Description: {'uplink' if port <= 2 else f'server-{port}'}\n"
+            f"  MTU 9216 bytes, BW 10000000 Kbit, DLY 10 usec\n"
+            f"  full-duplex, 10 Gb/s\n"
+            f"  30 seconds input rate {rng.randint(0, 10 ** 9)} bits/sec, {rng.randint(0, 10 ** 5)} packets/sec\n"
+            f"  30 seconds output rate {rng.randint(0, 10 ** 9)} bits/sec, {rng.randint(0, 10 ** 5)} packets/sec\n"
+            f"  {rng.randint(0, 5)} input error  0 short frame  0 overrun   0 underrun  0 ignored\n"
+            f"  {rng.randint(0, 3)} CRC  0 no buffer\n"
+            f"  0 output error  0 collision  0 deferred  0 late collision\n"
+            f"  {rng.randint(0, 4)} interface resets\n"
+        )
+    facilities = ["%ETHPORT-5-IF_UP", "%ETHPORT-5-IF_DOWN_LINK_FAILURE", "%VSHD-5-VSHD_SYSLOG_CONFIG_I", "%AUTHPRIV-6-SYSTEMMSG"]
+    logging = "\n".join(
+        f"2026 Jan  1 00:{line // 60 % 60:02d}:{line % 60:02d} bench-{device_index:04d} "
+        f"{rng.choice(facilities)}: Interface Ethernet1/{rng.randint(1, interfaces)} event {line}"
+        for line in range(log_lines)
+    )
+    used = rng.randint(40, 97)
+    memory = f"Memory usage:   16000000K total,   {160000 * used}K used,   {160000 * (100 - used)}K free\n"
+    outputs = {
+        "show vrf": "VRF-Name                           VRF-ID State   Reason\n"
+                    "default                                 1 Up      --\n"
+                    "management                              2 Up      --\n",
+        "show vlan": "VLAN Name                             Status    Ports\n"
+                     "---- -------------------------------- --------- -------------------------------\n"
+                     + "".join(f"{vlan:<4} VLAN{vlan:04d}                         active    Eth1/{vlan % interfaces + 1}\n"
+                               for vlan in range(1, 21)),
+        "show memory": memory,
+        "show version": f"Cisco Nexus Operating System (NX-OS) Software\nNXOS: version 10.3(2)\nDevice name: bench-{device_index:04d}\n",
+        "show system uptime": f"System start time:          Thu Jan  1 00:00:00 2026\nSystem uptime:              {device_index} days, 0 hours\n",
+        "show interface": "".join(interface_blocks),
+        "show logging": logging + "\n",
+    }
+    # Platform spellings used by the default command plans.
+    outputs["show system resources"] = outputs["show memory statistics"] = memory
+    outputs["show logging last 500"] = "\n".join(logging.split("\n")[-500:]) + "\n"
+    return outputs
+
+
+# --- Stand-in Device Farm ---
+# One listening port emulates many devices: the SSH username picks the
+# device (dev0000, dev0001, ...), so the client-side pool keys every device
+# separately and opens one Transport per device, as against real gear.
+class DeviceFarm:
+    def __init__(self, devices, latency=0.02, jitter=0.5, failure_rate=0.0, scale=1.0, seed=1):
+        self.devices = devices
+        self.latency = latency
+        self.jitter = jitter
+        self.scale = scale
+        rng = random.Random(seed)
+        self.failing = {index for index in range(devices) if rng.random() < failure_rate}
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._outputs = {}
+        self._lock = threading.Lock()
+        self.stats = {"connections": 0, "commands": 0, "auth_failures": 0}
+
+    def outputs_for(self, index):
+        with self._lock:
+            if index not in self._outputs:
+                self._outputs[index] = canned_outputs(index, self.scale)
+            return self._outputs[index]
+
+    def _server(self):
+        farm = self
+
+        class Server(paramiko.ServerInterface):
+            def __init__(self):
+                self.device = None
+
+            def get_allowed_auths(self, username):
+                return "password"
+
+            def check_auth_password(self, username, password):
+                index = int(username[3:]) if username.startswith("dev") and username[3:].isdigit() else -1
+                if not 0 <= index < farm.devices or index in farm.failing:
+                    farm.stats["auth_failures"] += 1
+                    return paramiko.AUTH_FAILED
+                self.device = index
+                return paramiko.AUTH_SUCCESSFUL
+
+            def check_channel_request(self, kind, chanid):
+                return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+            def check_channel_exec_request(self, channel, command):
+                threading.Thread(target=farm._run, args=(channel, self.device, command.decode()), daemon=True).start()
+                return True
+
+            def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+                return True
+
+            def check_channel_shell_request(self, channel):
+                threading.Thread(target=farm._shell, args=(channel, self.device), daemon=True).start()
+                return True
+
+        return Server()
+
+    def _delay(self):
+        time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _output(self, device, command):
+        command = command.strip()
+        if command.startswith("echo "):
+            return command[5:] + "\n"
+        self.stats["commands"] += 1
+        return self.outputs_for(device).get(command, "% Invalid command\n")
+
+    def _run(self, channel, device, command):
+        # NX-OS style: one exec request may chain commands with " ; ".
+        try:
+            self._delay()
+            channel.sendall("".join(self._output(device, part) for part in command.split(" ; ")).encode())
+            channel.send_exit_status(0)
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+    def _shell(self, channel, device):
+        # IOS style: echoes typed lines after the prompt, ignores `!` comments.
+        prompt = f"bench-{device:04d}#"
+        buffer = ""
+        try:
+            channel.sendall(f"\r\n{prompt}".encode())
+            while True:
+                data = channel.recv(4096)
+                if not data:
+                    return
+                buffer += data.decode()
+                while "\n" in buffer:
+                    line, buffer = buffer.split("\n", 1)
+                    line = line.strip()
+                    channel.sendall(f"{line}\r\n".encode())
+                    if line == "exit":
+                        return
+                    if line and not line.startswith("!") and not line.startswith("terminal "):
+                        self._delay()
+                        channel.sendall(self._output(device, line).replace("\n", "\r\n").encode())
+                    channel.sendall(prompt.encode())
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+    def _handle(self, sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=self._server())
+        except Exception:
+            transport.close()
+
+    def serve(self, host="127.0.0.1", port=0):
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(1024)
+
+        def accept_loop():
+            while True:
+                sock, _ = listener.accept()
+                self.stats["connections"] += 1
+                threading.Thread(target=self._handle, args=(sock,), daemon=True).start()
+
+        threading.Thread(target=accept_loop, name="ssh-standin", daemon=True).start()
+        return listener.getsockname()[1]
+
+
+def inventory(devices, port, device_type="nxos", host="127.0.0.1"):
+    return [
+        {
+            "name": f"bench-{index:04d}",
+            "ip": host,
+            "port": port,
+            "username": f"dev{index:04d}",
+            "password": "bench",
+            "device_type": device_type,
+        }
+        for index in range(devices)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SSH server emulating N Cisco devices.")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean delay before each command's output")
+    parser.add_argument("--jitter", type=float, default=0.5, help="+/- fraction applied to the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of devices that reject login")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for interfaces and log lines")
+    args = parser.parse_args()
+
+    farm = DeviceFarm(args.devices, args.latency_ms / 1000, args.jitter, args.failure_rate, args.scale)
+    port = farm.serve(port=args.port)
+    print(f"ready {port}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
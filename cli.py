@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+
+
+# --- Subcommands ---
+# Each handler imports its module only when it runs: `cli.py --help` loads
+# nothing but argparse, `troubleshoot` and `collab` never load paramiko, and
+# the Mistral SDK is imported only once a client is actually created.
+def run_collect(args):
+    from mistral import main
+
+    main(args)
+
+
+def run_analyze(args):
+    from mistral import analyze_saved
+
+    analyze_saved(args)
+
+
+def run_collab(args):
+    from analyze_and_collab import main
+
+    main(args.device_type)
+
+
+def run_troubleshoot(args):
+    from troubleshoot import main
+
+    main(args)
+
+
+def run_daemon(args):
+    from daemon import main
+
+    main(args)
+
+
+def _add_common(parser, trace_help):
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the Mistral API instead of reusing cached responses.",
+    )
+    if trace_help:
+        parser.add_argument("--trace", action="store_true", help=trace_help)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="AI-powered network analysis for Cisco devices.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    collect = subparsers.add_parser("collect", help="Collect from every device, analyze, report and notify (mistral.py)")
+    collect.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only send outputs that changed since the previous report for each device type.",
+    )
+    collect.add_argument(
+        "--sharded",
+        action="store_true",
+        help="Spread collection over SHARD_WORKERS worker processes (and any remote workers) by consistent hashing.",
+    )
+    _add_common(collect, "Record timing spans and write a trace file to output/traces/ (same as TRACE=on).")
+    collect.set_defaults(handler=run_collect)
+
+    analyze = subparsers.add_parser("analyze", help="Re-analyze the latest saved outputs without connecting to devices")
+    analyze.add_argument("device_types", nargs="*", help="Device types to re-analyze (default: all in devices.yaml)")
+    analyze.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only send outputs that changed since the report before the latest one.",
+    )
+    analyze.add_argument("--no-collab", action="store_true", help="Skip the agent update and Webex messages.")
+    _add_common(analyze, "Record timing spans and write a trace file to output/traces/ (same as TRACE=on).")
+    analyze.set_defaults(handler=run_analyze)
+
+    collab = subparsers.add_parser("collab", help="Chat with the network architect agent about the latest report")
+    collab.add_argument("device_type", help="Device type whose latest report is discussed (e.g. nxos)")
+    _add_common(collab, "Record timing spans and write a trace file to output/traces/ (same as TRACE=on).")
+    collab.set_defaults(handler=run_collab)
+
+    troubleshoot = subparsers.add_parser("troubleshoot", help="Ad hoc troubleshooting of saved device outputs")
+    _add_common(troubleshoot, None)
+    troubleshoot.set_defaults(handler=run_troubleshoot)
+
+    daemon = subparsers.add_parser("daemon", help="Poll devices continuously and analyze them periodically")
+    daemon.add_argument("--devices", help="Inventory file (re-read when it changes)")
+    _add_common(daemon, "Record timing spans; a trace file is written per analysis cycle.")
+    daemon.set_defaults(handler=run_daemon)
+    return parser
+
+
+# --- Main Execution ---
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if args.no_cache:
+        os.environ["MISTRAL_CACHE"] = "off"
+    if getattr(args, "trace", False):
+        os.environ["TRACE"] = "on"
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,176 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_DEVICE_DEADLINE = 60
+
+
+# --- Collection Settings (overridable from .env) ---
+def load_collection_settings():
+    type_limits = {}
+    for item in os.getenv("COLLECT_TYPE_LIMITS", "").split(","):
+        if "=" in item:
+            device_type, limit = item.split("=", 1)
+            type_limits[device_type.strip()] = int(limit)
+    return {
+        "max_workers": int(os.getenv("COLLECT_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        "type_limits": type_limits,
+        "device_deadline": float(os.getenv("COLLECT_DEVICE_DEADLINE", DEFAULT_DEVICE_DEADLINE)),
+    }
+
+
+def _interleave(devices_by_type):
+    # Round-robin across device types so a large family does not monopolise
+    # the pool while its per-type cap leaves workers waiting.
+    queues = [
+        [(device_type, index, device) for index, device in enumerate(device_list)]
+        for device_type, device_list in devices_by_type.items()
+    ]
+    while any(queues):
+        for queue in queues:
+            if queue:
+                yield queue.pop(0)
+
+
+# --- Concurrent Fleet Collection ---
+def collect_fleet(
+    devices_by_type,
+    collect_fn=None,
+    max_workers=DEFAULT_MAX_WORKERS,
+    type_limits=None,
+    device_deadline=DEFAULT_DEVICE_DEADLINE,
+):
+    if collect_fn is None:
+        from mistral import collect_device_info as collect_fn
+
+    type_limits = type_limits or {}
+    semaphores = {
+        device_type: threading.Semaphore(type_limits[device_type])
+        for device_type in devices_by_type
+        if type_limits.get(device_type)
+    }
+    slots = {
+        device_type: [None] * len(device_list)
+        for device_type, device_list in devices_by_type.items()
+    }
+    timings = []
+    # When each device actually started (after waiting for its type's slot),
+    # so failures and timeouts are timed from there too.
+    started_at = {}
+
+    def run(device_type, index, device):
+        semaphore = semaphores.get(device_type)
+        if semaphore:
+            semaphore.acquire()
+        try:
+            started = started_at[device_type, index] = time.monotonic()
+            outputs = collect_fn(device, deadline=started + device_deadline)
+            return outputs, started, time.monotonic()
+        finally:
+            if semaphore:
+                semaphore.release()
+
+    wall_start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    futures = {}
+    for device_type, index, device in _interleave(devices_by_type):
+        # Each device runs in a copy of the caller's context so its trace spans nest under the caller's.
+        futures[executor.submit(contextvars.copy_context().run, run, device_type, index, device)] = (
+            device_type, index, device
+        )
+
+    # Deadlines are enforced inside collect_fn; the outer wait only guards
+    # against a device that hangs past its budget (e.g. a stuck read).
+    waves = max(
+        [-(-len(futures) // max(1, max_workers))]
+        + [-(-len(devices_by_type[t]) // type_limits[t]) for t in semaphores]
+    )
+    hard_limit = wall_start + device_deadline * (waves + 1) + 5
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=max(0, hard_limit - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            device_type, index, device = futures[future]
+            try:
+                outputs, started, finished = future.result()
+                status = "ok" if not _all_failed(outputs) else "failed"
+                seconds = finished - started
+            except Exception as e:
+                outputs = _failed_outputs(device, f"Collection failed: {str(e)}")
+                status = "error"
+                seconds = time.monotonic() - started_at.get((device_type, index), wall_start)
+            slots[device_type][index] = (device["name"], outputs)
+            timings.append({
+                "device_type": device_type,
+                "device": device["name"],
+                "seconds": seconds,
+                "status": status,
+            })
+
+    for future in pending:
+        device_type, index, device = futures[future]
+        slots[device_type][index] = (device["name"], _failed_outputs(device, "Timed out"))
+        timings.append({
+            "device_type": device_type,
+            "device": device["name"],
+            "seconds": time.monotonic() - started_at.get((device_type, index), wall_start),
+            "status": "timeout",
+        })
+    executor.shutdown(wait=not pending, cancel_futures=True)
+
+    # Re-assemble in inventory order so reports and prompts stay stable run to run.
+    results = {
+        device_type: {name: outputs for name, outputs in device_slots}
+        for device_type, device_slots in slots.items()
+    }
+    return results, {"wall_seconds": time.monotonic() - wall_start, "devices": timings}
+
+
+def _failed_outputs(device, status):
+    # Keyed by command like collect_device_info's own failures, so rules and
+    # reports see a device that failed rather than an "error" command.
+    from command_plans import plan_for
+
+    return {key: status for key in plan_for(device).keys}
+
+
+def _all_failed(outputs):
+    from command_plans import is_usable
+
+    return not any(is_usable(output) for output in outputs.values())
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# --- Timing Report ---
+def print_timing_report(timing, slowest=5):
+    devices = timing["devices"]
+    seconds = [entry["seconds"] for entry in devices]
+    wall = timing["wall_seconds"]
+    statuses = {}
+    for entry in devices:
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+
+    print("\n⏱️ Collection timing:")
+    print(f"   Devices: {len(devices)} ({', '.join(f'{k}={v}' for k, v in sorted(statuses.items()))})")
+    print(f"   Wall clock: {wall:.2f}s  |  Sum of device time: {sum(seconds):.2f}s")
+    if wall > 0 and devices:
+        print(f"   Throughput: {len(devices) / wall:.2f} devices/s  |  Speed-up vs serial: {sum(seconds) / wall:.1f}x")
+    print(
+        f"   Per device: p50={_percentile(seconds, 50):.2f}s  "
+        f"p95={_percentile(seconds, 95):.2f}s  max={max(seconds, default=0):.2f}s"
+    )
+    for entry in sorted(devices, key=lambda e: e["seconds"], reverse=True)[:slowest]:
+        print(f"   🐢 {entry['device']} ({entry['device_type']}): {entry['seconds']:.2f}s [{entry['status']}]")
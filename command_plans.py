@@ -0,0 +1,348 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import yaml
+
+from stream_reader import cap_text
+
+
+PLANS_FILE = os.path.join("source_of_truth", "command_plans.yaml")
+RUN_LOG_PATH = os.path.join("cache", "command_runs.json")
+FAILED_OUTPUTS = ("Unable to connect", "Timed out")
+FAILED_PREFIXES = ("Error:", "Skipped:", "Collection failed:")
+
+# --- Default Plans ---
+# Each command entry:
+#   command       what is sent to the device
+#   key           name the output is stored under (defaults to `command`), so
+#                 parsers, rules and reports see the same keys on every platform
+#   cadence       minimum seconds between runs; in between, the previous
+#                 output is carried forward. Omitted: run every time (or, with
+#                 when_changed, only when triggered)
+#   max_bytes / tail_lines   output caps (see stream_reader.py)
+#   depends_on    key that must succeed first; skipped if it failed
+#   when_changed  key (or {command: key, match: regex}) whose output, when it
+#                 changed since the previous scan, triggers this command
+# A plan's `batch` picks how due commands share one round trip: "exec" joins
+# them into one exec request with `separator`, "shell" types them into one
+# interactive session; `delimiter` is a no-op command whose echo splits the
+# combined output. Plans in source_of_truth/command_plans.yaml replace the
+# default plan of the same name; a device picks one with `command_plan:`,
+# otherwise its device_type, otherwise "default".
+DEFAULT_COMMANDS = [
+    {"command": "show vrf", "cadence": 3600},
+    {"command": "show vlan", "cadence": 3600},
+    {"command": "show memory", "cadence": 300},
+    {"command": "show version", "cadence": 86400},
+    {"command": "show interface", "cadence": 300},
+    {"command": "show logging", "cadence": 60, "tail_lines": 500},
+]
+
+DEFAULT_PLANS = {
+    "default": {"commands": DEFAULT_COMMANDS},
+    "nxos": {
+        "batch": "exec",
+        "separator": " ; ",
+        "delimiter": "echo {marker}",
+        "commands": [
+            {"command": "show vrf", "cadence": 3600},
+            {"command": "show vlan", "cadence": 3600},
+            # `show memory` is not an NX-OS command; system resources has the totals.
+            {"command": "show system resources", "key": "show memory", "cadence": 300},
+            {"command": "show system uptime", "cadence": 300},
+            # Only re-read after a reload (the start time moves).
+            {"command": "show version", "when_changed": {"command": "show system uptime", "match": r"System start time:.*"}},
+            {"command": "show interface", "cadence": 300},
+            # Let the switch trim the log instead of transferring all of it.
+            {"command": "show logging last 500", "key": "show logging", "cadence": 60, "tail_lines": 500},
+        ],
+    },
+    "iosxe": {
+        "batch": "shell",
+        "setup": ["terminal length 0", "terminal width 0"],
+        "delimiter": "!{marker}",
+        "commands": [
+            {"command": "show vrf", "cadence": 3600},
+            {"command": "show vlan", "cadence": 3600},
+            # Plain `show memory` dumps every block; the statistics have the pool totals.
+            {"command": "show memory statistics", "key": "show memory", "cadence": 300},
+            {"command": "show version", "cadence": 86400},
+            {"command": "show interface", "cadence": 300},
+            {"command": "show logging", "cadence": 60, "tail_lines": 500},
+        ],
+    },
+}
+
+
+def is_usable(output):
+    return isinstance(output, str) and output not in FAILED_OUTPUTS and not output.startswith(FAILED_PREFIXES)
+
+
+class CommandSpec:
+    __slots__ = ("command", "key", "cadence", "max_bytes", "tail_lines", "depends_on", "when_changed", "match")
+
+    def __init__(self, command, key=None, cadence=None, max_bytes=None, tail_lines=None, depends_on=None, when_changed=None):
+        self.command = command
+        self.key = key or command
+        self.cadence = float(cadence) if cadence else None
+        self.max_bytes = max_bytes
+        self.tail_lines = tail_lines
+        self.depends_on = depends_on
+        self.match = None
+        if isinstance(when_changed, dict):
+            self.match = re.compile(when_changed["match"]) if when_changed.get("match") else None
+            when_changed = when_changed["command"]
+        self.when_changed = when_changed
+
+
+
+# --- Command Plan ---
+class CommandPlan:
+    def __init__(self, name, commands, batch=None, separator=" ; ", delimiter=None, setup=None):
+        self.name = name
+        self.specs = {}
+        for entry in commands:
+            spec = CommandSpec(**entry) if isinstance(entry, dict) else CommandSpec(entry)
+            self.specs[spec.key] = spec
+        self.keys = list(self.specs)
+        self.batch = batch if batch in ("exec", "shell") and delimiter else None
+        self.separator = separator
+        self.delimiter = delimiter
+        self.setup = setup or []
+
+    def order(self, key):
+        return self.keys.index(key) if key in self.specs else len(self.keys)
+
+    def read_options(self, device, key):
+        spec = self.specs[key]
+        options = {}
+        if spec.tail_lines:
+            options["tail_lines"] = spec.tail_lines
+        max_bytes = spec.max_bytes or os.getenv("OUTPUT_MAX_BYTES")
+        if max_bytes and "tail_lines" not in options:
+            options["max_bytes"] = int(max_bytes)
+        spill_dir = os.getenv("OUTPUT_SPILL_DIR")
+        if spill_dir:
+            filename = key.replace(" ", "_") + ".txt"
+            options["spill_path"] = os.path.join(spill_dir, device.get("name", device["ip"]), filename)
+        return options
+
+    def due(self, last_runs, previous, now=None):
+        # Commands to run unconditionally; when_changed commands that have a
+        # usable previous output are left to run_plan's triggers.
+        now = now or time.time()
+        due = []
+        for key, spec in self.specs.items():
+            last_run = last_runs.get(key)
+            if not is_usable(previous.get(key)):
+                due.append(key)
+            elif spec.cadence:
+                if last_run is None or now - last_run >= spec.cadence:
+                    due.append(key)
+            elif not spec.when_changed:
+                due.append(key)
+        return due
+
+
+def _changed(spec, before, after):
+    if spec.match:
+        before = spec.match.search(before or "")
+        after = spec.match.search(after or "")
+        before, after = before and before.group(0), after and after.group(0)
+    return before != after
+
+
+# --- Running a Plan ---
+# Commands run in waves: a wave holds every pending command whose
+# dependencies are settled, and each wave is one round trip when the plan
+# batches. Without dependencies everything due goes out in a single wave.
+def run_plan(pool, device, plan, due, previous=None, timeout=3, deadline=None):
+    previous = previous or {}
+    due = set(due)
+    pending = [
+        key for key in plan.keys
+        if key in due
+        or plan.specs[key].when_changed in due
+        or (plan.specs[key].when_changed and not is_usable(previous.get(key)))
+    ]
+    # A when_changed command only waits for its trigger when it might be skipped.
+    unconditional = {key for key in pending if key in due or not is_usable(previous.get(key))}
+    waits_for = {
+        key: [
+            dep for dep in (plan.specs[key].depends_on, None if key in unconditional else plan.specs[key].when_changed)
+            if dep and dep != key
+        ]
+        for key in pending
+    }
+    outputs = {}
+    while pending:
+        ready = [
+            key for key in pending if not any(dep in pending for dep in waits_for[key])
+        ] or list(pending)  # a dependency cycle: run the rest as they are
+        pending = [key for key in pending if key not in ready]
+
+        wave = []
+        for key in ready:
+            spec = plan.specs[key]
+            if spec.depends_on in outputs and not is_usable(outputs[spec.depends_on]):
+                outputs[key] = f"Skipped: {spec.depends_on} failed"
+            elif key in unconditional:
+                wave.append(key)
+            elif spec.when_changed in outputs and _changed(
+                spec, previous.get(spec.when_changed), outputs[spec.when_changed]
+            ):
+                print(f"🔁 {spec.when_changed} changed on {device.get('name', device['ip'])}; re-running {spec.command}")
+                wave.append(key)
+        if not wave:
+            continue
+
+        remaining = deadline - time.monotonic() if deadline else timeout
+        if remaining <= 0:
+            outputs.update(dict.fromkeys(wave, "Timed out"))
+            continue
+        outputs.update(run_commands(pool, device, plan, wave, timeout=min(timeout, remaining)))
+    return outputs
+
+
+def run_commands(pool, device, plan, keys, timeout=3):
+    outputs = {}
+    if plan.batch and len(keys) > 1:
+        print(f"🔌 Running {len(keys)} commands in one {plan.batch} round trip: {', '.join(plan.specs[key].command for key in keys)}")
+        try:
+            outputs = _run_batch(pool, device, plan, keys, timeout)
+        except Exception as e:
+            print(f"⚠️ Batched run failed on {device.get('name', device['ip'])} ({e}); running commands one by one")
+        missing = [key for key in keys if key not in outputs]
+        if outputs and missing:
+            print(f"⚠️ Could not split output for {', '.join(missing)}; running them one by one")
+        keys = missing
+
+    for key in keys:
+        command = plan.specs[key].command
+        print(f"🔌 Running command: {command}")
+        try:
+            outputs[key] = pool.run_command(device, command, timeout=timeout, **plan.read_options(device, key))
+        except Exception as e:
+            outputs[key] = f"Error: {str(e)}"
+    return outputs
+
+
+def _run_batch(pool, device, plan, keys, timeout):
+    token = uuid.uuid4().hex[:12]
+    marker = lambda label: plan.delimiter.format(marker=f"__m4c_{token}_{label}__")
+    if plan.batch == "exec":
+        parts = []
+        for index, key in enumerate(keys):
+            parts += [plan.specs[key].command, marker(index)]
+        raw = pool.run_command(device, plan.separator.join(parts), timeout=timeout)
+    else:
+        lines = list(plan.setup) + [marker("start")]
+        for index, key in enumerate(keys):
+            lines += [plan.specs[key].command, marker(index)]
+        raw = pool.run_shell(device, lines + ["exit"], timeout=timeout)
+
+    # Every line carrying a marker ends the output of the command before it.
+    pieces = re.split(rf"^.*__m4c_{token}_(\w+)__.*$\n?", raw.replace("\r", ""), flags=re.MULTILINE)
+    segments = dict(zip(pieces[1::2], pieces[0::2]))
+    outputs = {}
+    for index, key in enumerate(keys):
+        text = segments.get(str(index))
+        if text is None:
+            continue
+        if plan.batch == "shell":
+            # The shell echoes each typed command after the prompt.
+            first, _, rest = text.partition("\n")
+            text = rest if first.rstrip().endswith(plan.specs[key].command) else text
+        outputs[key] = cap_text(text, **plan.read_options(device, key))
+    return outputs
+
+
+# --- Loading Plans ---
+_plans = None
+_plans_mtime = None
+_plans_lock = threading.Lock()
+
+
+def _build_plans(overrides):
+    definitions = dict(DEFAULT_PLANS)
+    definitions.update(overrides or {})
+    return {name: CommandPlan(name, **definition) for name, definition in definitions.items()}
+
+
+def load_command_plans(path=PLANS_FILE):
+    # Re-read whenever the file changes, so the daemon picks up edits.
+    global _plans, _plans_mtime
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        mtime = None
+    with _plans_lock:
+        if _plans is None or mtime != _plans_mtime:
+            overrides = {}
+            if mtime is not None:
+                try:
+                    with open(path) as f:
+                        overrides = (yaml.safe_load(f) or {}).get("plans") or {}
+                    plans = _build_plans(overrides)
+                except Exception as e:
+                    print(f"⚠️ Could not load command plans from {path}: {e}")
+                    plans = _plans or _build_plans({})
+            else:
+                plans = _build_plans({})
+            _plans, _plans_mtime = plans, mtime
+        return _plans
+
+
+def plan_for(device):
+    plans = load_command_plans()
+    for name in (device.get("command_plan"), device.get("device_type")):
+        if name in plans:
+            return plans[name]
+    return plans["default"]
+
+
+# --- Run Log (cadence between one-shot runs) ---
+class CommandRunLog:
+    def __init__(self, path=RUN_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.runs = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.runs = {}
+
+    def last_runs(self, device_name):
+        with self._lock:
+            return dict(self.runs.get(device_name, {}))
+
+    def mark(self, device_name, keys, at=None):
+        at = at or time.time()
+        with self._lock:
+            self.runs.setdefault(device_name, {}).update(dict.fromkeys(keys, at))
+
+    def merge(self, runs_by_device):
+        # Replaces whole devices' entries, e.g. with the runs a shard worker reports.
+        with self._lock:
+            self.runs.update({name: dict(runs) for name, runs in runs_by_device.items()})
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.runs, f)
+            os.replace(self.path + ".tmp", self.path)
+
+
+_run_log = None
+
+
+def get_run_log():
+    global _run_log
+    if _run_log is None:
+        _run_log = CommandRunLog()
+    return _run_log
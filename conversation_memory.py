@@ -0,0 +1,233 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from prompt_packing import context_token_budget, estimate_tokens
+
+
+MEMORY_PATH = os.path.join("output", "conversations.sqlite")
+DEFAULT_MAX_TOKENS = 24000
+DEFAULT_MAX_TURNS = 60
+DEFAULT_MAX_AGE_DAYS = 7
+DIGEST_MAX_TOKENS = 1200
+
+DIGEST_PROMPT = """You maintain the long-term memory of a network operations assistant. Below is the previous memory digest (if any) followed by the most recent conversation turns between the team and the assistant about Cisco network scans.
+
+Write an updated digest, at most about 600 words, with these sections:
+
+*   Open issues: unresolved problems, with affected devices and since when
+*   Per-device state: one line per device worth remembering (role, known quirks, recent changes)
+*   Recent decisions and actions: what the team decided or changed, and pending follow-ups
+*   Resolved: issues closed since the previous digest (one line each, then drop them next time)
+
+Keep concrete names, interfaces, timestamps and numbers. Drop greetings and anything already resolved before the previous digest."""
+
+_lock = threading.Lock()
+
+
+def _limits():
+    return {
+        "max_tokens": int(os.getenv("CONVERSATION_MAX_TOKENS", DEFAULT_MAX_TOKENS)),
+        "max_turns": int(os.getenv("CONVERSATION_MAX_TURNS", DEFAULT_MAX_TURNS)),
+        "max_age": float(os.getenv("CONVERSATION_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS)) * 86400,
+    }
+
+
+# --- Conversation Memory ---
+# Tracks how large the agent conversation has grown (from the usage the API
+# reports, or estimated from the turns) and rolls it over before it gets
+# slow and expensive: the old conversation is summarised into a digest,
+# archived here with its ID, and the next turn starts a fresh conversation
+# seeded with that digest.
+class ConversationMemory:
+    def __init__(self, path=MEMORY_PATH):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                db.execute(
+                    """CREATE TABLE IF NOT EXISTS conversations (
+                        conversation_id TEXT PRIMARY KEY,
+                        agent_id TEXT,
+                        started_at REAL NOT NULL,
+                        ended_at REAL,
+                        turns INTEGER NOT NULL DEFAULT 0,
+                        context_tokens INTEGER NOT NULL DEFAULT 0,
+                        digest TEXT
+                    )"""
+                )
+                db.execute(
+                    """CREATE TABLE IF NOT EXISTS turns (
+                        id INTEGER PRIMARY KEY,
+                        conversation_id TEXT NOT NULL,
+                        at REAL NOT NULL,
+                        label TEXT,
+                        inputs TEXT,
+                        reply TEXT
+                    )"""
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS turns_by_conversation ON turns (conversation_id, at)")
+                yield db
+        finally:
+            db.close()
+
+    def record_turn(self, conversation_id, agent_id, inputs, reply, usage=None, label=None):
+        now = time.time()
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        with _lock, self._connect() as db:
+            db.execute(
+                "INSERT OR IGNORE INTO conversations (conversation_id, agent_id, started_at) VALUES (?, ?, ?)",
+                (conversation_id, agent_id, now),
+            )
+            if prompt_tokens is not None:
+                # The prompt of the latest turn already includes the whole history.
+                context_tokens = prompt_tokens + (completion_tokens or 0)
+                db.execute(
+                    "UPDATE conversations SET turns = turns + 1, context_tokens = ? WHERE conversation_id = ?",
+                    (context_tokens, conversation_id),
+                )
+            else:
+                db.execute(
+                    "UPDATE conversations SET turns = turns + 1, context_tokens = context_tokens + ? "
+                    "WHERE conversation_id = ?",
+                    (estimate_tokens(inputs or "") + estimate_tokens(reply or ""), conversation_id),
+                )
+            db.execute(
+                "INSERT INTO turns (conversation_id, at, label, inputs, reply) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, now, label, inputs, reply),
+            )
+
+    def stats(self, conversation_id):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT started_at, ended_at, turns, context_tokens FROM conversations WHERE conversation_id = ?",
+                (conversation_id,),
+            ).fetchone()
+        if not row:
+            return None
+        return {"started_at": row[0], "ended_at": row[1], "turns": row[2], "context_tokens": row[3]}
+
+    def rollover_reason(self, conversation_id):
+        stats = self.stats(conversation_id)
+        if not stats:
+            return None
+        limits = _limits()
+        if stats["context_tokens"] >= limits["max_tokens"]:
+            return f"{stats['context_tokens']} context tokens"
+        if stats["turns"] >= limits["max_turns"]:
+            return f"{stats['turns']} turns"
+        if time.time() - stats["started_at"] >= limits["max_age"]:
+            return f"older than {limits['max_age'] / 86400:g} days"
+        return None
+
+    def latest_digest(self):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT digest FROM conversations WHERE digest IS NOT NULL ORDER BY ended_at DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def _recent_turns(self, conversation_id, budget):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT at, label, inputs, reply FROM turns WHERE conversation_id = ? ORDER BY at DESC",
+                (conversation_id,),
+            ).fetchall()
+        # Newest first until the budget is used, then back into chronological order.
+        turns, used = [], 0
+        for at, label, inputs, reply in rows:
+            text = f"[{datetime.fromtimestamp(at):%Y-%m-%d %H:%M}] {label or 'turn'}\nTeam: {inputs}\nAssistant: {reply or ''}"
+            tokens = estimate_tokens(text)
+            if used + tokens > budget:
+                break
+            turns.append(text)
+            used += tokens
+        return list(reversed(turns))
+
+    def build_digest(self, client, conversation_id):
+        from llm_client import get_llm
+
+        previous = self.latest_digest() or "(none)"
+        budget = context_token_budget() - DIGEST_MAX_TOKENS - estimate_tokens(DIGEST_PROMPT + previous)
+        turns = self._recent_turns(conversation_id, budget)
+        prompt = (
+            f"{DIGEST_PROMPT}\n\n### Previous digest ###\n{previous}\n\n### Recent turns ###\n"
+            + "\n\n".join(turns)
+        )
+        return get_llm(client).chat(
+            [{"role": "user", "content": prompt}],
+            max_tokens=DIGEST_MAX_TOKENS,
+            label="conversation digest",
+            bypass_cache=True,
+        )
+
+    def rollover(self, client, conversation_id):
+        digest = self.build_digest(client, conversation_id)
+        with _lock, self._connect() as db:
+            db.execute(
+                "UPDATE conversations SET ended_at = ?, digest = ? WHERE conversation_id = ?",
+                (time.time(), digest, conversation_id),
+            )
+        return digest
+
+    def history(self, limit=20):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT conversation_id, started_at, ended_at, turns, context_tokens, digest FROM conversations "
+                "ORDER BY started_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "conversation_id": row[0],
+                "started_at": row[1],
+                "ended_at": row[2],
+                "turns": row[3],
+                "context_tokens": row[4],
+                "digest": row[5],
+            }
+            for row in rows
+        ]
+
+
+def seed_inputs(digest, inputs):
+    return (
+        "Context carried over from earlier conversations (memory digest):\n"
+        f"{digest}\n\n---\n\n{inputs}"
+    )
+
+
+_default_memory = None
+
+
+def get_memory():
+    global _default_memory
+    if _default_memory is None:
+        _default_memory = ConversationMemory()
+    return _default_memory
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the agent conversation memory.")
+    parser.add_argument("action", choices=["history", "digest"])
+    parser.add_argument("-n", type=int, default=20)
+    args = parser.parse_args()
+
+    memory = get_memory()
+    if args.action == "history":
+        for row in memory.history(args.n):
+            started = datetime.fromtimestamp(row["started_at"]).strftime("%Y-%m-%d %H:%M")
+            ended = datetime.fromtimestamp(row["ended_at"]).strftime("%Y-%m-%d %H:%M") if row["ended_at"] else "active"
+            print(f"{row['conversation_id']}  {started} -> {ended}  {row['turns']} turns  ~{row['context_tokens']} tokens")
+    else:
+        print(memory.latest_digest() or "No digest yet.")
@@ -0,0 +1,395 @@
+import heapq
+import json
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+from dotenv import load_dotenv
+
+from mistral import build_stages, group_devices_by_type
+from command_plans import is_usable, plan_for, run_plan
+from mistral_auth import get_mistral_client
+from analyze_and_collab import flush_notifications
+from pipeline import Pipeline
+from ssh_pool import get_ssh_pool
+from response_cache import print_cache_stats
+from llm_client import get_llm
+from tracing import span, get_tracer, prometheus_label, start_tracing, write_trace
+
+load_dotenv()
+
+
+DEVICES_FILE = "source_of_truth/devices.yaml"
+
+# Seconds between polls of each command come from the cadences in the
+# device's command plan (command_plans.py). Override them with POLL_INTERVALS
+# ("show logging=60,show version=86400") or per device with a
+# `poll_intervals:` mapping in devices.yaml.
+def _env_intervals():
+    intervals = {}
+    for item in os.getenv("POLL_INTERVALS", "").split(","):
+        if "=" in item:
+            command, seconds = item.split("=", 1)
+            intervals[command.strip()] = float(seconds)
+    return intervals
+
+
+def load_daemon_settings():
+    return {
+        "intervals": _env_intervals(),
+        "jitter": float(os.getenv("POLL_JITTER", 0.1)),
+        "splay": float(os.getenv("POLL_SPLAY", 30)),
+        "workers": int(os.getenv("COLLECT_MAX_WORKERS", 32)),
+        "command_timeout": float(os.getenv("POLL_COMMAND_TIMEOUT", 10)),
+        "analysis_interval": float(os.getenv("ANALYSIS_INTERVAL", 900)),
+        "incremental": os.getenv("DAEMON_INCREMENTAL", "on").lower() not in ("0", "off", "false", "no"),
+        "http_addr": os.getenv("DAEMON_HTTP_ADDR", "127.0.0.1:8765"),
+    }
+
+
+class DeviceState:
+    __slots__ = (
+        "outputs", "output_times", "pending", "in_flight",
+        "last_attempt", "last_success", "last_error", "consecutive_failures", "polls",
+    )
+
+    def __init__(self):
+        self.outputs = {}
+        self.output_times = {}
+        self.pending = set()
+        self.in_flight = False
+        self.last_attempt = None
+        self.last_success = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.polls = 0
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="seconds") if ts else None
+
+
+# --- Collector Daemon ---
+# Loads the inventory once (re-reading it only when the file changes), keeps
+# SSH sessions and the Mistral client warm, and polls each device/command on
+# its own jittered schedule. Due commands of one device are run together on
+# its pooled session; analysis runs periodically on the latest outputs.
+class CollectorDaemon:
+    def __init__(self, devices_file=DEVICES_FILE, settings=None, mistral_client=None):
+        self.devices_file = devices_file
+        self.settings = settings or load_daemon_settings()
+        self.mistral_client = mistral_client
+        self.devices = {}
+        self.states = {}
+        self.generations = {}
+        self._schedule = []
+        self._seq = 0
+        self._devices_mtime = None
+        self._queued_jobs = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, self.settings["workers"]), thread_name_prefix="poll")
+        self._analysis_thread = None
+        self._last_analysis = None
+        self.started = time.time()
+
+    # --- Inventory ---
+    def intervals_for(self, device):
+        # Commands without a cadence (when_changed ones) are not scheduled;
+        # run_plan triggers them when the output they watch changes.
+        intervals = {key: spec.cadence for key, spec in plan_for(device).specs.items() if spec.cadence}
+        intervals.update(self.settings["intervals"])
+        intervals.update(device.get("poll_intervals") or {})
+        return {command: float(seconds) for command, seconds in intervals.items() if seconds}
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.devices_file).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self._devices_mtime:
+            return False
+        try:
+            with open(self.devices_file) as f:
+                devices = {device["name"]: device for device in yaml.safe_load(f)["devices"]}
+        except Exception as e:
+            print(f"⚠️ Could not reload {self.devices_file}: {e}")
+            return False
+        self._devices_mtime = mtime
+
+        pool = get_ssh_pool()
+        with self._lock:
+            added = [name for name in devices if name not in self.devices]
+            removed = [name for name in self.devices if name not in devices]
+            changed = [name for name in devices if name in self.devices and devices[name] != self.devices[name]]
+            for name in removed + changed:
+                pool.evict(self.devices[name])
+            for name in removed:
+                self.states.pop(name, None)
+                self.generations.pop(name, None)
+            self.devices = devices
+            for name in added + changed:
+                self.states.setdefault(name, DeviceState())
+                self.generations[name] = self.generations.get(name, 0) + 1
+                for command, interval in self.intervals_for(devices[name]).items():
+                    # Spread first polls over the splay window instead of
+                    # logging in to every device at once.
+                    self._push(time.monotonic() + random.uniform(0, min(interval, self.settings["splay"])), name, command)
+        print(
+            f"📒 Inventory loaded from {self.devices_file}: {len(devices)} devices "
+            f"(+{len(added)} -{len(removed)} ~{len(changed)})"
+        )
+        return True
+
+    # --- Scheduling ---
+    def _push(self, due, name, command):
+        self._seq += 1
+        heapq.heappush(self._schedule, (due, self._seq, name, command, self.generations[name]))
+
+    def _next_due(self, interval):
+        jitter = self.settings["jitter"]
+        return time.monotonic() + interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def _dispatch_due(self):
+        now = time.monotonic()
+        jobs = []
+        with self._lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                _, _, name, command, generation = heapq.heappop(self._schedule)
+                if self.generations.get(name) != generation:
+                    continue  # device removed or redefined since this was scheduled
+                interval = self.intervals_for(self.devices[name]).get(command)
+                if interval:
+                    self._push(self._next_due(interval), name, command)
+                self.states[name].pending.add(command)
+            for name, state in self.states.items():
+                if state.pending and not state.in_flight:
+                    commands = sorted(state.pending, key=plan_for(self.devices[name]).order)
+                    state.pending.clear()
+                    state.in_flight = True
+                    self._queued_jobs += 1
+                    jobs.append((name, self.devices[name], commands))
+        for name, device, commands in jobs:
+            self._executor.submit(self._poll, name, device, commands)
+
+    def _poll(self, name, device, commands):
+        with self._lock:
+            self._queued_jobs -= 1
+            state = self.states.get(name)
+        if state is None:
+            return
+        pool = get_ssh_pool()
+        timeout = self.settings["command_timeout"]
+        results = {}
+        error = None
+        started = time.time()
+        with self._lock:
+            previous = dict(state.outputs)
+        with span("poll.device", device=name, commands=len(commands)) as poll_span:
+            try:
+                if not pool.is_reachable(device, timeout=timeout):
+                    error = "Unable to connect"
+                    results = {command: "Unable to connect" for command in commands}
+                else:
+                    # Due commands go out in one round trip where the plan batches.
+                    results = run_plan(pool, device, plan_for(device), commands, previous, timeout)
+                    unusable = [command for command, output in results.items() if not is_usable(output)]
+                    if unusable:
+                        error = f"{unusable[0]}: {results[unusable[0]]}"
+            finally:
+                with self._lock:
+                    state.in_flight = False
+                    state.polls += 1
+                    state.last_attempt = started
+                    state.outputs.update(results)
+                    state.output_times.update(dict.fromkeys(results, time.time()))
+                    state.last_error = error
+                    failed = bool(results) and not any(is_usable(output) for output in results.values())
+                    if failed:
+                        state.consecutive_failures += 1
+                    else:
+                        state.last_success = time.time()
+                        state.consecutive_failures = 0
+            if error:
+                poll_span.fail(error)
+
+    # --- Periodic Analysis ---
+    def _analysis_items(self):
+        with self._lock:
+            devices = [self.devices[name] for name in self.devices if self.states[name].outputs]
+            snapshot = {name: dict(self.states[name].outputs) for name in self.devices if self.states[name].outputs}
+        items = []
+        for device_type, device_list in group_devices_by_type(devices).items():
+            outputs = {
+                device["name"]: {
+                    command: snapshot[device["name"]][command]
+                    # Plan order, so reports and prompts look the same as one-shot runs.
+                    for command in sorted(snapshot[device["name"]], key=plan_for(device).order)
+                }
+                for device in device_list
+            }
+            items.append({"device_type": device_type, "devices": device_list, "outputs": outputs})
+        return items
+
+    def _run_analysis(self):
+        items = self._analysis_items()
+        if not items:
+            return
+        if self.mistral_client is None:
+            self.mistral_client = get_mistral_client()
+        # The collect stage is replaced by the scheduler; outputs come in ready-made.
+        stages = build_stages(self.mistral_client, self.settings["incremental"])[1:]
+        pipeline = Pipeline(stages)
+        pipeline.run(items)
+        pipeline.print_stage_report()
+        flush_notifications()
+        write_trace()
+
+    def _maybe_analyze(self):
+        interval = self.settings["analysis_interval"]
+        if interval <= 0 or (self._analysis_thread and self._analysis_thread.is_alive()):
+            return
+        now = time.monotonic()
+        # The first cycle waits one full interval so every schedule has polled once.
+        if self._last_analysis is None:
+            self._last_analysis = now
+            return
+        if now - self._last_analysis < interval:
+            return
+        self._last_analysis = now
+        self._analysis_thread = threading.Thread(target=self._run_analysis, name="analysis", daemon=True)
+        self._analysis_thread.start()
+
+    # --- Health and Metrics ---
+    def health(self):
+        now = time.time()
+        with self._lock:
+            devices = {
+                name: {
+                    "last_success": _iso(state.last_success),
+                    "last_attempt": _iso(state.last_attempt),
+                    "seconds_since_success": round(now - state.last_success, 1) if state.last_success else None,
+                    "consecutive_failures": state.consecutive_failures,
+                    "last_error": state.last_error,
+                    "polls": state.polls,
+                    "pending_commands": sorted(state.pending),
+                    "in_flight": state.in_flight,
+                }
+                for name, state in self.states.items()
+            }
+            queue_depth = self._queued_jobs + sum(1 for state in self.states.values() if state.pending)
+            scheduled = len(self._schedule)
+        failing = sorted(name for name, device in devices.items() if device["consecutive_failures"] >= 3)
+        return {
+            "status": "degraded" if failing else "ok",
+            "uptime_seconds": round(now - self.started, 1),
+            "queue_depth": queue_depth,
+            "scheduled_polls": scheduled,
+            "ssh_sessions": len(get_ssh_pool()),
+            "analysis_running": bool(self._analysis_thread and self._analysis_thread.is_alive()),
+            "failing_devices": failing,
+            "devices": devices,
+        }
+
+    def metrics(self):
+        health = self.health()
+        lines = [
+            "# TYPE collector_uptime_seconds gauge",
+            f"collector_uptime_seconds {health['uptime_seconds']}",
+            "# TYPE collector_queue_depth gauge",
+            f"collector_queue_depth {health['queue_depth']}",
+            "# TYPE collector_ssh_sessions gauge",
+            f"collector_ssh_sessions {health['ssh_sessions']}",
+            "# TYPE collector_device_last_success_timestamp_seconds gauge",
+            "# TYPE collector_device_consecutive_failures gauge",
+            "# TYPE collector_device_polls_total counter",
+        ]
+        with self._lock:
+            states = list(self.states.items())
+        for name, state in states:
+            label = prometheus_label("device", name)
+            lines.append(f"collector_device_last_success_timestamp_seconds{{{label}}} {state.last_success or 0}")
+            lines.append(f"collector_device_consecutive_failures{{{label}}} {state.consecutive_failures}")
+            lines.append(f"collector_device_polls_total{{{label}}} {state.polls}")
+        tracer = get_tracer()
+        return "\n".join(lines) + "\n" + (tracer.prometheus_text() if tracer else "")
+
+    def serve_http(self):
+        host, _, port = self.settings["http_addr"].rpartition(":")
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/health"):
+                    body, content_type = json.dumps(daemon.health(), indent=2), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, content_type = daemon.metrics(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler)
+        threading.Thread(target=server.serve_forever, name="health-http", daemon=True).start()
+        print(f"🩺 Health on http://{host or '127.0.0.1'}:{server.server_address[1]}/health (metrics at /metrics)")
+        return server
+
+    # --- Main Loop ---
+    def run(self, reload_check=5.0, tick=1.0):
+        server = self.serve_http() if self.settings["http_addr"] else None
+        self.reload_if_changed()
+        last_reload_check = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() - last_reload_check >= reload_check:
+                    self.reload_if_changed()
+                    last_reload_check = time.monotonic()
+                self._dispatch_due()
+                self._maybe_analyze()
+                get_ssh_pool().evict_idle()
+                self._stop.wait(tick)
+        finally:
+            print("🛑 Stopping collector daemon...")
+            if server:
+                server.shutdown()
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            if self._analysis_thread and self._analysis_thread.is_alive():
+                self._analysis_thread.join()
+            get_ssh_pool().close_all()
+            print_cache_stats()
+            get_llm().print_call_stats()
+            write_trace()
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+# `cli.py daemon` lands here (as does `python daemon.py`).
+def main(args):
+    start_tracing("daemon")
+
+    collector = CollectorDaemon(args.devices or DEVICES_FILE)
+    signal.signal(signal.SIGINT, collector.stop)
+    signal.signal(signal.SIGTERM, collector.stop)
+    collector.run()
+
+
+if __name__ == "__main__":
+    import sys
+    from cli import main as cli_main
+
+    cli_main(["daemon", *sys.argv[1:]])
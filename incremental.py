@@ -0,0 +1,132 @@
+import difflib
+import hashlib
+
+from report_index import latest_reports
+from report_store import load_report
+
+
+# Commands whose output only grows between scans; only new lines matter.
+APPEND_ONLY_COMMANDS = {"show logging"}
+
+
+def output_digest(output):
+    return hashlib.sha256(str(output).encode("utf-8", "replace")).hexdigest()
+
+
+def digest_outputs(outputs):
+    return {
+        device: {command: output_digest(output) for command, output in device_outputs.items()}
+        for device, device_outputs in outputs.items()
+    }
+
+
+# --- Previous Snapshot ---
+def load_previous_snapshot(device_type):
+    reports = latest_reports(device_type, 1)
+    if not reports:
+        return None
+    latest = reports[0]["path"]
+    try:
+        return load_report(latest)
+    except Exception as e:
+        print(f"⚠️ Could not load previous snapshot {latest}: {e}")
+        return None
+
+
+# --- Section-Aware Diffs ---
+def _split_sections(text):
+    # Unindented lines start a new block (an interface, a VLAN, a VRF...);
+    # indented lines belong to the block above them.
+    sections = []
+    for line in text.splitlines():
+        if not sections or (line and not line[0].isspace()):
+            sections.append([line])
+        else:
+            sections[-1].append(line)
+    keyed = {}
+    for section in sections:
+        header, occurrence = section[0], 1
+        while header in keyed:
+            occurrence += 1
+            header = f"{section[0]} [{occurrence}]"
+        keyed[header] = section
+    return keyed
+
+
+def _new_lines(previous, current):
+    seen = set(previous.splitlines())
+    return [line for line in current.splitlines() if line not in seen]
+
+
+def diff_output(command, previous, current):
+    if command in APPEND_ONLY_COMMANDS:
+        added = _new_lines(previous, current)
+        return "\n".join(f"+{line}" for line in added)
+
+    previous_sections = _split_sections(previous)
+    current_sections = _split_sections(current)
+    hunks = []
+    for header, lines in current_sections.items():
+        before = previous_sections.get(header)
+        if before == lines:
+            continue
+        if before is None:
+            hunks.append("\n".join(f"+{line}" for line in lines))
+            continue
+        changed = [
+            line for line in difflib.unified_diff(before, lines, lineterm="", n=0)
+            if not line.startswith(("---", "+++", "@@"))
+        ]
+        hunks.append("\n".join([lines[0]] + changed))
+    for header in previous_sections:
+        if header not in current_sections:
+            hunks.append(f"-{header} (removed)")
+    return "\n".join(hunks)
+
+
+# --- Change Detection ---
+def detect_changes(previous_snapshot, current_outputs):
+    previous_outputs = (previous_snapshot or {}).get("outputs") or {}
+    previous_hashes = (previous_snapshot or {}).get("hashes") or digest_outputs(previous_outputs)
+    current_hashes = digest_outputs(current_outputs)
+
+    changes = {}
+    skipped = []
+    for device, device_outputs in current_outputs.items():
+        for command, output in device_outputs.items():
+            if previous_hashes.get(device, {}).get(command) == current_hashes[device][command]:
+                skipped.append(f"{device}: {command}")
+                continue
+            previous = previous_outputs.get(device, {}).get(command)
+            diff = output if previous is None else diff_output(command, str(previous), str(output))
+            if not diff:
+                # e.g. the `show logging` tail window moved but no line is new
+                skipped.append(f"{device}: {command}")
+                continue
+            changes.setdefault(device, {})[command] = diff
+
+    return changes, skipped, current_hashes
+
+
+def aggregate_changes(changes, skipped, device_type, baseline_timestamp):
+    prompt = f"""You are an expert network, automation, platform engineering, and security engineer. Below are only the CHANGES observed on devices of type '{device_type}' since the previous scan at {baseline_timestamp}.
+
+        Lines prefixed with '+' are new or updated, lines prefixed with '-' were removed. Command outputs that did not change are omitted.
+
+        Summarize:
+
+        *   What changed on each device and whether it indicates a problem
+        *   New log messages that need attention
+        *   Interface counter or state changes (errors, flaps, resets)
+        *   Recommended follow-up actions
+
+        Focus on providing actionable recommendations based on your analysis."""
+
+    sections = [prompt]
+    for device_name, device_changes in changes.items():
+        sections.append(f"\n\n### {device_name} ###\n")
+        for command, diff in device_changes.items():
+            sections.append(f"\n\n#### {command} (changes) ####\n{diff}")
+    if skipped:
+        sections.append(f"\n\n### Unchanged since {baseline_timestamp} ###\n" + "\n".join(skipped))
+    return "".join(sections)
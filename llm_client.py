@@ -0,0 +1,471 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from mistral_auth import get_mistral_client
+from prompt_packing import estimate_tokens
+from response_cache import ResponseCache, cache_enabled, get_response_cache
+import tracing
+
+
+DEFAULT_MODEL = "pixtral-12b-2409"
+DEFAULT_RPM = 60
+DEFAULT_TPM = 500000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_MAX_CONCURRENCY = 8
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Writes (creating agents, storing conversation turns) may already have taken
+# effect when these fail, so they are only retried when the server refused the
+# request outright or it never left the client.
+RETRYABLE_WRITE_STATUS = {429, 503}
+
+
+# --- Token-Bucket Rate Limiting ---
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        # Reservation style: the bucket may go negative and the caller sleeps
+        # until it would have refilled, which keeps callers in FIFO order.
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, estimated_tokens):
+        delay = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if delay:
+            await asyncio.sleep(delay)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # Give back (or charge) the difference once real usage is known.
+        if actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+
+# --- Retry Policy ---
+def retry_after_seconds(error):
+    response = getattr(error, "raw_response", None) or getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(error, idempotent=True):
+    import httpx  # already loaded by the SDK by the time anything fails
+
+    if not idempotent:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)):
+            return True
+        return getattr(error, "status_code", None) in RETRYABLE_WRITE_STATUS
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    # Full jitter exponential backoff.
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# --- Streaming Helpers ---
+_STREAM_END = object()
+
+
+class StreamResult:
+    __slots__ = ("parts", "conversation_id", "usage", "first_token", "cancelled")
+
+    def __init__(self):
+        self.parts = []
+        self.conversation_id = None
+        self.usage = None
+        self.first_token = None
+        self.cancelled = False
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+
+def _content_text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(_content_text(chunk) for chunk in content)
+    text = getattr(content, "text", None)
+    return text if isinstance(text, str) else ""
+
+
+def stream_event_parts(event):
+    # Chat completion chunks carry choices[0].delta; conversation events carry
+    # a typed payload (response started/done, message output delta, ...).
+    data = getattr(event, "data", event)
+    choices = getattr(data, "choices", None)
+    if choices:
+        text = _content_text(getattr(choices[0].delta, "content", None))
+    elif getattr(data, "type", None) == "message.output.delta":
+        text = _content_text(getattr(data, "content", None))
+    else:
+        text = ""
+    conversation_id = getattr(data, "conversation_id", None)
+    usage = getattr(data, "usage", None)
+    return text, conversation_id if isinstance(conversation_id, str) else None, usage if usage else None
+
+
+def print_delta(text):
+    print(text, end="", flush=True)
+
+
+# --- Shared Mistral Client Layer ---
+# All LLM traffic (chat completions, agents, conversations) goes through one
+# event loop running on a background thread. Synchronous callers submit work
+# to it, so every caller shares the same rate limiter, concurrency cap, retry
+# policy and call metrics.
+class MistralLLM:
+    def __init__(
+        self,
+        client=None,
+        requests_per_minute=DEFAULT_RPM,
+        tokens_per_minute=DEFAULT_TPM,
+        max_retries=DEFAULT_MAX_RETRIES,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.client = client or get_mistral_client()
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.calls = []
+        self._calls_lock = threading.Lock()
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._semaphore = None
+
+    # --- event loop plumbing ---
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="mistral-llm", daemon=True).start()
+                self._semaphore = asyncio.run_coroutine_threadsafe(
+                    self._make_semaphore(), self._loop
+                ).result()
+            return self._loop
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(tracing.bind(coroutine), self._ensure_loop()).result()
+
+    # --- generic call with limiting, retries and metrics ---
+    async def call_async(self, method, label=None, estimated_tokens=0, idempotent=True, **kwargs):
+        # `method` is a dotted path to one of the SDK's *_async methods,
+        # e.g. "chat.complete_async" or "beta.conversations.append_async".
+        # Pass idempotent=False for writes (see RETRYABLE_WRITE_STATUS).
+        coroutine_fn = self.client
+        for part in method.split("."):
+            coroutine_fn = getattr(coroutine_fn, part)
+
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            await self.limiter.acquire(estimated_tokens)
+            try:
+                async with self._semaphore:
+                    response = await coroutine_fn(**kwargs)
+            except Exception as e:
+                self.limiter.settle(estimated_tokens, 0)
+                if attempt >= self.max_retries or not is_retryable(e, idempotent):
+                    self._record(method, label, started, attempt + 1, None, f"error: {e}")
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                status = getattr(e, "status_code", type(e).__name__)
+                print(f"⏳ Mistral call {label or method} failed ({status}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            usage = getattr(response, "usage", None)
+            total_tokens = getattr(usage, "total_tokens", None)
+            self.limiter.settle(estimated_tokens, total_tokens)
+            self._record(method, label, started, attempt + 1, usage, "ok")
+            return response
+
+    def call(self, method, label=None, estimated_tokens=0, idempotent=True, **kwargs):
+        return self.run(self.call_async(method, label, estimated_tokens, idempotent, **kwargs))
+
+    def _record(self, method, label, started, attempts, usage, status, first_token=None):
+        call = {
+            "method": method,
+            "label": label,
+            "latency": time.monotonic() - started,
+            "first_token": first_token,
+            "attempts": attempts,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "status": status,
+        }
+        with self._calls_lock:
+            self.calls.append(call)
+        tracing.record(
+            "llm.call",
+            started,
+            error=status if status.startswith("error") else None,
+            **{key: value for key, value in call.items() if key not in ("latency", "status") and value is not None},
+        )
+
+    # --- streaming ---
+    # The stream runs on the background loop and hands text deltas to the
+    # calling thread through a queue, so the caller renders them as they
+    # arrive and a Ctrl-C there cancels only the stream, not the process.
+    # Retries only happen before the first delta; after that a failure ends
+    # the stream with whatever text was received.
+    async def stream_async(self, method, result, emit, label=None, estimated_tokens=0, idempotent=True, **kwargs):
+        stream_fn = self.client
+        for part in method.split("."):
+            stream_fn = getattr(stream_fn, part)
+
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            await self.limiter.acquire(estimated_tokens)
+            try:
+                async with self._semaphore:
+                    events = await stream_fn(**kwargs)
+                    async for event in events:
+                        text, conversation_id, usage = stream_event_parts(event)
+                        if conversation_id:
+                            result.conversation_id = conversation_id
+                        if usage is not None:
+                            result.usage = usage
+                        if text:
+                            if result.first_token is None:
+                                result.first_token = time.monotonic() - started
+                            result.parts.append(text)
+                            emit(text)
+            except asyncio.CancelledError:
+                result.cancelled = True
+                self.limiter.settle(estimated_tokens, 0)
+                self._record(method, label, started, attempt + 1, None, "cancelled", result.first_token)
+                raise
+            except Exception as e:
+                self.limiter.settle(estimated_tokens, 0)
+                if result.parts or attempt >= self.max_retries or not is_retryable(e, idempotent):
+                    self._record(method, label, started, attempt + 1, None, f"error: {e}", result.first_token)
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                status = getattr(e, "status_code", type(e).__name__)
+                print(f"⏳ Mistral stream {label or method} failed ({status}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            self.limiter.settle(estimated_tokens, getattr(result.usage, "total_tokens", None))
+            self._record(method, label, started, attempt + 1, result.usage, "ok", result.first_token)
+            return result
+
+    def stream(self, method, on_text=None, label=None, estimated_tokens=0, idempotent=True, **kwargs):
+        on_text = on_text or print_delta
+        result = StreamResult()
+        deltas = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            tracing.bind(self._stream_to_queue(method, result, deltas, label, estimated_tokens, idempotent, **kwargs)),
+            self._ensure_loop(),
+        )
+        try:
+            while True:
+                text = deltas.get()
+                if text is _STREAM_END:
+                    break
+                on_text(text)
+        except KeyboardInterrupt:
+            future.cancel()
+            result.cancelled = True
+            print("\n⏹️ Response cancelled.")
+            return result
+        future.result()
+        return result
+
+    async def _stream_to_queue(self, method, result, deltas, label, estimated_tokens, idempotent, **kwargs):
+        try:
+            return await self.stream_async(method, result, deltas.put, label, estimated_tokens, idempotent, **kwargs)
+        finally:
+            deltas.put(_STREAM_END)
+
+    def chat_stream(self, messages, model=DEFAULT_MODEL, max_tokens=2000, label=None, on_text=None,
+                    bypass_cache=False, **sampling):
+        cache = get_response_cache() if cache_enabled(bypass_cache) else None
+        key = ResponseCache.make_key(model, messages, max_tokens, **sampling) if cache else None
+        if cache:
+            content = cache.get(key)
+            if content is not None:
+                return self._replay_cached(content, label, on_text)
+
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+        result = self.stream(
+            "chat.stream_async",
+            on_text=on_text,
+            label=label,
+            estimated_tokens=prompt_tokens + (max_tokens or 0),
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **sampling,
+        )
+        if cache and not result.cancelled and result.text:
+            cache.put(key, result.text.strip(), model)
+        return result
+
+    def _replay_cached(self, content, label, on_text):
+        print(f"⚡ Using cached Mistral response{f' for {label}' if label else ''}")
+        (on_text or print_delta)(content)
+        result = StreamResult()
+        result.parts.append(content)
+        result.first_token = 0.0
+        return result
+
+    def converse_stream(self, inputs, agent_id=None, conversation_id=None, label=None, on_text=None,
+                        bypass_cache=False, **kwargs):
+        # Continues `conversation_id` when given, otherwise starts a new
+        # conversation with `agent_id`; result.conversation_id has the id to keep.
+        if conversation_id:
+            method, kwargs = "beta.conversations.append_stream_async", dict(kwargs, conversation_id=conversation_id)
+        else:
+            method, kwargs = "beta.conversations.start_stream_async", dict(kwargs, agent_id=agent_id)
+        # Conversations are stored unless store=False, so a retry could add the turn twice.
+        stateless = kwargs.get("store") is False
+        # Only one-shot, unstored turns are cached: a stored conversation has
+        # server-side history the cache key cannot see. The agent id changes
+        # whenever the agent's definition does, so it keys the agent's settings.
+        cache = get_response_cache() if stateless and not conversation_id and cache_enabled(bypass_cache) else None
+        key = ResponseCache.make_key(f"agent:{agent_id}", inputs, **kwargs) if cache else None
+        if cache:
+            content = cache.get(key)
+            if content is not None:
+                return self._replay_cached(content, label, on_text)
+
+        result = self.stream(
+            method, on_text=on_text, label=label, estimated_tokens=estimate_tokens(inputs),
+            idempotent=stateless, inputs=inputs, **kwargs
+        )
+        result.conversation_id = result.conversation_id or conversation_id
+        if cache and not result.cancelled and result.text:
+            cache.put(key, result.text.strip(), f"agent:{agent_id}")
+        return result
+
+    # --- chat completions ---
+    async def chat_async(self, messages, model=DEFAULT_MODEL, max_tokens=2000, label=None, bypass_cache=False, **sampling):
+        cache = get_response_cache() if cache_enabled(bypass_cache) else None
+        key = ResponseCache.make_key(model, messages, max_tokens, **sampling) if cache else None
+        if cache:
+            content = await asyncio.to_thread(cache.get, key)
+            if content is not None:
+                print(f"⚡ Using cached Mistral response{f' for {label}' if label else ''}")
+                return content
+
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+        response = await self.call_async(
+            "chat.complete_async",
+            label=label,
+            estimated_tokens=prompt_tokens + (max_tokens or 0),
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            **sampling,
+        )
+        content = response.choices[0].message.content.strip()
+        if cache:
+            await asyncio.to_thread(cache.put, key, content, model)
+        return content
+
+    def chat(self, messages, **kwargs):
+        return self.run(self.chat_async(messages, **kwargs))
+
+    async def _chat_many(self, requests):
+        return await asyncio.gather(
+            *(self.chat_async(**request) for request in requests), return_exceptions=True
+        )
+
+    def chat_many(self, requests):
+        return self.run(self._chat_many(requests))
+
+    # --- metrics ---
+    def call_stats(self):
+        with self._calls_lock:
+            calls = list(self.calls)
+        latencies = sorted(call["latency"] for call in calls)
+        first_tokens = sorted(call["first_token"] for call in calls if call["first_token"] is not None)
+        return {
+            "calls": len(calls),
+            "failed": sum(1 for call in calls if call["status"].startswith("error")),
+            "retries": sum(call["attempts"] - 1 for call in calls),
+            "prompt_tokens": sum(call["prompt_tokens"] or 0 for call in calls),
+            "completion_tokens": sum(call["completion_tokens"] or 0 for call in calls),
+            "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+            "latency_max": latencies[-1] if latencies else 0.0,
+            "first_token_p50": first_tokens[len(first_tokens) // 2] if first_tokens else None,
+        }
+
+    def print_call_stats(self):
+        stats = self.call_stats()
+        if not stats["calls"]:
+            return
+        print(
+            f"📈 Mistral calls: {stats['calls']} ({stats['failed']} failed, {stats['retries']} retries), "
+            f"tokens in/out {stats['prompt_tokens']}/{stats['completion_tokens']}, "
+            f"latency p50 {stats['latency_p50']:.2f}s max {stats['latency_max']:.2f}s"
+            + (f", first token p50 {stats['first_token_p50']:.2f}s" if stats["first_token_p50"] is not None else "")
+        )
+
+
+_default_llm = None
+_default_llm_lock = threading.Lock()
+
+
+def get_llm(client=None):
+    global _default_llm
+    with _default_llm_lock:
+        if _default_llm is None:
+            _default_llm = MistralLLM(
+                client=client,
+                requests_per_minute=float(os.getenv("MISTRAL_RPM", DEFAULT_RPM)),
+                tokens_per_minute=float(os.getenv("MISTRAL_TPM", DEFAULT_TPM)),
+                max_retries=int(os.getenv("MISTRAL_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                max_concurrency=int(os.getenv("MISTRAL_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+            )
+        return _default_llm
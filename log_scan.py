@@ -0,0 +1,167 @@
+import glob
+import os
+import re
+
+
+SEVERITY_KEYWORDS = [
+    "CRITICAL", "FAILURE", "OUTAGE", "DOWN", "MAJOR ISSUE",
+    "HIGH IMPACT", "DATA LOSS", "UNABLE TO CONNECT", "NOT RESPONSIVE"
+]
+
+
+class ScanMatch:
+    __slots__ = ("pattern", "line_no", "column", "line")
+
+    def __init__(self, pattern, line_no, column, line):
+        self.pattern = pattern
+        self.line_no = line_no
+        self.column = column
+        self.line = line
+
+    def __str__(self):
+        return f"{self.line_no}:{self.column}: [{self.pattern}] {self.line}"
+
+
+# --- Multi-Pattern Scanner ---
+# All patterns are compiled into one alternation (longest first, so "MAJOR
+# ISSUE" wins over a shorter overlapping keyword), and the text is walked
+# once with finditer. Line numbers are tracked incrementally by counting
+# newlines between consecutive matches, so no per-line copies are made.
+class Scanner:
+    def __init__(self, patterns, ignore_case=True, whole_words=True, regex=False):
+        self.patterns = list(patterns)
+        self.ignore_case = ignore_case
+        alternatives = sorted(self.patterns, key=len, reverse=True)
+        if not regex:
+            alternatives = [re.escape(pattern) for pattern in alternatives]
+        body = "|".join(f"(?:{alternative})" for alternative in alternatives)
+        if whole_words:
+            body = rf"(?<!\w)(?:{body})(?!\w)"
+        self.regex = re.compile(body, re.IGNORECASE if ignore_case else 0)
+        # Map matched text back to the pattern that produced it.
+        self._literal = not regex
+        self._by_text = {self._key(pattern): pattern for pattern in self.patterns}
+
+    def _key(self, text):
+        return text.lower() if self.ignore_case else text
+
+    def _pattern_for(self, matched):
+        if self._literal:
+            return self._by_text.get(self._key(matched), matched)
+        for pattern in self.patterns:
+            if re.fullmatch(pattern, matched, re.IGNORECASE if self.ignore_case else 0):
+                return pattern
+        return matched
+
+    def search(self, text):
+        return self.regex.search(text) is not None
+
+    def finditer(self, text):
+        line_no = 1
+        last_pos = 0
+        for match in self.regex.finditer(text):
+            start = match.start()
+            line_no += text.count("\n", last_pos, start)
+            last_pos = start
+            line_start = text.rfind("\n", 0, start) + 1
+            line_end = text.find("\n", start)
+            line = text[line_start:line_end if line_end != -1 else len(text)]
+            yield ScanMatch(self._pattern_for(match.group(0)), line_no, start - line_start + 1, line.strip())
+
+    def counts(self, text):
+        counts = dict.fromkeys(self.patterns, 0)
+        for match in self.regex.finditer(text):
+            pattern = self._pattern_for(match.group(0))
+            counts[pattern] = counts.get(pattern, 0) + 1
+        return counts
+
+    def matching_lines(self, text, limit=None):
+        lines = []
+        last_line = None
+        for match in self.finditer(text):
+            if match.line_no == last_line:
+                continue
+            last_line = match.line_no
+            lines.append(match.line)
+            if limit and len(lines) >= limit:
+                break
+        return lines
+
+
+# Critical detection matches inside words like the original upper-cased
+# substring check did ("FAILURES", "OUTAGES", "SHUTDOWN"); the grep CLI below
+# keeps whole-word matching unless --substring is given.
+SEVERITY_SCANNER = Scanner(SEVERITY_KEYWORDS, whole_words=False)
+
+
+# --- Report History ---
+def scan_reports(scanner, device_type=None, since=None, output_dir="output", include_outputs=True):
+    from report_store import iter_report_records, load_report_header, report_files
+
+    pattern = os.path.join(output_dir, device_type or "*")
+    for device_dir in sorted(glob.glob(pattern)):
+        if not os.path.isdir(device_dir):
+            continue
+        for path in sorted(report_files(device_dir)):
+            if since and os.path.basename(path) < since:
+                continue
+            records = iter_report_records(path) if include_outputs else [load_report_header(path)]
+            for record in records:
+                if record.get("type") == "output":
+                    section, text = f"{record['device']} / {record['command']}", record["output"]
+                else:
+                    section, text = "summary", record.get("summary")
+                if isinstance(text, str):
+                    for match in scanner.finditer(text):
+                        yield path, section, match
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Scan text or saved reports for many keywords in one pass (default: the severity keywords)."
+    )
+    parser.add_argument("files", nargs="*", help="Files to scan; '-' for stdin. Scans output/ history when omitted.")
+    parser.add_argument("-e", "--pattern", action="append", help="Keyword to look for (repeatable)")
+    parser.add_argument("--regex", action="store_true", help="Treat patterns as regular expressions")
+    parser.add_argument("--case-sensitive", action="store_true")
+    parser.add_argument("--substring", action="store_true", help="Also match inside longer words")
+    parser.add_argument("--device-type", help="Only scan reports of this device type")
+    parser.add_argument("--since", help="Only scan reports named at or after this timestamp (YYYY-MM-DD_HH-MM-SS)")
+    parser.add_argument("--summaries-only", action="store_true", help="Skip raw command outputs in reports")
+    parser.add_argument("-c", "--counts", action="store_true", help="Print per-pattern counts only")
+    args = parser.parse_args()
+
+    scanner = Scanner(
+        args.pattern or SEVERITY_KEYWORDS,
+        ignore_case=not args.case_sensitive,
+        whole_words=not args.substring,
+        regex=args.regex,
+    )
+    totals = dict.fromkeys(scanner.patterns, 0)
+
+    def report(source, match):
+        totals[match.pattern] = totals.get(match.pattern, 0) + 1
+        if not args.counts:
+            print(f"{source}:{match}")
+
+    if args.files:
+        for name in args.files:
+            if name == "-":
+                text = sys.stdin.read()
+            else:
+                with open(name, errors="replace") as f:
+                    text = f.read()
+            for match in scanner.finditer(text):
+                report(name, match)
+    else:
+        for path, section, match in scan_reports(
+            scanner, args.device_type, args.since, include_outputs=not args.summaries_only
+        ):
+            report(f"{path} [{section}]", match)
+
+    if args.counts:
+        for pattern, count in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"{count:>8}  {pattern}")
@@ -1,30 +1,34 @@
 import os
+import sys
 import yaml
-import paramiko
 from datetime import datetime
-from mistral_auth import get_mistral_client
+from mistral_auth import require_api_key
+from ssh_pool import get_ssh_pool
+from response_cache import print_cache_stats
+from llm_client import get_llm
+from incremental import load_previous_snapshot, detect_changes, digest_outputs, aggregate_changes
+from prompt_packing import CHARS_PER_TOKEN, estimate_tokens, context_token_budget, pack_devices, pack_texts
+from pipeline import Pipeline
+from parsers import compact_outputs, structured_prompts_enabled
+from report_index import index_document, latest_reports
+from report_store import load_report, write_report
+from analyze_and_collab import collaborate, findings_alert_delivered, flush_notifications, send_findings_alert
+from preanalysis import run_rules, format_findings
+from timeseries import record_scan, trend_context, trends_enabled
+from retrieval import index_report_sections
+from collector import collect_fleet, load_collection_settings, print_timing_report
+from tracing import span, start_tracing, write_trace
+from command_plans import get_run_log, is_usable, plan_for, run_plan
+from sharding import ShardCoordinator
 
 
 # --- SSH Command Execution ---
 def ssh_connect_and_run_command(device_ip, username, password, command, timeout=3):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    device = {"ip": device_ip, "username": username, "password": password}
     try:
-        client.connect(
-            device_ip,
-            username=username,
-            password=password,
-            timeout=timeout,
-            banner_timeout=timeout,
-            auth_timeout=timeout
-        )
-        stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
-        output = stdout.read().decode()
-        return output
+        return get_ssh_pool().run_command(device, command, timeout=timeout)
     except Exception as e:
         return f"Error: {str(e)}"
-    finally:
-        client.close()
 
 
 # --- Load Devices ---
@@ -38,56 +42,54 @@ def load_devices(filename="source_of_truth/devices.yaml"):
 
 
 def test_ssh_connection(device_ip, username, password, timeout=3):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        client.connect(
-            device_ip,
-            username=username,
-            password=password,
-            timeout=timeout,
-            banner_timeout=timeout,
-            auth_timeout=timeout
-        )
-        return True
-    except Exception:
-        return False
-    finally:
-        client.close()
+    device = {"ip": device_ip, "username": username, "password": password}
+    return get_ssh_pool().is_reachable(device, timeout=timeout)
 
 
-# --- Collect Device Info ---
-def collect_device_info(device):
-    commands = [
-        "show vrf",
-        "show vlan",
-        "show memory",
-        "show version",
-        "show interface",
-        "show logging",
-    ]
+def group_devices_by_type(devices):
+    devices_by_type = {}
+    for device in devices:
+        device_type = device.get("device_type", "unknown")
+        if device_type not in devices_by_type:
+            devices_by_type[device_type] = []
+        devices_by_type[device_type].append(device)
+    return devices_by_type
+
 
-    outputs = {}
+# --- Collect Device Info ---
+# What runs on each device comes from its command plan (command_plans.py):
+# commands still within their cadence keep the output from the previous
+# report (`previous`), and due commands are batched into one round trip
+# where the platform allows it.
+def collect_device_info(device, pool=None, deadline=None, timeout=3, previous=None):
+    with span("collect.device", device=device["name"], device_type=device.get("device_type")) as device_span:
+        return _collect_device_info(device, pool or get_ssh_pool(), deadline, timeout, previous or {}, device_span)
+
+
+def _collect_device_info(device, pool, deadline, timeout, previous, device_span):
+    plan = plan_for(device)
+    run_log = get_run_log()
     print(f"\n🔌 Collecting device information for {device['name']} ({device['ip']})...")
-    
-    
-    # 🔍 Test connection first
-    if not test_ssh_connection(device["ip"], device["username"], device["password"]):
+
+    # 🔍 A successful (or reused) pooled connection doubles as the reachability test
+    if not pool.is_reachable(device, timeout=timeout):
         print(f"❌ Unable to connect to {device['name']} ({device['ip']})")
-        return {cmd: "Unable to connect" for cmd in commands}
-    
-    for command in commands:
-        print(f"🔌 Running command: {command}")
-        outputs[command] = ssh_connect_and_run_command(
-            device["ip"], device["username"], device["password"], command
-        )
-    return outputs
+        device_span.fail("unable to connect")
+        return {key: "Unable to connect" for key in plan.keys}
+
+    due = plan.due(run_log.last_runs(device["name"]), previous)
+    fresh = run_plan(pool, device, plan, due, previous, timeout, deadline)
+    run_log.mark(device["name"], [key for key, output in fresh.items() if is_usable(output)])
+    reused = [key for key in plan.keys if key not in fresh]
+    if reused:
+        print(f"♻️ {device['name']}: reusing previous output for {', '.join(reused)}")
+    device_span.set(ran=len(fresh), reused=len(reused))
+    return {key: fresh[key] if key in fresh else previous.get(key, "Not collected") for key in plan.keys}
 
 
 # --- Aggregate Output ---
 def aggregate_device_info(output_dict, device_type):
     num_devices = len(output_dict)
-
     if num_devices == 1:
         prompt = f"""You are an expert network, automation, platform engineering, and security engineer. Analyze the following outputs from a single device of type '{device_type}'.
 
@@ -118,87 +120,379 @@ def aggregate_device_info(output_dict, device_type):
 
         Focus on providing actionable recommendations based on your analysis."""
 
-    combined_input = prompt.format(device_type=device_type)
-
+    sections = [prompt]
     for device_name, device_outputs in output_dict.items():
-        combined_input += f"\n\n### {device_name} ###\n"
+        sections.append(f"\n\n### {device_name} ###\n")
         for command, output in device_outputs.items():
-            combined_input += f"\n\n#### {command} ####\n{output}"
-    return combined_input
+            sections.append(f"\n\n#### {command} ####\n{output}")
+    return "".join(sections)
+
+
+def reduce_prompt(partial_summaries, device_type, num_devices):
+    prompt = f"""You are an expert network, automation, platform engineering, and security engineer. The {num_devices} devices of type '{device_type}' were analyzed in batches. Below are the partial analyses, one per batch.
+
+        Merge them into a single report. First, keep a concise summary for each individual device of its:
+
+        *   Operational state
+        *   Key configurations
+        *   Relevant logs
+        *   Any potential issues or anomalies specific to that device
+
+        Then provide a combined analysis across ALL batches that identifies:
+
+        *   Common configurations and settings across all devices of type '{device_type}'.
+        *   Any significant deviations from the norm or inconsistencies between devices.
+        *   Potential security vulnerabilities or misconfigurations that are present in some devices but not others.
+        *   Suggestions for improving consistency, security, and overall operational efficiency across the '{device_type}' device family.
+
+        Focus on providing actionable recommendations based on your analysis."""
+
+    sections = [prompt]
+    for index, partial in enumerate(partial_summaries, 1):
+        sections.append(f"\n\n### Batch {index} ###\n{partial}")
+    return "".join(sections)
 
 
 # --- Analyze with Mistral (Updated for SDK v1.x) ---
-def analyze_with_mistral(mistral_client, output):
-    try:
-        messages = [
-            {
-                "role": "user",
-                "content": output
-            }
-        ]
-        response = mistral_client.chat.complete(
-            model="pixtral-12b-2409",  # or another available model
-            messages=messages,
-            max_tokens=2000
+# Returns None when the analysis failed after retries, so callers never save
+# an error string as if it were a summary.
+def analyze_with_mistral(mistral_client, output, max_tokens=2000, label=None):
+    with span("llm.analyze", label=label, prompt_chars=len(output)) as analyze_span:
+        try:
+            messages = [
+                {
+                    "role": "user",
+                    "content": output
+                }
+            ]
+            return get_llm(mistral_client).chat(
+                messages,
+                model="pixtral-12b-2409",  # or another available model
+                max_tokens=max_tokens,
+                label=label,
+            )
+        except Exception as e:
+            analyze_span.fail(e)
+            print(f"Error analyzing with Mistral: {e}")
+            return None
+
+
+def _analyze_many(mistral_client, prompts, max_tokens, label):
+    results = get_llm(mistral_client).chat_many([
+        {
+            "messages": [{"role": "user", "content": prompt}],
+            "model": "pixtral-12b-2409",
+            "max_tokens": max_tokens,
+            "label": f"{label} batch {index}",
+        }
+        for index, prompt in enumerate(prompts, 1)
+    ])
+    summaries, failed = [], []
+    for index, result in enumerate(results, 1):
+        if isinstance(result, Exception):
+            print(f"Error analyzing {label} batch {index} with Mistral: {result}")
+            failed.append(f"{label} batch {index}")
+        else:
+            summaries.append(result)
+    return summaries, failed
+
+
+# --- Map-Reduce Analysis for Large Device Groups ---
+# Batches whose call failed are left out of the merge and listed in
+# `failed_batches`, so the caller can flag the summary as partial.
+def analyze_device_group(mistral_client, output_dict, device_type, build_prompt=None, max_tokens=2000, failed_batches=None):
+    build_prompt = build_prompt or (lambda chunk: aggregate_device_info(chunk, device_type))
+    header_tokens = estimate_tokens(build_prompt({}))
+    budget = context_token_budget() - max_tokens - header_tokens
+
+    chunks = pack_devices(output_dict, budget)
+    with span("llm.analyze_group", device_type=device_type, devices=len(output_dict), batches=len(chunks)):
+        return _map_reduce(
+            mistral_client, output_dict, device_type, build_prompt, max_tokens, chunks,
+            failed_batches if failed_batches is not None else [],
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error analyzing with Mistral: {e}")
-        return "Error during analysis"
 
 
-# --- Save Results to Timestamped YAML ---
-def save_output(device_type, outputs, summary):
+def _map_reduce(mistral_client, output_dict, device_type, build_prompt, max_tokens, chunks, failed_batches):
+    if len(chunks) <= 1:
+        return analyze_with_mistral(
+            mistral_client, build_prompt(chunks[0] if chunks else output_dict), max_tokens, label=device_type
+        )
+
+    print(f"🧩 {len(output_dict)} devices split into {len(chunks)} batches to fit the model context")
+    partials, failed = _analyze_many(mistral_client, [build_prompt(chunk) for chunk in chunks], max_tokens, device_type)
+    failed_batches.extend(failed)
+
+    # Reduce until the merged report fits in one call.
+    reduce_budget = context_token_budget() - max_tokens - estimate_tokens(reduce_prompt([], device_type, 0))
+    while partials:
+        groups = pack_texts(partials, reduce_budget)
+        if len(groups) == len(partials) > 1 and all(len(group) == 1 for group in groups):
+            # Every partial is too large to pair up; trim them so one merge fits.
+            share = reduce_budget * CHARS_PER_TOKEN // len(partials)
+            groups = [[partial[:share] for partial in partials]]
+        if len(groups) == 1:
+            return analyze_with_mistral(
+                mistral_client, reduce_prompt(groups[0], device_type, len(output_dict)), max_tokens,
+                label=f"{device_type} merge",
+            )
+        partials, failed = _analyze_many(
+            mistral_client,
+            [reduce_prompt(group, device_type, len(output_dict)) for group in groups],
+            max_tokens,
+            f"{device_type} merge",
+        )
+        failed_batches.extend(failed)
+    return None
+
+
+# --- Plan and Run Analysis per Device Type ---
+def plan_analysis(device_type, all_outputs, incremental=False, previous_snapshot=None, findings=None):
+    if incremental and previous_snapshot is None:
+        previous_snapshot = load_previous_snapshot(device_type)
+    findings = findings or []
+    facts = f"\n\n### Pre-computed findings from local rule checks ###\n{format_findings(findings)}"
+    trends = trend_context(device_type, set(all_outputs)) if trends_enabled() else ""
+    if trends:
+        facts += f"\n\n### Trends from previous scans (last 7 days) ###\n{trends}"
+
+    if not incremental or not previous_snapshot:
+        return {
+            # Compacted before packing so batch sizes reflect the real prompt.
+            "outputs": compact_outputs(all_outputs, device_type) if structured_prompts_enabled() else all_outputs,
+            "build_prompt": lambda chunk: aggregate_device_info(chunk, device_type) + facts,
+            "metadata": {
+                "hashes": digest_outputs(all_outputs),
+                "findings": [finding.as_dict() for finding in findings],
+            },
+            "summary": None,
+        }
+
+    changes, skipped, hashes = detect_changes(previous_snapshot, all_outputs)
+    baseline = previous_snapshot.get("timestamp", "unknown")
+    print(f"🔁 {device_type}: {len(skipped)} unchanged command outputs skipped since {baseline}")
+    return {
+        "outputs": changes,
+        "build_prompt": lambda chunk: aggregate_changes(chunk, skipped, device_type, baseline) + facts,
+        "metadata": {
+            "hashes": hashes,
+            "incremental": {"baseline": baseline, "changed": sorted(changes), "skipped": skipped},
+            "findings": [finding.as_dict() for finding in findings],
+        },
+        "summary": None if changes or findings else f"No changes detected since the previous scan at {baseline}.",
+    }
+
+
+def run_analysis(mistral_client, device_type, plan):
+    if plan["summary"] is not None:
+        return plan["summary"]
+    print(f"📚 Aggregating device information for {device_type}...")
+    failed_batches = []
+    summary = analyze_device_group(
+        mistral_client, plan["outputs"], device_type, plan["build_prompt"], failed_batches=failed_batches
+    )
+    if summary is not None and failed_batches:
+        # Saved and sent on, but never passed off as the full picture.
+        plan["metadata"]["analysis_error"] = {"partial": True, "failed_batches": failed_batches}
+        print(f"⚠️ {device_type} summary is partial; failed: {', '.join(failed_batches)}")
+        summary = (
+            f"⚠️ Partial analysis: {', '.join(failed_batches)} failed, so some devices are missing "
+            f"from this summary.\n\n{summary}"
+        )
+    return summary
+
+
+# --- Save Results to a Timestamped Report ---
+# The format (YAML by default) comes from REPORT_FORMAT; see report_store.py.
+def save_output(device_type, outputs, summary, metadata=None):
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     output_dir = os.path.join("output", device_type)
     os.makedirs(output_dir, exist_ok=True)
 
-    output_path = os.path.join(output_dir, f"{timestamp}.yaml")
-    with open(output_path, "w") as f:
-        yaml.dump(
-            {
-                "device_type": device_type,
-                "timestamp": timestamp,
-                "outputs": outputs,
-                "summary": summary,
-            },
-            f,
-            default_flow_style=False,
-        )
+    document = {
+        "device_type": device_type,
+        "timestamp": timestamp,
+        "outputs": outputs,
+        "summary": summary,
+        **(metadata or {}),
+    }
+    with span("report.save", device_type=device_type, devices=len(outputs)):
+        with span("report.write") as write_span:
+            output_path = write_report(os.path.join(output_dir, timestamp), document)
+            write_span.set(path=output_path, bytes=os.path.getsize(output_path))
+        with span("report.index"):
+            index_document(output_path, document)
+        with span("metrics.record") as metrics_span:
+            try:
+                record_scan(device_type, outputs)
+            except Exception as e:
+                metrics_span.fail(e)
+                print(f"⚠️ Could not record metrics for {device_type}: {e}")
+        with span("search.index") as search_span:
+            try:
+                index_report_sections(output_path, document)
+            except Exception as e:
+                search_span.fail(e)
+                print(f"⚠️ Could not add {output_path} to the search index: {e}")
     print(f"💾 Output saved to {output_path}")
+    return output_path
+
+
+# --- Pipeline Stages ---
+# Shared by the one-shot run below and by daemon.py, which feeds already
+# collected outputs straight into the aggregate stage. With a shard
+# coordinator, every device type was already submitted to the shard workers
+# and the collect stage waits for (and merges) that type's shards.
+def build_stages(mistral_client, incremental=False, collection_settings=None, coordinator=None):
+    collection_settings = collection_settings or load_collection_settings()
+
+    def collect_stage(item):
+        device_type = item["device_type"]
+        print(f"\n--- Collecting devices of type: {device_type} ---\n")
+        # The previous report supplies outputs for commands that are not due yet.
+        if "previous_snapshot" not in item:
+            item["previous_snapshot"] = load_previous_snapshot(device_type)
+        previous_outputs = (item["previous_snapshot"] or {}).get("outputs") or {}
+        if coordinator:
+            outputs, timing = coordinator.collect(device_type)
+        else:
+            fleet_outputs, timing = collect_fleet(
+                {device_type: item["devices"]},
+                collect_fn=lambda device, deadline: collect_device_info(
+                    device, deadline=deadline, previous=previous_outputs.get(device["name"])
+                ),
+                **collection_settings,
+            )
+            outputs = fleet_outputs[device_type]
+        get_run_log().save()
+        print_timing_report(timing)
+        item["outputs"] = outputs
+        return item
+
+    def aggregate_stage(item):
+        device_type, outputs = item["device_type"], item["outputs"]
+        if "previous_snapshot" in item:
+            previous_snapshot = item.pop("previous_snapshot")
+        else:
+            previous_snapshot = load_previous_snapshot(device_type)
+        findings = run_rules(device_type, outputs, previous_snapshot)
+        print(f"🔎 Local checks for {device_type}: {len(findings)} findings")
+        item["findings_alert"] = send_findings_alert(device_type, findings)
+        item["plan"] = plan_analysis(device_type, outputs, incremental, previous_snapshot, findings)
+        return item
+
+    def analyze_stage(item):
+        print(f"🧠 Talking to Mistral about {item['device_type']}...")
+        item["summary"] = run_analysis(mistral_client, item["device_type"], item["plan"])
+        return item
+
+    def persist_stage(item):
+        device_type, summary = item["device_type"], item["summary"]
+        metadata = item["plan"]["metadata"]
+        metadata["findings_alerted"] = findings_alert_delivered(item.pop("findings_alert", None))
+        print(f"\n--- Results for devices of type: {device_type} ---\n")
+        if summary is None:
+            metadata["analysis_error"] = True
+            print("⚠️ Mistral analysis failed; saving the raw outputs without a summary.")
+        else:
+            print("\n\n✅ Detailed Summary:\n\n")
+            print(summary)
+        item["report_path"] = save_output(device_type, item["outputs"], summary, metadata)
+        return item
+
+    def collaborate_stage(item):
+        collaborate(item["device_type"], mistral_client, item["report_path"], interactive=False, digest=True)
+        return item
+
+    return [
+        ("collect", collect_stage, 1),
+        ("aggregate", aggregate_stage, 1),
+        ("analyze", analyze_stage, int(os.getenv("ANALYSIS_WORKERS", 2))),
+        ("persist", persist_stage, 1),
+        ("collaborate", collaborate_stage, 1),
+    ]
 
 
 # --- Main Execution ---
-if __name__ == "__main__":
-    devices = load_devices()
+# `cli.py collect` and `cli.py analyze` land here (as does `python mistral.py`).
+# The Mistral client is created by the first stage that talks to the API, so
+# collection starts without waiting for the SDK to import.
+def main(args):
+    start_tracing("mistral")
+    require_api_key()
 
-    devices_by_type = {}
-    for device in devices:
-        device_type = device.get("device_type", "unknown")
-        if device_type not in devices_by_type:
-            devices_by_type[device_type] = []
-        devices_by_type[device_type].append(device)
+    devices = load_devices()
 
-    for device_type, device_list in devices_by_type.items():
-        print(f"\n--- Processing devices of type: {device_type} ---\n")
+    devices_by_type = group_devices_by_type(devices)
 
-        all_outputs = {}
-        for device in device_list:
-            all_outputs[device["name"]] = collect_device_info(device)
+    collection_settings = load_collection_settings()
 
-        print("📚 Aggregating device information...")
-        aggregated_input = aggregate_device_info(all_outputs, device_type)
+    items = [
+        {"device_type": device_type, "devices": device_list}
+        for device_type, device_list in devices_by_type.items()
+    ]
+    coordinator = None
+    if args.sharded:
+        # Everything is handed out up front; the pipeline picks up each
+        # device type as soon as its shards are back.
+        coordinator = ShardCoordinator().start()
+        for item in items:
+            item["previous_snapshot"] = load_previous_snapshot(item["device_type"])
+            coordinator.submit(
+                item["device_type"],
+                item["devices"],
+                previous=(item["previous_snapshot"] or {}).get("outputs"),
+                last_runs={device["name"]: get_run_log().last_runs(device["name"]) for device in item["devices"]},
+            )
+
+    pipeline = Pipeline(build_stages(None, args.incremental, collection_settings, coordinator))
+    try:
+        pipeline.run(items)
+    finally:
+        if coordinator:
+            coordinator.close()
+    finish_run(pipeline)
+    print("\n\n✅ Done processing all devices.")
 
-        print("🧠 Talking to Mistral...")
-        mistral_client = get_mistral_client()
-        summary = analyze_with_mistral(mistral_client, aggregated_input)
 
-        print("\n\n✅ Detailed Summary:\n\n")
-        print(summary)
+def analyze_saved(args):
+    # Re-runs the analysis on the latest saved outputs without touching the
+    # devices; the report before it serves as the previous snapshot.
+    start_tracing("analyze")
+    require_api_key()
+    items = []
+    for device_type in args.device_types or list(group_devices_by_type(load_devices())):
+        reports = latest_reports(device_type, 2)
+        if not reports:
+            print(f"⚠️ No saved report for {device_type}; run a collection first.")
+            continue
+        print(f"📂 Re-analyzing {reports[0]['path']}")
+        items.append({
+            "device_type": device_type,
+            "outputs": load_report(reports[0]["path"]).get("outputs") or {},
+            "previous_snapshot": load_report(reports[1]["path"]) if len(reports) > 1 else None,
+        })
+
+    stages = build_stages(None, args.incremental)[1:]
+    if args.no_collab:
+        stages = stages[:-1]
+    pipeline = Pipeline(stages)
+    pipeline.run(items)
+    finish_run(pipeline)
+    print("\n\n✅ Done re-analyzing.")
+
+
+def finish_run(pipeline):
+    pipeline.print_stage_report()
+    flush_notifications()
+
+    get_ssh_pool().close_all()
+    print_cache_stats()
+    get_llm().print_call_stats()
+    write_trace()
 
-        save_output(device_type, all_outputs, summary)
 
-                # --- Call Collaboration Script ---
-        os.system(f"python analyze_and_collab.py {device_type}")
+if __name__ == "__main__":
+    from cli import main as cli_main
 
-    print("\n\n✅ Done processing all devices.")
+    cli_main(["collect", *sys.argv[1:]])
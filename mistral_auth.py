@@ -1,9 +1,21 @@
 import os
-from mistralai import Mistral
 
 
-def get_mistral_client():
+def require_api_key():
     api_key = os.getenv("MISTRAL_API_KEY")
     if not api_key:
-        raise ValueError("MISTRAL_KEY environment variable is not set.")
+        raise ValueError("MISTRAL_API_KEY environment variable is not set.")
+    return api_key
+
+
+def get_mistral_client():
+    # The SDK (pydantic, httpx) takes most of a second to import, so it is
+    # only loaded once a client is actually needed.
+    from mistralai import Mistral
+
+    api_key = require_api_key()
+    # MISTRAL_SERVER_URL points the SDK at a proxy or a local stand-in API.
+    server_url = os.getenv("MISTRAL_SERVER_URL")
+    if server_url:
+        return Mistral(api_key=api_key, server_url=server_url)
     return Mistral(api_key=api_key)
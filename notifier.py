@@ -0,0 +1,224 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from tracing import span
+
+
+DEFAULT_API_URL = "https://webexapis.com/v1"
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_DEDUP_WINDOW = 3600
+DEDUP_PATH = os.path.join("cache", "webex_dedup.json")
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_STOP = object()
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+# --- Webex Notifier ---
+# One pooled requests.Session (keep-alive, so one TLS handshake per run)
+# drained by a background worker: callers enqueue and carry on, while the
+# worker sends with timeouts and retries 429/5xx, honouring Retry-After.
+# Per-run results can be coalesced into one digest message, and alerts with
+# a dedup key are suppressed if the same key went out within the window.
+class WebexNotifier:
+    def __init__(
+        self,
+        token=None,
+        api_url=None,
+        timeout=None,
+        max_retries=None,
+        dedup_window=None,
+        dedup_path=DEDUP_PATH,
+    ):
+        self.token = token or os.getenv("WEBEX_BOT_TOKEN")
+        self.api_url = (api_url or os.getenv("WEBEX_API_URL", DEFAULT_API_URL)).rstrip("/")
+        self.timeout = timeout or float(os.getenv("WEBEX_TIMEOUT", DEFAULT_TIMEOUT))
+        self.max_retries = max_retries if max_retries is not None else int(
+            os.getenv("WEBEX_MAX_RETRIES", DEFAULT_MAX_RETRIES)
+        )
+        self.dedup_window = dedup_window if dedup_window is not None else float(
+            os.getenv("WEBEX_DEDUP_WINDOW", DEFAULT_DEDUP_WINDOW)
+        )
+        self.dedup_path = dedup_path
+        # requests is imported here rather than at module top: commands that
+        # never notify should not pay for it.
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session.headers.update({"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "deduplicated": 0}
+        self._queue = queue.Queue()
+        self._digest = []
+        self._lock = threading.Lock()
+        self._worker = None
+
+    # --- sending ---
+    def post(self, recipient, message, is_room=False):
+        import requests
+
+        with span("webex.post", room=is_room, bytes=len(message)) as post_span:
+            payload = {"markdown": message, ("roomId" if is_room else "toPersonId"): recipient}
+            for attempt in range(self.max_retries + 1):
+                response = None
+                try:
+                    response = self.session.post(f"{self.api_url}/messages", json=payload, timeout=self.timeout)
+                    if response.status_code < 300:
+                        self._count("sent")
+                        post_span.set(attempts=attempt + 1)
+                        return True
+                    retryable = response.status_code in RETRYABLE_STATUS
+                    error = f"{response.status_code} {response.text[:200]}"
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    retryable, error = True, str(e)
+                if not retryable or attempt == self.max_retries:
+                    break
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = random.uniform(0, min(60.0, 2 ** attempt))
+                self._count("retries")
+                print(f"⏳ Webex send failed ({error}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+            self._count("failed")
+            post_span.set(attempts=attempt + 1)
+            post_span.fail(error)
+            print(f"❌ Failed to send Webex message: {error}")
+            return False
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                recipient, message, is_room, claimed, on_delivered = item
+                delivered = False
+                try:
+                    delivered = self.post(recipient, message, is_room)
+                    if delivered and on_delivered:
+                        on_delivered()
+                finally:
+                    # An alert that never went out must not suppress the next attempt.
+                    if claimed and not delivered:
+                        self._release(claimed)
+            except Exception as e:
+                print(f"❌ Webex worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="webex-notifier", daemon=True)
+                self._worker.start()
+
+    def send(self, recipient, message, is_room=False, dedup_key=None, on_delivered=None):
+        # Returns whether the message was queued; on_delivered is called from
+        # the worker once Webex has accepted it.
+        if not recipient:
+            print("⚠️ Webex recipient not configured; message not sent.")
+            return False
+        claimed = None
+        if dedup_key:
+            claimed = hashlib.sha256(f"{recipient}|{dedup_key}".encode("utf-8")).hexdigest()
+            if not self._claim(claimed):
+                self._count("deduplicated")
+                print("🔕 Same alert already sent recently; not repeating it.")
+                return False
+        self._ensure_worker()
+        self._queue.put((recipient, message, is_room, claimed, on_delivered))
+        return True
+
+    def flush(self):
+        if self._worker is not None:
+            self._queue.join()
+
+    def close(self):
+        self.flush_digests()
+        self.flush()
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(_STOP)
+            self._worker.join(timeout=self.timeout)
+        self.session.close()
+
+    # --- digests ---
+    def add_to_digest(self, recipient, title, entry, is_room=True):
+        with self._lock:
+            self._digest.append((recipient, title, entry, is_room))
+
+    def flush_digests(self):
+        with self._lock:
+            digest, self._digest = self._digest, []
+        grouped = {}
+        for recipient, title, entry, is_room in digest:
+            grouped.setdefault((recipient, title, is_room), []).append(entry)
+        for (recipient, title, is_room), entries in grouped.items():
+            self.send(recipient, f"{title}\n" + "\n".join(entries), is_room=is_room)
+
+    # --- deduplication ---
+    # A key is claimed when the alert is queued, so a repeat queued before it
+    # is delivered is still suppressed, and released again if delivery fails.
+    def _load_seen(self, now):
+        try:
+            with open(self.dedup_path) as f:
+                seen = json.load(f)
+        except (FileNotFoundError, ValueError):
+            seen = {}
+        return {k: ts for k, ts in seen.items() if now - ts < self.dedup_window}
+
+    def _save_seen(self, seen):
+        os.makedirs(os.path.dirname(self.dedup_path) or ".", exist_ok=True)
+        tmp = self.dedup_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(seen, f)
+        os.replace(tmp, self.dedup_path)
+
+    def _claim(self, key):
+        now = time.time()
+        with self._lock:
+            seen = self._load_seen(now)
+            if key in seen:
+                return False
+            seen[key] = now
+            self._save_seen(seen)
+        return True
+
+    def _release(self, key):
+        with self._lock:
+            seen = self._load_seen(time.time())
+            if seen.pop(key, None) is not None:
+                self._save_seen(seen)
+
+
+_default_notifier = None
+_default_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    global _default_notifier
+    with _default_notifier_lock:
+        if _default_notifier is None:
+            _default_notifier = WebexNotifier()
+            # Queued messages and pending digests still go out when the script ends.
+            atexit.register(_default_notifier.close)
+        return _default_notifier
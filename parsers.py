@@ -0,0 +1,276 @@
+import os
+import re
+
+
+# --- Typed Records ---
+# __slots__ keeps each record to a handful of pointers, so a 48-port switch
+# parses to a few KB instead of the hundreds of KB of raw CLI text.
+class InterfaceRecord:
+    __slots__ = (
+        "name", "state", "protocol", "reason", "description", "mtu", "duplex", "speed",
+        "in_rate_bps", "out_rate_bps", "in_errors", "out_errors", "crc", "resets",
+    )
+
+    def __init__(self, name, state, protocol=None, reason=None):
+        self.name = name
+        self.state = state
+        self.protocol = protocol
+        self.reason = reason
+        self.description = None
+        self.mtu = None
+        self.duplex = None
+        self.speed = None
+        self.in_rate_bps = None
+        self.out_rate_bps = None
+        self.in_errors = None
+        self.out_errors = None
+        self.crc = None
+        self.resets = None
+
+
+class VlanRecord:
+    __slots__ = ("vlan_id", "name", "status", "ports")
+
+    def __init__(self, vlan_id, name, status, ports):
+        self.vlan_id = vlan_id
+        self.name = name
+        self.status = status
+        self.ports = ports
+
+
+class VrfRecord:
+    __slots__ = ("name", "ident", "state", "detail")
+
+    def __init__(self, name, ident, state, detail):
+        self.name = name
+        self.ident = ident
+        self.state = state
+        self.detail = detail
+
+
+class MemoryRecord:
+    __slots__ = ("pool", "total", "used", "free")
+
+    def __init__(self, pool, total, used, free):
+        self.pool = pool
+        self.total = total
+        self.used = used
+        self.free = free
+
+    @property
+    def utilization(self):
+        return self.used / self.total if self.total else 0.0
+
+
+def as_dict(record):
+    return {slot: getattr(record, slot) for slot in record.__slots__}
+
+
+INTERFACE_ABBREVIATIONS = [
+    ("TenGigabitEthernet", "Te"),
+    ("TwentyFiveGigE", "Twe"),
+    ("FortyGigabitEthernet", "Fo"),
+    ("HundredGigE", "Hu"),
+    ("GigabitEthernet", "Gi"),
+    ("FastEthernet", "Fa"),
+    ("Ethernet", "Eth"),
+    ("port-channel", "Po"),
+    ("Port-channel", "Po"),
+    ("Loopback", "Lo"),
+]
+
+
+def short_interface_name(name):
+    for long_name, short_name in INTERFACE_ABBREVIATIONS:
+        if name.startswith(long_name):
+            return short_name + name[len(long_name):]
+    return name
+
+
+# --- show interface (NX-OS and IOS-XE share most of the layout) ---
+INTERFACE_HEADER = re.compile(
+    r"^(?P<name>\S+) is (?P<state>administratively down|up|down|deleted)"
+    r"(?:, line protocol is (?P<protocol>\w+))?"
+    r"(?:\s*\((?P<reason>[^)]*)\))?",
+)
+INTERFACE_FIELDS = [
+    ("description", re.compile(r"^\s*Description: (.*?)\s*$"), str),
+    ("mtu", re.compile(r"\bMTU (\d+) bytes"), int),
+    ("duplex", re.compile(r"\b(full|half|auto)[- ]duplex\b", re.IGNORECASE), str.lower),
+    ("speed", re.compile(r"[- ]duplex, ([^,\n]+)", re.IGNORECASE), str.strip),
+    ("in_rate_bps", re.compile(r"input rate (\d+) bits/sec"), int),
+    ("out_rate_bps", re.compile(r"output rate (\d+) bits/sec"), int),
+    ("in_errors", re.compile(r"\b(\d+) input errors?\b"), int),
+    ("out_errors", re.compile(r"\b(\d+) output errors?\b"), int),
+    ("crc", re.compile(r"\b(\d+) CRC\b"), int),
+    ("resets", re.compile(r"\b(\d+) interface resets\b"), int),
+]
+
+
+def parse_interfaces(output):
+    records = []
+    current = None
+    for line in output.splitlines():
+        header = INTERFACE_HEADER.match(line)
+        if header:
+            current = InterfaceRecord(
+                header.group("name"), header.group("state"), header.group("protocol"), header.group("reason")
+            )
+            records.append(current)
+            continue
+        if current is None:
+            continue
+        for field, pattern, convert in INTERFACE_FIELDS:
+            # Rates are reported for several intervals; keep the first one.
+            if getattr(current, field) is not None:
+                continue
+            match = pattern.search(line)
+            if match:
+                setattr(current, field, convert(match.group(1)))
+    return records
+
+
+# --- show vlan ---
+VLAN_LINE = re.compile(r"^(\d+)\s+(\S+)\s+(active|suspended|act/\w+|sus/\w+)\s*(.*)$")
+VLAN_CONTINUATION = re.compile(r"^\s{20,}(\S.*)$")
+
+
+def parse_vlans(output):
+    records = []
+    in_table = False
+    for line in output.splitlines():
+        if line.startswith("VLAN Name"):
+            in_table = True
+            continue
+        if not in_table:
+            continue
+        if line.startswith("VLAN ") or line.startswith("Remote SPAN") or line.startswith("Primary"):
+            break
+        match = VLAN_LINE.match(line)
+        if match:
+            ports = [port.strip() for port in match.group(4).split(",") if port.strip()]
+            records.append(VlanRecord(int(match.group(1)), match.group(2), match.group(3), ports))
+            continue
+        continuation = VLAN_CONTINUATION.match(line)
+        if continuation and records:
+            records[-1].ports.extend(port.strip() for port in continuation.group(1).split(",") if port.strip())
+    return records
+
+
+# --- show vrf ---
+NXOS_VRF_LINE = re.compile(r"^(\S+)\s+(\d+)\s+(Up|Down)\s*(.*?)\s*$")
+IOSXE_VRF_LINE = re.compile(r"^\s+(\S+)\s+(<not set>|\S+)\s+(\S+)\s*(.*?)\s*$")
+
+
+def parse_vrfs_nxos(output):
+    return [
+        VrfRecord(match.group(1), match.group(2), match.group(3), match.group(4))
+        for match in map(NXOS_VRF_LINE.match, output.splitlines())
+        if match
+    ]
+
+
+def parse_vrfs_iosxe(output):
+    records = []
+    for line in output.splitlines():
+        if line.strip().startswith("Name "):
+            continue
+        match = IOSXE_VRF_LINE.match(line)
+        if match:
+            records.append(VrfRecord(match.group(1), match.group(2), match.group(3), match.group(4)))
+    return records
+
+
+# --- show memory ---
+NXOS_MEMORY = re.compile(r"Memory usage:\s+(\d+)K total,\s+(\d+)K used,\s+(\d+)K free")
+IOSXE_MEMORY_POOL = re.compile(r"^\s*(Processor|I/O|lsmpi_io|reserve P)\s+\S+\s+(\d+)\s+(\d+)\s+(\d+)")
+
+
+def parse_memory(output):
+    records = []
+    match = NXOS_MEMORY.search(output)
+    if match:
+        total, used, free = (int(value) * 1024 for value in match.groups())
+        records.append(MemoryRecord("system", total, used, free))
+    for line in output.splitlines():
+        pool = IOSXE_MEMORY_POOL.match(line)
+        if pool:
+            records.append(MemoryRecord(pool.group(1), int(pool.group(2)), int(pool.group(3)), int(pool.group(4))))
+    return records
+
+
+PARSERS = {
+    "nxos": {
+        "show interface": parse_interfaces,
+        "show vlan": parse_vlans,
+        "show vrf": parse_vrfs_nxos,
+        "show memory": parse_memory,
+    },
+    "iosxe": {
+        "show interface": parse_interfaces,
+        "show vlan": parse_vlans,
+        "show vrf": parse_vrfs_iosxe,
+        "show memory": parse_memory,
+    },
+}
+
+
+def parse_output(platform, command, output):
+    parser = PARSERS.get(platform, PARSERS["iosxe"]).get(command)
+    if parser is None or not isinstance(output, str):
+        return None
+    return parser(output)
+
+
+# --- Dense Tables for Prompts ---
+def _cell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, list):
+        return ",".join(short_interface_name(port) for port in value) or "-"
+    return str(value).replace(" ", "_") if value != "" else "-"
+
+
+def _table(columns, rows):
+    return "\n".join([" ".join(columns)] + [" ".join(_cell(value) for value in row) for row in rows])
+
+
+def format_records(command, records):
+    if command == "show interface":
+        return _table(
+            ["intf", "state", "proto", "reason", "mtu", "duplex", "speed", "in_bps", "out_bps",
+             "in_err", "out_err", "crc", "resets", "desc"],
+            [
+                (short_interface_name(r.name), r.state, r.protocol, r.reason, r.mtu, r.duplex, r.speed,
+                 r.in_rate_bps, r.out_rate_bps, r.in_errors, r.out_errors, r.crc, r.resets, r.description)
+                for r in records
+            ],
+        )
+    if command == "show vlan":
+        return _table(["vlan", "name", "status", "ports"], [(r.vlan_id, r.name, r.status, r.ports) for r in records])
+    if command == "show vrf":
+        return _table(["vrf", "id/rd", "state/proto", "detail"], [(r.name, r.ident, r.state, r.detail) for r in records])
+    if command == "show memory":
+        return _table(
+            ["pool", "total_b", "used_b", "free_b", "util"],
+            [(r.pool, r.total, r.used, r.free, f"{r.utilization:.0%}") for r in records],
+        )
+    return None
+
+
+def compact_output(platform, command, output):
+    records = parse_output(platform, command, output)
+    if not records:
+        return output
+    return f"[parsed table, {len(records)} rows]\n" + format_records(command, records)
+
+
+def compact_outputs(output_dict, platform):
+    return {
+        device: {command: compact_output(platform, command, output) for command, output in device_outputs.items()}
+        for device, device_outputs in output_dict.items()
+    }
+
+
+def structured_prompts_enabled():
+    return os.getenv("STRUCTURED_PROMPTS", "on").lower() not in ("0", "off", "false", "no")
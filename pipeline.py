@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+
+from tracing import span
+
+
+_DONE = object()
+
+
+# --- Staged Pipeline ---
+# Each stage is a (name, function, workers) tuple. Stages run on their own
+# threads and hand items to the next stage through bounded queues, so while
+# one device type is being analyzed the next one is already being collected.
+class Pipeline:
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stage_seconds = {name: 0.0 for name, _, _ in stages}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def _worker(self, name, fn, inbox, outbox):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)  # let sibling workers see it too
+                return
+            started = time.monotonic()
+            try:
+                with span(f"stage.{name}", device_type=item.get("device_type")):
+                    result = fn(item)
+            except Exception as e:
+                print(f"❌ Pipeline stage '{name}' failed for {item.get('device_type', item)}: {e}")
+                with self._lock:
+                    self.errors.append((name, item, e))
+                continue
+            finally:
+                with self._lock:
+                    self.stage_seconds[name] += time.monotonic() - started
+            if result is not None:
+                outbox.put(result)
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        queues[-1] = queue.Queue()  # the sink never applies back-pressure
+
+        threads_per_stage = []
+        for index, (name, fn, workers) in enumerate(self.stages):
+            threads = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(name, fn, queues[index], queues[index + 1]),
+                    name=f"pipeline-{name}-{n}",
+                    daemon=True,
+                )
+                for n in range(max(1, workers))
+            ]
+            for thread in threads:
+                thread.start()
+            threads_per_stage.append(threads)
+
+        wall_start = time.monotonic()
+        for item in items:
+            queues[0].put(item)
+        queues[0].put(_DONE)
+
+        # Drain stage by stage: once every worker of a stage has exited, no
+        # more items can reach the next stage, so it can be told to stop.
+        for index, threads in enumerate(threads_per_stage):
+            for thread in threads:
+                thread.join()
+            queues[index + 1].put(_DONE)
+
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            results.append(item)
+        self.wall_seconds = time.monotonic() - wall_start
+        return results
+
+    def print_stage_report(self):
+        busiest = max(self.stage_seconds.values(), default=0.0)
+        print("\n⏱️ Pipeline timing:")
+        for name, seconds in self.stage_seconds.items():
+            print(f"   {name:<12} {seconds:8.2f}s busy")
+        print(
+            f"   Wall clock {self.wall_seconds:.2f}s  |  sum of stages {sum(self.stage_seconds.values()):.2f}s  "
+            f"|  busiest stage {busiest:.2f}s"
+        )
@@ -0,0 +1,173 @@
+import os
+import re
+
+from parsers import parse_output
+
+
+SEVERITY_ORDER = {"critical": 0, "major": 1, "minor": 2}
+UNREACHABLE_OUTPUTS = ("Unable to connect", "Timed out")
+# collector.py writes this for every command when collecting a device raised.
+COLLECTION_FAILED = "Collection failed:"
+
+
+class Finding:
+    __slots__ = ("severity", "device", "rule", "detail")
+
+    def __init__(self, severity, device, rule, detail):
+        self.severity = severity
+        self.device = device
+        self.rule = rule
+        self.detail = detail
+
+    def as_dict(self):
+        return {"severity": self.severity, "device": self.device, "rule": self.rule, "detail": self.detail}
+
+    def __str__(self):
+        return f"[{self.severity.upper()}] {self.device}: {self.detail}"
+
+
+# --- Line Rules (one combined regex per platform) ---
+# Each rule is (name, pattern, severity); all rules of a platform are joined
+# into a single alternation with named groups, so a log is scanned once no
+# matter how many rules there are.
+COMMON_LINE_RULES = [
+    ("syslog_emergency", r"%[A-Z0-9_]+-[01]-[A-Z0-9_]+[^\n]*", "critical"),
+    ("syslog_critical", r"%[A-Z0-9_]+-2-[A-Z0-9_]+[^\n]*", "critical"),
+]
+# Platform-specific rules come first: in an alternation the first matching
+# branch wins, so they take precedence over the generic severity rules.
+PLATFORM_LINE_RULES = {
+    "nxos": [
+        ("err_disabled_log", r"%ETHPORT-\d-IF_DOWN_ERROR_DISABLED[^\n]*", "major"),
+        ("module_failure", r"%(?:MODULE|PLATFORM)-\d-(?:MOD_FAIL|PS_FAIL|FAN_FAIL)[^\n]*", "critical"),
+    ] + COMMON_LINE_RULES,
+    "iosxe": [
+        ("err_disabled_log", r"%PM-\d-ERR_DISABLE[^\n]*", "major"),
+        ("environment_failure", r"%(?:ENVIRONMENTAL|PLATFORM_ENV)-\d-[A-Z_]*FAIL[^\n]*", "critical"),
+    ] + COMMON_LINE_RULES,
+}
+
+
+def _compile(rules):
+    return re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern, _ in rules))
+
+
+COMPILED_LINE_RULES = {platform: _compile(rules) for platform, rules in PLATFORM_LINE_RULES.items()}
+RULE_SEVERITY = {
+    name: severity for rules in PLATFORM_LINE_RULES.values() for name, _, severity in rules
+}
+
+
+def _line_findings(platform, device, text, max_per_rule=5):
+    regex = COMPILED_LINE_RULES.get(platform, COMPILED_LINE_RULES["iosxe"])
+    findings = []
+    counts = {}
+    for match in regex.finditer(text):
+        rule = match.lastgroup
+        counts[rule] = counts.get(rule, 0) + 1
+        if counts[rule] <= max_per_rule:
+            findings.append(Finding(RULE_SEVERITY[rule], device, rule, match.group(0).strip()))
+    for rule, count in counts.items():
+        if count > max_per_rule:
+            findings.append(Finding(RULE_SEVERITY[rule], device, rule, f"{count - max_per_rule} more '{rule}' log lines"))
+    return findings
+
+
+# --- Structured Rules ---
+def _thresholds():
+    return {
+        "memory_major": float(os.getenv("MEMORY_MAJOR_THRESHOLD", 0.85)),
+        "memory_critical": float(os.getenv("MEMORY_CRITICAL_THRESHOLD", 0.95)),
+        "crc_growth": int(os.getenv("CRC_GROWTH_THRESHOLD", 0)),
+    }
+
+
+def _interface_findings(device, interfaces, previous_interfaces, thresholds):
+    findings = []
+    previous = {record.name: record for record in previous_interfaces or []}
+    for record in interfaces:
+        reason = (record.reason or "").lower()
+        if "err-disabled" in reason or "errdisabled" in reason:
+            findings.append(Finding("major", device, "interface_err_disabled", f"{record.name} is err-disabled"))
+        elif record.state == "down" and record.description:
+            findings.append(Finding(
+                "minor", device, "interface_down",
+                f"{record.name} ({record.description}) is down{f' ({record.reason})' if record.reason else ''}",
+            ))
+        before = previous.get(record.name)
+        if not before:
+            continue
+        for field in ("crc", "in_errors"):
+            now, then = getattr(record, field), getattr(before, field)
+            if now is not None and then is not None and now - then > thresholds["crc_growth"]:
+                findings.append(Finding(
+                    "major", device, f"{field}_growth", f"{record.name} {field} grew by {now - then} ({then} -> {now})"
+                ))
+    return findings
+
+
+def _memory_findings(device, pools, thresholds):
+    findings = []
+    for pool in pools:
+        if pool.pool not in ("system", "Processor"):
+            continue
+        if pool.utilization >= thresholds["memory_critical"]:
+            severity = "critical"
+        elif pool.utilization >= thresholds["memory_major"]:
+            severity = "major"
+        else:
+            continue
+        findings.append(Finding(severity, device, "memory_utilization", f"{pool.pool} memory at {pool.utilization:.0%}"))
+    return findings
+
+
+def _is_unreachable(device_outputs):
+    return bool(device_outputs) and all(
+        isinstance(output, str) and (output in UNREACHABLE_OUTPUTS or output.startswith(COLLECTION_FAILED))
+        for output in device_outputs.values()
+    )
+
+
+def _new_log_text(previous, current):
+    if not previous:
+        return current
+    seen = set(previous.splitlines())
+    return "\n".join(line for line in current.splitlines() if line not in seen)
+
+
+# --- Rule Engine ---
+def run_rules(platform, outputs, previous_snapshot=None):
+    thresholds = _thresholds()
+    previous_outputs = (previous_snapshot or {}).get("outputs") or {}
+    findings = []
+    for device, device_outputs in outputs.items():
+        if _is_unreachable(device_outputs):
+            findings.append(Finding("critical", device, "unreachable", "device is unreachable over SSH"))
+            continue
+        before = previous_outputs.get(device, {})
+
+        log = device_outputs.get("show logging")
+        if isinstance(log, str):
+            # Only lines that were not in the previous report, so old messages don't re-alert.
+            findings.extend(_line_findings(platform, device, _new_log_text(before.get("show logging"), log)))
+
+        interfaces = parse_output(platform, "show interface", device_outputs.get("show interface"))
+        if interfaces:
+            previous_interfaces = parse_output(platform, "show interface", before.get("show interface"))
+            findings.extend(_interface_findings(device, interfaces, previous_interfaces, thresholds))
+
+        pools = parse_output(platform, "show memory", device_outputs.get("show memory"))
+        if pools:
+            findings.extend(_memory_findings(device, pools, thresholds))
+
+    findings.sort(key=lambda finding: SEVERITY_ORDER[finding.severity])
+    return findings
+
+
+def format_findings(findings, limit=50):
+    if not findings:
+        return "No issues found by the local rule checks."
+    lines = [str(finding) for finding in findings[:limit]]
+    if len(findings) > limit:
+        lines.append(f"... {len(findings) - limit} more findings")
+    return "\n".join(lines)
@@ -0,0 +1,78 @@
+import math
+import os
+
+
+# CLI output (addresses, counters, column padding) tokenizes denser than
+# prose, so stay conservative when estimating.
+CHARS_PER_TOKEN = 3
+DEFAULT_CONTEXT_TOKENS = 32000
+
+
+def context_token_budget():
+    return int(os.getenv("MISTRAL_CONTEXT_TOKENS", DEFAULT_CONTEXT_TOKENS))
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def section_tokens(device_name, device_outputs):
+    # Mirrors the "### device ###" / "#### command ####" layout of aggregate_device_info.
+    tokens = estimate_tokens(f"\n\n### {device_name} ###\n")
+    for command, output in device_outputs.items():
+        tokens += estimate_tokens(f"\n\n#### {command} ####\n") + estimate_tokens(str(output))
+    return tokens
+
+
+def _truncate_device(device_outputs, budget_tokens):
+    # A single device larger than the budget: give every command an equal
+    # share and cut the longest outputs first.
+    budget_chars = budget_tokens * CHARS_PER_TOKEN
+    remaining = dict(device_outputs)
+    truncated = {}
+    share = budget_chars // max(1, len(remaining))
+    for command, output in sorted(remaining.items(), key=lambda item: len(str(item[1]))):
+        output = str(output)
+        if len(output) > share:
+            output = output[:share] + "\n... [truncated to fit the model context]"
+        truncated[command] = output
+        budget_chars -= len(output)
+        remaining.pop(command)
+        share = budget_chars // max(1, len(remaining))
+    return {command: truncated[command] for command in device_outputs}
+
+
+# --- Token-Budget Packing ---
+def pack_devices(output_dict, budget_tokens):
+    chunks = []
+    current = {}
+    current_tokens = 0
+    for device_name, device_outputs in output_dict.items():
+        tokens = section_tokens(device_name, device_outputs)
+        if tokens > budget_tokens:
+            device_outputs = _truncate_device(device_outputs, budget_tokens)
+            tokens = section_tokens(device_name, device_outputs)
+        if current and current_tokens + tokens > budget_tokens:
+            chunks.append(current)
+            current, current_tokens = {}, 0
+        current[device_name] = device_outputs
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pack_texts(texts, budget_tokens):
+    chunks = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > budget_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,219 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+OUTPUT_DIR = "output"
+INDEX_PATH = os.path.join(OUTPUT_DIR, "index.sqlite")
+
+_lock = threading.Lock()
+
+
+# --- Report Index ---
+# One row per saved report (with its summary and rule findings) plus one row
+# per device/command section with the content hash and size. Lookups by
+# device type and time go through B-tree indexes instead of globbing and
+# stat-ing every file under output/. Reports can be in any report_store format.
+@contextmanager
+def _connect(index_path=None):
+    index_path = index_path or INDEX_PATH
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    db = sqlite3.connect(index_path, timeout=30)
+    try:
+        with db:
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS reports (
+                    id INTEGER PRIMARY KEY,
+                    device_type TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    path TEXT NOT NULL UNIQUE,
+                    summary TEXT,
+                    findings TEXT
+                )"""
+            )
+            # Indexes created before findings were stored get the column added;
+            # their rows stay NULL until the report is re-indexed.
+            columns = {row[1] for row in db.execute("PRAGMA table_info(reports)")}
+            if "findings" not in columns:
+                db.execute("ALTER TABLE reports ADD COLUMN findings TEXT")
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS reports_by_type_time ON reports (device_type, timestamp)"
+            )
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS sections (
+                    report_id INTEGER NOT NULL,
+                    device TEXT NOT NULL,
+                    command TEXT NOT NULL,
+                    sha256 TEXT,
+                    bytes INTEGER,
+                    PRIMARY KEY (report_id, device, command)
+                )"""
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sections_by_device ON sections (device, command)")
+            yield db
+    finally:
+        db.close()
+
+
+def index_report(
+    path, device_type, timestamp, summary, hashes=None, sizes=None, findings=None, findings_alerted=None,
+    index_path=None,
+):
+    hashes = hashes or {}
+    sizes = sizes or {}
+    stored_findings = json.dumps({"findings": findings or [], "findings_alerted": bool(findings_alerted)})
+    with _lock, _connect(index_path) as db:
+        db.execute(
+            "DELETE FROM sections WHERE report_id IN (SELECT id FROM reports WHERE path = ?)", (path,)
+        )
+        db.execute("DELETE FROM reports WHERE path = ?", (path,))
+        cursor = db.execute(
+            "INSERT INTO reports (device_type, timestamp, path, summary, findings) VALUES (?, ?, ?, ?, ?)",
+            (device_type, timestamp, path, summary, stored_findings),
+        )
+        report_id = cursor.lastrowid
+        devices = set(hashes) | set(sizes)
+        db.executemany(
+            "INSERT INTO sections (report_id, device, command, sha256, bytes) VALUES (?, ?, ?, ?, ?)",
+            [
+                (report_id, device, command, hashes.get(device, {}).get(command), sizes.get(device, {}).get(command))
+                for device in devices
+                for command in set(hashes.get(device, {})) | set(sizes.get(device, {}))
+            ],
+        )
+    return report_id
+
+
+def _rows_to_reports(rows):
+    # findings is None for rows indexed before the column existed.
+    return [
+        {
+            "device_type": row[0],
+            "timestamp": row[1],
+            "path": row[2],
+            "summary": row[3],
+            "findings": json.loads(row[4]) if row[4] else None,
+        }
+        for row in rows
+        if os.path.exists(row[2])
+    ]
+
+
+def _ensure_indexed(device_type, index_path=None):
+    # Reports written before the index existed are picked up once, on first use.
+    with _connect(index_path) as db:
+        indexed = db.execute(
+            "SELECT 1 FROM reports WHERE device_type = ? LIMIT 1", (device_type,)
+        ).fetchone()
+    if not indexed and os.path.isdir(os.path.join(OUTPUT_DIR, device_type)):
+        rebuild_index(device_type, index_path)
+
+
+def latest_reports(device_type, n=1, index_path=None):
+    _ensure_indexed(device_type, index_path)
+    with _connect(index_path) as db:
+        rows = db.execute(
+            "SELECT device_type, timestamp, path, summary, findings FROM reports "
+            "WHERE device_type = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (device_type, n),
+        ).fetchall()
+    return _rows_to_reports(rows)
+
+
+def reports_between(device_type, start=None, end=None, index_path=None):
+    _ensure_indexed(device_type, index_path)
+    with _connect(index_path) as db:
+        rows = db.execute(
+            "SELECT device_type, timestamp, path, summary, findings FROM reports "
+            "WHERE device_type = ? AND timestamp >= ? AND timestamp <= ? ORDER BY timestamp",
+            (device_type, start or "", end or "\uffff"),
+        ).fetchall()
+    return _rows_to_reports(rows)
+
+
+def report_for_path(path, index_path=None):
+    with _connect(index_path) as db:
+        row = db.execute(
+            "SELECT device_type, timestamp, path, summary, findings FROM reports WHERE path = ?", (path,)
+        ).fetchone()
+    return _rows_to_reports([row])[0] if row else None
+
+
+def section_hashes(path, index_path=None):
+    with _connect(index_path) as db:
+        rows = db.execute(
+            "SELECT s.device, s.command, s.sha256 FROM sections s JOIN reports r ON r.id = s.report_id "
+            "WHERE r.path = ?",
+            (path,),
+        ).fetchall()
+    hashes = {}
+    for device, command, sha256 in rows:
+        hashes.setdefault(device, {})[command] = sha256
+    return hashes
+
+
+def index_document(path, document, index_path=None):
+    from incremental import digest_outputs
+
+    outputs = document.get("outputs") or {}
+    return index_report(
+        path,
+        document.get("device_type") or os.path.basename(os.path.dirname(path)),
+        str(document.get("timestamp") or os.path.basename(path).split(".")[0]),
+        document.get("summary"),
+        hashes=document.get("hashes") or digest_outputs(outputs),
+        sizes={
+            device: {command: len(str(output)) for command, output in device_outputs.items()}
+            for device, device_outputs in outputs.items()
+        },
+        findings=document.get("findings"),
+        findings_alerted=document.get("findings_alerted"),
+        index_path=index_path,
+    )
+
+
+def remove_report(path, index_path=None):
+    with _lock, _connect(index_path) as db:
+        db.execute(
+            "DELETE FROM sections WHERE report_id IN (SELECT id FROM reports WHERE path = ?)", (path,)
+        )
+        db.execute("DELETE FROM reports WHERE path = ?", (path,))
+
+
+# --- Rebuild From Existing Reports ---
+def rebuild_index(device_type=None, index_path=None):
+    from report_store import load_report, report_files
+
+    count = 0
+    for device_dir in glob.glob(os.path.join(OUTPUT_DIR, device_type or "*")):
+        for path in report_files(device_dir):
+            try:
+                document = load_report(path)
+            except Exception as e:
+                print(f"⚠️ Skipping {path}: {e}")
+                continue
+            index_document(path, document, index_path)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain and query the report index.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    rebuild = subparsers.add_parser("rebuild", help="Re-index every report under output/")
+    rebuild.add_argument("device_type", nargs="?")
+    latest = subparsers.add_parser("latest", help="List the most recent reports of a device type")
+    latest.add_argument("device_type")
+    latest.add_argument("-n", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.action == "rebuild":
+        print(f"🗂 Indexed {rebuild_index(args.device_type)} reports")
+    else:
+        for report in latest_reports(args.device_type, args.n):
+            print(f"{report['timestamp']}  {report['path']}")
@@ -0,0 +1,191 @@
+import glob
+import gzip
+import json
+import mmap
+import os
+
+import yaml
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # optional: only needed for the msgpack.zst format
+    msgpack = zstandard = None
+
+
+# libyaml's emitter/loader are an order of magnitude faster on multi-MB
+# strings; fall back to the pure-Python ones when PyYAML was built without it.
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Record-oriented formats store one header record (everything but the raw
+# outputs, summary included) followed by one record per device/command, so a
+# reader can stop after the first record or stream outputs one at a time.
+FORMATS = {
+    "yaml": ".yaml",
+    "jsonl": ".jsonl",
+    "jsonl.gz": ".jsonl.gz",
+    "msgpack.zst": ".msgpack.zst",
+}
+DEFAULT_FORMAT = "yaml"
+
+
+def report_format():
+    fmt = os.getenv("REPORT_FORMAT", DEFAULT_FORMAT)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown REPORT_FORMAT '{fmt}' (choose from {', '.join(FORMATS)})")
+    return fmt
+
+
+def format_of(path):
+    for fmt, extension in sorted(FORMATS.items(), key=lambda item: -len(item[1])):
+        if path.endswith(extension):
+            return fmt
+    raise ValueError(f"Unrecognised report file: {path}")
+
+
+def report_files(directory):
+    files = []
+    for extension in FORMATS.values():
+        files.extend(glob.glob(os.path.join(directory, f"*{extension}")))
+    return files
+
+
+def _require_msgpack():
+    if msgpack is None:
+        raise RuntimeError("The msgpack.zst report format needs `pip install msgpack zstandard`.")
+
+
+def _records(document):
+    header = {key: value for key, value in document.items() if key != "outputs"}
+    yield {"type": "header", **header}
+    for device, device_outputs in (document.get("outputs") or {}).items():
+        for command, output in device_outputs.items():
+            yield {"type": "output", "device": device, "command": command, "output": output}
+
+
+# --- Writing ---
+def write_report(base_path, document, fmt=None):
+    fmt = fmt or report_format()
+    path = base_path + FORMATS[fmt]
+    if fmt == "yaml":
+        with open(path, "w") as f:
+            yaml.dump(document, f, Dumper=YAML_DUMPER, default_flow_style=False, allow_unicode=True)
+    elif fmt in ("jsonl", "jsonl.gz"):
+        opener = gzip.open if fmt == "jsonl.gz" else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            for record in _records(document):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    else:
+        _require_msgpack()
+        with open(path, "wb") as raw:
+            with zstandard.ZstdCompressor(level=3).stream_writer(raw) as f:
+                packer = msgpack.Packer()
+                for record in _records(document):
+                    f.write(packer.pack(record))
+    return path
+
+
+# --- Reading ---
+def _iter_jsonl_mmap(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for line in iter(mapped.readline, b""):
+                yield json.loads(line)
+
+
+def _iter_records(path):
+    fmt = format_of(path)
+    if fmt == "yaml":
+        yield from _records(load_yaml(path))
+    elif fmt == "jsonl":
+        yield from _iter_jsonl_mmap(path)
+    elif fmt == "jsonl.gz":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    else:
+        _require_msgpack()
+        with open(path, "rb") as raw:
+            with zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                yield from msgpack.Unpacker(f, raw=False)
+
+
+def load_yaml(path):
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=YAML_LOADER) or {}
+
+
+def iter_report_records(path):
+    # The header record comes first, then one record per device/command
+    # output; a YAML report is parsed only once for both.
+    yield from _iter_records(path)
+
+
+def load_report_header(path):
+    if format_of(path) == "yaml":
+        document = load_yaml(path)
+        document.pop("outputs", None)
+        return document
+    for record in _iter_records(path):
+        record.pop("type", None)
+        return record
+    return {}
+
+
+def load_report(path):
+    if format_of(path) == "yaml":
+        return load_yaml(path)
+    document = None
+    outputs = {}
+    for record in _iter_records(path):
+        if record.pop("type", None) == "header":
+            document = record
+        else:
+            outputs.setdefault(record["device"], {})[record["command"]] = record["output"]
+    document = document or {}
+    document["outputs"] = outputs
+    return document
+
+
+# --- Migration ---
+def migrate_reports(fmt, output_dir="output", delete=False):
+    from report_index import index_document, remove_report
+    from retrieval import index_report_sections, remove_report_sections
+
+    migrated = 0
+    for device_dir in sorted(glob.glob(os.path.join(output_dir, "*"))):
+        if not os.path.isdir(device_dir):
+            continue
+        for path in sorted(report_files(device_dir)):
+            if format_of(path) == fmt:
+                continue
+            document = load_report(path)
+            base_path = path[: -len(FORMATS[format_of(path)])]
+            if os.path.exists(base_path + FORMATS[fmt]):
+                continue
+            new_path = write_report(base_path, document, fmt)
+            index_document(new_path, document)
+            index_report_sections(new_path, document)
+            remove_report(path)
+            remove_report_sections(path)
+            if delete:
+                os.remove(path)
+            migrated += 1
+            print(f"🔄 {path} -> {new_path}")
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert saved reports between storage formats.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    migrate = subparsers.add_parser("migrate", help="Rewrite every report under output/ in another format")
+    migrate.add_argument("--format", choices=sorted(FORMATS), required=True)
+    migrate.add_argument("--delete", action="store_true", help="Remove the original files after converting")
+    args = parser.parse_args()
+
+    print(f"✅ Migrated {migrate_reports(args.format, delete=args.delete)} reports to {args.format}")
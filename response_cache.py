@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_CACHE_PATH = os.path.join("cache", "mistral_responses.sqlite")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+# --- On-Disk Response Cache ---
+# Completions are keyed by a hash of everything that affects the answer
+# (model, messages, max_tokens and sampling arguments) and kept in a single
+# SQLite file, so identical prompts are answered locally across processes.
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+            db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    @staticmethod
+    def make_key(model, messages, max_tokens=None, **sampling):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "max_tokens": max_tokens, "sampling": sampling},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, db, name):
+        db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._count(db, "hits")
+                return row[0]
+            if row:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count(db, "misses")
+            return None
+
+    def put(self, key, content, model=None):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, size, now, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        db.execute(
+            "INSERT INTO stats (name, value) VALUES ('evictions', ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (evicted,),
+        )
+
+    def stats(self):
+        with self._connect() as db:
+            counters = dict(db.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": counters.get("hits", 0) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM responses")
+            db.execute("DELETE FROM stats")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                path=os.getenv("MISTRAL_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl=float(os.getenv("MISTRAL_CACHE_TTL", DEFAULT_TTL)),
+                max_bytes=int(os.getenv("MISTRAL_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _default_cache
+
+
+def cache_enabled(bypass=False):
+    return not bypass and os.getenv("MISTRAL_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+
+def print_cache_stats():
+    if not cache_enabled():
+        return
+    stats = get_response_cache().stats()
+    print(
+        f"🗄️ Response cache: {stats['hits']} hits / {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%}), {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the Mistral response cache.")
+    parser.add_argument("action", choices=["stats", "clear"])
+    args = parser.parse_args()
+    if args.action == "clear":
+        get_response_cache().clear()
+        print("🧹 Response cache cleared.")
+    else:
+        print(json.dumps(get_response_cache().stats(), indent=2))
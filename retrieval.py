@@ -0,0 +1,180 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from parsers import INTERFACE_ABBREVIATIONS, short_interface_name
+from prompt_packing import estimate_tokens
+
+
+SEARCH_PATH = os.path.join("output", "search.sqlite")
+CHUNK_CHARS = 1500
+DEFAULT_TOP_K = 8
+DEFAULT_TOKEN_BUDGET = 4000
+
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "be", "by", "can", "do", "does",
+    "for", "from", "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "the",
+    "there", "this", "to", "what", "when", "where", "which", "who", "why", "with", "you",
+}
+INTERFACE_NAME = re.compile(
+    r"\b(?:" + "|".join(re.escape(long_name) for long_name, _ in INTERFACE_ABBREVIATIONS) + r")\d[\d/.:]*",
+)
+SHORT_INTERFACE_NAME = re.compile(
+    r"\b(?:" + "|".join(sorted({re.escape(short) for _, short in INTERFACE_ABBREVIATIONS}, key=len, reverse=True))
+    + r")\d[\d/.:]*",
+    re.IGNORECASE,
+)
+
+_lock = threading.Lock()
+
+
+# --- Section Search Index ---
+# Report outputs are split into device x command x chunk rows in an SQLite
+# FTS5 table and ranked with its built-in BM25. Interface names are also
+# indexed in their short form (Ethernet1/1 -> Eth1/1) so a question can use
+# either spelling. Reports are indexed once, when saved (or on first use).
+@contextmanager
+def _connect(search_path=None):
+    search_path = search_path or SEARCH_PATH
+    os.makedirs(os.path.dirname(search_path) or ".", exist_ok=True)
+    db = sqlite3.connect(search_path, timeout=30)
+    try:
+        with db:
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+                "text, aliases, path UNINDEXED, device UNINDEXED, command UNINDEXED, part UNINDEXED)"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS indexed_reports (path TEXT PRIMARY KEY, chunks INTEGER)")
+            yield db
+    finally:
+        db.close()
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS):
+    # Split on line boundaries so a log line or table row is never cut in half.
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        if current and size + len(line) + 1 > chunk_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _aliases(text):
+    return " ".join(sorted({short_interface_name(name) for name in INTERFACE_NAME.findall(text)}))
+
+
+def _sections(document):
+    # The summary is not indexed: the troubleshooting prompt always carries it.
+    for device, device_outputs in (document.get("outputs") or {}).items():
+        for command, output in device_outputs.items():
+            if isinstance(output, str) and output:
+                yield device, command, output
+
+
+def index_report_sections(path, document, search_path=None):
+    rows = [
+        (chunk, _aliases(chunk), path, device, command, part)
+        for device, command, text in _sections(document)
+        for part, chunk in enumerate(chunk_text(text), 1)
+    ]
+    with _lock, _connect(search_path) as db:
+        db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+        db.executemany(
+            "INSERT INTO chunks (text, aliases, path, device, command, part) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        db.execute("INSERT OR REPLACE INTO indexed_reports (path, chunks) VALUES (?, ?)", (path, len(rows)))
+    return len(rows)
+
+
+def ensure_indexed(path, document=None, search_path=None):
+    with _connect(search_path) as db:
+        if db.execute("SELECT 1 FROM indexed_reports WHERE path = ?", (path,)).fetchone():
+            return
+    if document is None:
+        from report_store import load_report
+        document = load_report(path)
+    index_report_sections(path, document, search_path)
+
+
+def remove_report_sections(path, search_path=None):
+    with _lock, _connect(search_path) as db:
+        db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+        db.execute("DELETE FROM indexed_reports WHERE path = ?", (path,))
+
+
+# --- Querying ---
+def build_query(question):
+    terms = set()
+    for name in INTERFACE_NAME.findall(question):
+        terms.add(short_interface_name(name))
+    for name in SHORT_INTERFACE_NAME.findall(question):
+        terms.add(name)
+    for word in re.findall(r"[A-Za-z0-9_]+", question):
+        if word.lower() not in STOPWORDS and len(word) > 1:
+            terms.add(word)
+    # Every term is quoted, so FTS5 operators in the question are taken literally.
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in sorted(terms))
+
+
+def search(question, path=None, k=None, token_budget=None, search_path=None):
+    k = k or int(os.getenv("RETRIEVAL_TOP_K", DEFAULT_TOP_K))
+    token_budget = token_budget or int(os.getenv("RETRIEVAL_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    query = build_query(question)
+    rows = []
+    with _connect(search_path) as db:
+        if query:
+            sql = (
+                "SELECT device, command, part, text, bm25(chunks) FROM chunks WHERE chunks MATCH ?"
+                + (" AND path = ?" if path else "")
+                + " ORDER BY bm25(chunks) LIMIT ?"
+            )
+            rows = db.execute(sql, (query, path, k * 4) if path else (query, k * 4)).fetchall()
+        if not rows and path:
+            # Nothing matched (e.g. "anything wrong?"): fall back to the start
+            # of every section so the model still sees a spread of outputs.
+            rows = db.execute(
+                "SELECT device, command, part, text, 0 FROM chunks WHERE path = ? AND part = 1",
+                (path,),
+            ).fetchall()
+
+    selected, used = [], 0
+    for device, command, part, text, score in rows:
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        selected.append({"device": device, "command": command, "part": part, "text": text, "score": -score})
+        used += tokens
+        if len(selected) >= k:
+            break
+    return selected
+
+
+def format_excerpts(excerpts):
+    if not excerpts:
+        return "No matching device output found."
+    return "\n\n".join(
+        f"#### {excerpt['device']} / {excerpt['command']} (part {excerpt['part']}) ####\n{excerpt['text']}"
+        for excerpt in excerpts
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search saved report sections.")
+    parser.add_argument("question")
+    parser.add_argument("--path", help="Only search this report (indexed on demand)")
+    parser.add_argument("-k", type=int, default=DEFAULT_TOP_K)
+    args = parser.parse_args()
+
+    if args.path:
+        ensure_indexed(args.path)
+    for excerpt in search(args.question, args.path, args.k):
+        print(f"[{excerpt['score']:.2f}] {excerpt['device']} / {excerpt['command']} (part {excerpt['part']})")
@@ -0,0 +1,421 @@
+import argparse
+import bisect
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from collector import collect_fleet, load_collection_settings
+
+
+DEFAULT_REPLICAS = 64
+HEARTBEAT_INTERVAL = 5
+
+
+# --- Shard Settings (overridable from .env) ---
+def load_shard_settings():
+    return {
+        "workers": int(os.getenv("SHARD_WORKERS", os.cpu_count() or 2)),
+        "address": os.getenv("SHARD_BROKER_ADDR", "127.0.0.1:0"),
+        "shard_key": os.getenv("SHARD_KEY", "site"),
+        "token": os.getenv("SHARD_TOKEN") or None,
+        "worker_timeout": float(os.getenv("SHARD_WORKER_TIMEOUT", 20)),
+    }
+
+
+def _parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port or 0)
+
+
+# --- Consistent Hashing ---
+# Each worker owns many points on the ring, and a shard goes to the first
+# point after its key's hash. Adding or removing a worker only moves the
+# shards whose point it owned; everything else stays where it was.
+class HashRing:
+    def __init__(self, replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self.nodes = set()
+        self._points = []
+        self._owners = {}
+
+    @staticmethod
+    def _hash(value):
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            point = self._hash(f"{node}#{replica}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        self._points = [point for point in self._points if self._owners[point] != node]
+        self._owners = {point: owner for point, owner in self._owners.items() if owner != node}
+
+    def node_for(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+# --- Running Shards (shared by workers and the coordinator's fallback) ---
+# A task carries the devices of one shard plus what they need from the
+# coordinator's side: previous outputs for commands that are not due and the
+# command run log. The result is plain JSON, merged per device_type later.
+def collect_shards(tasks):
+    from mistral import collect_device_info
+    from command_plans import get_run_log
+
+    run_log = get_run_log()
+    devices_by_type, previous, owners = {}, {}, {}
+    for task in tasks:
+        for device in task["devices"]:
+            devices_by_type.setdefault(task["device_type"], []).append(device)
+            previous[device["name"]] = task["previous"].get(device["name"])
+            owners[device["name"]] = task["shard"]
+        run_log.merge(task["last_runs"])
+
+    fleet_outputs, timing = collect_fleet(
+        devices_by_type,
+        collect_fn=lambda device, deadline: collect_device_info(
+            device, deadline=deadline, previous=previous.get(device["name"])
+        ),
+        **load_collection_settings(),
+    )
+
+    results = {
+        task["shard"]: {"outputs": {}, "timing": [], "run_log": {}}
+        for task in tasks
+    }
+    for device_type, outputs in fleet_outputs.items():
+        for name, device_outputs in outputs.items():
+            results[owners[name]]["outputs"][name] = device_outputs
+            results[owners[name]]["run_log"][name] = run_log.last_runs(name)
+    for entry in timing["devices"]:
+        results[owners[entry["device"]]]["timing"].append(entry)
+    return results
+
+
+# --- Broker (one JSON request per line over TCP) ---
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not hmac.compare_digest(str(request.get("token", "")), coordinator.token):
+                    reply = {"error": "bad token"}
+                else:
+                    reply = coordinator.handle(request)
+            except Exception as e:
+                reply = {"error": str(e)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+class _BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class BrokerClient:
+    def __init__(self, address, token, timeout=60):
+        self.token = token
+        self._socket = socket.create_connection(_parse_address(address), timeout=timeout)
+        self._file = self._socket.makefile("rwb")
+        self._lock = threading.Lock()
+
+    def call(self, op, **fields):
+        with self._lock:
+            self._file.write(json.dumps({"op": op, "token": self.token, **fields}).encode() + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise ConnectionError("broker closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def close(self):
+        self._socket.close()
+
+
+# --- Coordinator ---
+# Splits each device type's inventory into shards (devices sharing a
+# SHARD_KEY value, e.g. a site; devices without one are their own shard) and
+# hands each shard to the worker that owns its key on the hash ring. Workers
+# pull their shards through the broker and push the results back. A worker
+# that stops heartbeating (or whose local process exits) is dropped from the
+# ring and its unfinished shards go to whoever owns them now; with no
+# workers left the coordinator collects the remaining shards itself.
+class ShardCoordinator:
+    def __init__(self, settings=None):
+        self.settings = settings or load_shard_settings()
+        self.token = self.settings["token"] or secrets.token_hex(16)
+        self.ring = HashRing()
+        self.workers = {}
+        self.processes = {}
+        self.shards = {}
+        self.submitted = {}
+        self.previous = {}
+        self.last_runs = {}
+        self.address = None
+        self._cond = threading.Condition()
+        self._closing = False
+        self._orphaned_since = None
+        self._started_at = None
+        self._server = None
+
+    def start(self):
+        self._server = _BrokerServer(_parse_address(self.settings["address"]), _BrokerHandler)
+        self._server.coordinator = self
+        host, port = self._server.server_address[:2]
+        self.address = f"{host}:{port}"
+        threading.Thread(target=self._server.serve_forever, name="shard-broker", daemon=True).start()
+        threading.Thread(target=self._monitor, name="shard-monitor", daemon=True).start()
+
+        connect = f"{'127.0.0.1' if host in ('0.0.0.0', '') else host}:{port}"
+        self._started_at = time.monotonic()
+        for n in range(self.settings["workers"]):
+            worker_id = f"local-{n}"
+            self.processes[worker_id] = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "worker", "--connect", connect, "--id", worker_id],
+                env={**os.environ, "SHARD_TOKEN": self.token},
+            )
+        print(f"🧩 Shard broker on {self.address} with {len(self.processes)} local workers")
+        if self.settings["token"]:
+            print(f"   More workers: SHARD_TOKEN=<same token> python sharding.py worker --connect {connect}")
+        return self
+
+    def submit(self, device_type, devices, previous=None, last_runs=None):
+        previous, last_runs = previous or {}, last_runs or {}
+        shard_key = self.settings["shard_key"]
+        with self._cond:
+            self.submitted[device_type] = (devices, time.monotonic())
+            for device in devices:
+                self.previous[device["name"]] = previous.get(device["name"]) or {}
+                self.last_runs[device["name"]] = last_runs.get(device["name"]) or {}
+                key = str(device.get(shard_key) or device["name"])
+                shard_id = f"{device_type}/{key}"
+                shard = self.shards.setdefault(shard_id, {
+                    "device_type": device_type, "key": key, "devices": [],
+                    "status": "pending", "worker": None, "result": None,
+                })
+                shard["devices"].append(device)
+            count = sum(1 for shard in self.shards.values() if shard["device_type"] == device_type)
+            self._cond.notify_all()
+        print(f"🧩 {device_type}: {len(devices)} devices in {count} shards")
+
+    def _task(self, shard_id, shard):
+        return {
+            "shard": shard_id,
+            "device_type": shard["device_type"],
+            "devices": shard["devices"],
+            "previous": {device["name"]: self.previous[device["name"]] for device in shard["devices"]},
+            "last_runs": {device["name"]: self.last_runs[device["name"]] for device in shard["devices"]},
+        }
+
+    # --- broker requests ---
+    def handle(self, request):
+        op, worker = request.get("op"), request.get("worker")
+        if op in ("register", "heartbeat"):
+            self._seen(worker, request)
+            return {"ok": True, "heartbeat": HEARTBEAT_INTERVAL}
+        if op == "next":
+            return self._next(worker)
+        if op == "submit":
+            return {"accepted": self._submit(worker, request["shard"], request["result"])}
+        return {"error": f"unknown op {op!r}"}
+
+    def _seen(self, worker, request=None):
+        with self._cond:
+            if worker not in self.workers:
+                host = (request or {}).get("host", "?")
+                print(f"🧩 Worker {worker} joined from {host}")
+                self.workers[worker] = {"host": host, "last_seen": time.monotonic()}
+                self.ring.add(worker)
+                self._orphaned_since = None
+                self._cond.notify_all()
+            self.workers[worker]["last_seen"] = time.monotonic()
+
+    def _starting(self):
+        # Local workers that are still importing; until they register (or the
+        # grace period ends) the ring is incomplete and the first worker in
+        # would own every shard.
+        if time.monotonic() - self._started_at > self.settings["worker_timeout"]:
+            return False
+        return any(
+            worker not in self.workers and process.poll() is None
+            for worker, process in self.processes.items()
+        )
+
+    def _next(self, worker, wait=1.0):
+        self._seen(worker)
+        with self._cond:
+            deadline = time.monotonic() + wait
+            while True:
+                # Ownership is looked up on every request, so shards follow the
+                # ring as workers join and leave.
+                owned = [] if self._starting() else [
+                    (shard_id, shard) for shard_id, shard in self.shards.items()
+                    if shard["status"] == "pending" and self.ring.node_for(shard["key"]) == worker
+                ]
+                if owned or self._closing or time.monotonic() >= deadline:
+                    break
+                self._cond.wait(deadline - time.monotonic())
+            for _, shard in owned:
+                shard["status"], shard["worker"] = "running", worker
+        if owned:
+            print(f"🧩 {worker} took {len(owned)} shards: {', '.join(shard_id for shard_id, _ in owned)}")
+        return {"tasks": [self._task(shard_id, shard) for shard_id, shard in owned], "done": self._closing}
+
+    def _submit(self, worker, shard_id, result):
+        from command_plans import get_run_log
+
+        with self._cond:
+            shard = self.shards.get(shard_id)
+            # A worker that was given up on may still finish; the first result wins.
+            if shard is None or shard["status"] == "done":
+                return False
+            shard["status"], shard["worker"], shard["result"] = "done", worker, result
+            self._cond.notify_all()
+        get_run_log().merge(result["run_log"])
+        return True
+
+    # --- failure handling ---
+    def _drop(self, worker, reason):
+        with self._cond:
+            if worker not in self.workers:
+                return
+            del self.workers[worker]
+            self.ring.remove(worker)
+            moved = 0
+            for shard in self.shards.values():
+                if shard["status"] == "running" and shard["worker"] == worker:
+                    shard["status"], shard["worker"] = "pending", None
+                    moved += 1
+            self._cond.notify_all()
+        print(f"💀 Worker {worker} lost ({reason}); rebalancing {moved} running shards over {len(self.ring.nodes)} workers")
+
+    def _monitor(self):
+        while True:
+            time.sleep(1)
+            if self._closing:
+                return
+            now = time.monotonic()
+            for worker, info in list(self.workers.items()):
+                process = self.processes.get(worker)
+                if process is not None and process.poll() is not None:
+                    self._drop(worker, f"exit code {process.returncode}")
+                elif now - info["last_seen"] > self.settings["worker_timeout"]:
+                    self._drop(worker, "no heartbeat")
+
+            with self._cond:
+                pending = [item for item in self.shards.items() if item[1]["status"] == "pending"]
+                starting = any(process.poll() is None for process in self.processes.values())
+                if not pending or self.ring.nodes or starting:
+                    self._orphaned_since = None
+                    continue
+                self._orphaned_since = self._orphaned_since or now
+                if now - self._orphaned_since < self.settings["worker_timeout"]:
+                    continue
+                for _, shard in pending:
+                    shard["status"], shard["worker"] = "running", "coordinator"
+                tasks = [self._task(shard_id, shard) for shard_id, shard in pending]
+            print(f"⚠️ No shard workers left; collecting {len(tasks)} shards in the coordinator")
+            for shard_id, result in collect_shards(tasks).items():
+                self._submit("coordinator", shard_id, result)
+
+    # --- results ---
+    def collect(self, device_type):
+        # Blocks until every shard of `device_type` is in, then merges them
+        # back into inventory order, like collect_fleet's return value.
+        with self._cond:
+            devices, submitted_at = self.submitted[device_type]
+            shards = [shard for shard in self.shards.values() if shard["device_type"] == device_type]
+            self._cond.wait_for(lambda: all(shard["status"] == "done" for shard in shards))
+        return merge_results(devices, [shard["result"] for shard in shards], time.monotonic() - submitted_at)
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def merge_results(devices, results, wall_seconds):
+    outputs, timings = {}, []
+    for result in results:
+        outputs.update(result["outputs"])
+        timings.extend(result["timing"])
+    merged = {device["name"]: outputs.get(device["name"], {"error": "Not collected"}) for device in devices}
+    return merged, {"wall_seconds": wall_seconds, "devices": timings}
+
+
+# --- Worker ---
+def run_worker(address, token, worker_id=None):
+    from ssh_pool import get_ssh_pool
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    client = BrokerClient(address, token)
+    client.call("register", worker=worker_id, host=socket.gethostname(), pid=os.getpid())
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                client.call("heartbeat", worker=worker_id)
+            except Exception:
+                stop.set()
+
+    threading.Thread(target=heartbeat, name="shard-heartbeat", daemon=True).start()
+    try:
+        while not stop.is_set():
+            reply = client.call("next", worker=worker_id)
+            if reply["done"]:
+                break
+            if not reply["tasks"]:
+                continue
+            for shard_id, result in collect_shards(reply["tasks"]).items():
+                client.call("submit", worker=worker_id, shard=shard_id, result=result)
+    except (ConnectionError, OSError) as e:
+        print(f"⚠️ Shard worker {worker_id} lost the broker: {e}")
+    finally:
+        stop.set()
+        client.close()
+        get_ssh_pool().close_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shard worker for sharded collection (see mistral.py --sharded).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Pull shards from a coordinator and collect them")
+    worker_parser.add_argument("--connect", required=True, help="Broker address (host:port)")
+    worker_parser.add_argument("--id", help="Worker name (defaults to host-pid)")
+    args = parser.parse_args()
+
+    token = os.getenv("SHARD_TOKEN")
+    if not token:
+        sys.exit("❌ SHARD_TOKEN must be set to the coordinator's token")
+    run_worker(args.connect, token, args.id)
@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import contextmanager
+from stream_reader import read_channel
+from tracing import span
+
+
+DEFAULT_IDLE_TIMEOUT = 300
+
+
+# --- Pooled SSH Sessions ---
+# One authenticated Transport per device; every command runs on its own channel
+# over that Transport, so a device is only handshaked (and AAA'd) once per
+# idle window instead of once per command. Sessions with a command running
+# are counted as checked out and are never evicted as idle.
+class SSHSessionPool:
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, connect_timeout=3):
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._sessions = {}
+        self._in_use = {}
+        self._device_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(device):
+        return (device["ip"], device.get("port", 22), device["username"])
+
+    def _device_lock(self, key):
+        with self._lock:
+            if key not in self._device_locks:
+                self._device_locks[key] = threading.Lock()
+            return self._device_locks[key]
+
+    def _connect(self, device, timeout):
+        import paramiko  # loaded on first connect, not by every command that imports the pool
+
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            with span("ssh.connect", device=device.get("name", device["ip"]), ip=device["ip"]):
+                client.connect(
+                    device["ip"],
+                    port=device.get("port", 22),
+                    username=device["username"],
+                    password=device["password"],
+                    timeout=timeout,
+                    banner_timeout=timeout,
+                    auth_timeout=timeout,
+                    look_for_keys=False,
+                    allow_agent=False,
+                )
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    def get(self, device, timeout=None):
+        timeout = timeout or self.connect_timeout
+        key = self._key(device)
+        self.evict_idle()
+        with self._device_lock(key):
+            with self._lock:
+                session = self._sessions.get(key)
+            if session:
+                client, _ = session
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    with self._lock:
+                        self._sessions[key] = (client, time.monotonic())
+                    return client
+                self.evict(device)
+
+            client = self._connect(device, timeout)
+            with self._lock:
+                self._sessions[key] = (client, time.monotonic())
+            return client
+
+    def is_reachable(self, device, timeout=None):
+        try:
+            self.get(device, timeout)
+            return True
+        except Exception:
+            return False
+
+    def open_channel(self, device, timeout=None):
+        import paramiko
+
+        timeout = timeout or self.connect_timeout
+        try:
+            channel = self.get(device, timeout).get_transport().open_session(timeout=timeout)
+        except (paramiko.SSHException, EOFError, OSError, AttributeError):
+            # The pooled Transport died between uses; reconnect once.
+            self.evict(device)
+            channel = self.get(device, timeout).get_transport().open_session(timeout=timeout)
+        channel.settimeout(timeout)
+        return channel
+
+    @contextmanager
+    def _checked_out(self, device):
+        key = self._key(device)
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+                session = self._sessions.get(key)
+                if session:
+                    self._sessions[key] = (session[0], time.monotonic())
+
+    def run_command(self, device, command, timeout=3, **read_options):
+        with self._checked_out(device):
+            with span("ssh.command", device=device.get("name", device["ip"]), command=command) as command_span:
+                channel = self.open_channel(device, timeout)
+                try:
+                    channel.exec_command(command)
+                    output = read_channel(channel, **read_options)
+                    command_span.set(bytes=len(output))
+                    return output
+                finally:
+                    channel.close()
+
+    def run_shell(self, device, lines, timeout=3, **read_options):
+        # Types `lines` into one interactive shell on the pooled Transport and
+        # returns everything the device printed until the session closed, so
+        # the last line should end the session (e.g. "exit").
+        with self._checked_out(device):
+            with span("ssh.shell", device=device.get("name", device["ip"]), lines=len(lines)) as shell_span:
+                channel = self.open_channel(device, timeout)
+                try:
+                    # A wide terminal keeps the device from wrapping long lines.
+                    channel.get_pty(width=511)
+                    channel.invoke_shell()
+                    channel.sendall("".join(line + "\n" for line in lines).encode())
+                    output = read_channel(channel, **read_options)
+                    shell_span.set(bytes=len(output))
+                    return output
+                finally:
+                    channel.close()
+
+    def evict(self, device):
+        with self._lock:
+            session = self._sessions.pop(self._key(device), None)
+        if session:
+            session[0].close()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                key for key, (_, last_used) in self._sessions.items()
+                if now - last_used > self.idle_timeout and key not in self._in_use
+            ]
+            clients = [self._sessions.pop(key)[0] for key in expired]
+        for client in clients:
+            client.close()
+
+    def close_all(self):
+        with self._lock:
+            clients = [client for client, _ in self._sessions.values()]
+            self._sessions.clear()
+        for client in clients:
+            client.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_ssh_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SSHSessionPool()
+        return _default_pool
@@ -0,0 +1,132 @@
+import codecs
+import os
+from collections import deque
+
+
+CHUNK_SIZE = 32768
+# With a spill file and no other cap, only this much of the output (half from
+# the start, half from the end) is kept in memory; the rest is in the file.
+SPILL_KEEP_BYTES = int(os.getenv("OUTPUT_SPILL_KEEP_BYTES", "131072"))
+
+
+# --- Streaming Channel Reader ---
+# Pulls command output off an SSH channel in fixed-size chunks and decodes it
+# incrementally, so only the retained part of the output is ever held in
+# memory:
+#   * max_bytes  - keep at most this many bytes from the start of the output
+#   * tail_lines - keep only the last N lines (e.g. for `show logging`)
+#   * spill_path - stream the complete raw output to this file as it arrives;
+#                  without another cap, keep only its head and tail in memory
+def read_channel(channel, max_bytes=None, tail_lines=None, spill_path=None, chunk_size=CHUNK_SIZE):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    spill = None
+    if spill_path:
+        os.makedirs(os.path.dirname(spill_path) or ".", exist_ok=True)
+        spill = open(spill_path, "wb")
+
+    pieces = []
+    tail = deque(maxlen=tail_lines) if tail_lines else None
+    tail_bytes = None
+    if spill and tail is None and max_bytes is None:
+        max_bytes = SPILL_KEEP_BYTES // 2
+        tail_bytes = bytearray()
+    partial_line = ""
+    kept = 0
+    total = 0
+    lines_seen = 0
+    stopped_early = False
+    try:
+        while True:
+            data = channel.recv(chunk_size)
+            if not data:
+                break
+            total += len(data)
+            if spill:
+                spill.write(data)
+
+            if tail is not None:
+                lines = (partial_line + decoder.decode(data)).split("\n")
+                partial_line = lines.pop()
+                lines_seen += len(lines)
+                tail.extend(lines)
+                continue
+
+            if max_bytes is not None:
+                head = data[:max(0, max_bytes - kept)]
+                if tail_bytes is not None:
+                    tail_bytes += data[len(head):]
+                    overflow = len(tail_bytes) - SPILL_KEEP_BYTES // 2
+                    if overflow > 0:
+                        del tail_bytes[:overflow]
+                data = head
+            if data:
+                kept += len(data)
+                pieces.append(decoder.decode(data))
+            elif not spill:
+                # Cap reached and nothing is spilling: stop pulling from the device.
+                stopped_early = True
+                break
+    finally:
+        if spill:
+            spill.close()
+
+    if tail is not None:
+        partial_line += decoder.decode(b"", final=True)
+        if partial_line:
+            tail.append(partial_line)
+            lines_seen += 1
+        text = "\n".join(tail)
+        if lines_seen > len(tail):
+            text = f"... [showing last {len(tail)} of {lines_seen} lines]\n" + text
+        return text
+
+    if tail_bytes is not None and total - kept == len(tail_bytes):
+        # Nothing was dropped between head and tail: decode them as one.
+        kept += len(tail_bytes)
+        pieces.append(decoder.decode(bytes(tail_bytes)))
+        tail_bytes = None
+    pieces.append(decoder.decode(b"", final=True))
+    text = "".join(pieces)
+    if tail_bytes is not None:
+        return _spilled(text, tail_bytes, total - kept - len(tail_bytes), spill_path)
+    if total > kept:
+        more = "+" if stopped_early else ""
+        text += f"\n... [truncated: kept {kept} of {total}{more} bytes]"
+    return text
+
+
+def _spilled(head, tail_bytes, omitted, spill_path):
+    # The tail may start inside a multi-byte character; skip to the next one.
+    tail_bytes = bytes(tail_bytes).lstrip(bytes(range(0x80, 0xC0)))
+    tail = tail_bytes.decode("utf-8", errors="replace")
+    return f"{head}\n... [{omitted} bytes omitted; full output in {spill_path}]\n{tail}"
+
+
+# --- Caps for Output Read in One Piece ---
+# Batched commands share one channel, so their caps can only be applied after
+# the combined output has been split; the notes match read_channel's.
+def cap_text(text, max_bytes=None, tail_lines=None, spill_path=None):
+    if spill_path:
+        os.makedirs(os.path.dirname(spill_path) or ".", exist_ok=True)
+        with open(spill_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        if not tail_lines and max_bytes is None:
+            data = text.encode("utf-8")
+            half = SPILL_KEEP_BYTES // 2
+            if len(data) > 2 * half:
+                head = data[:half].decode("utf-8", errors="ignore")
+                return _spilled(head, data[-half:], len(data) - 2 * half, spill_path)
+            return text
+    if tail_lines:
+        lines = text.split("\n")
+        if text.endswith("\n"):
+            lines.pop()
+        if len(lines) > tail_lines:
+            return f"... [showing last {tail_lines} of {len(lines)} lines]\n" + "\n".join(lines[-tail_lines:])
+        return "\n".join(lines)
+    if max_bytes is not None:
+        data = text.encode("utf-8")
+        if len(data) > max_bytes:
+            kept = data[:max_bytes].decode("utf-8", errors="ignore")
+            return kept + f"\n... [truncated: kept {max_bytes} of {len(data)} bytes]"
+    return text
@@ -0,0 +1,337 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from parsers import parse_output, short_interface_name
+
+
+METRICS_DIR = "metrics"
+
+# Counters only ever grow (until a reload or `clear counters`), so trends are
+# reported as deltas/rates; gauges are reported as first -> last values.
+COUNTERS = {"crc", "in_errors", "out_errors", "resets"}
+INTERFACE_METRICS = ["crc", "in_errors", "out_errors", "resets", "in_rate_bps", "out_rate_bps"]
+LOG_SEVERITY = re.compile(r"%[A-Z0-9_]+-([0-7])-[A-Z0-9_]+")
+
+RAW_RETENTION = 7 * 86400
+ROLLUP_SECONDS = 3600
+RETENTION = 90 * 86400
+COMPACT_EVERY = 86400
+
+_lock = threading.Lock()
+
+
+# --- Metric Extraction ---
+def extract_metrics(platform, outputs):
+    samples = []
+    for device, device_outputs in outputs.items():
+        interfaces = parse_output(platform, "show interface", device_outputs.get("show interface")) or []
+        for record in interfaces:
+            entity = short_interface_name(record.name)
+            for metric in INTERFACE_METRICS:
+                value = getattr(record, metric)
+                if value is not None:
+                    samples.append((device, entity, metric, value))
+            samples.append((device, entity, "up", 1 if record.state == "up" else 0))
+
+        for pool in parse_output(platform, "show memory", device_outputs.get("show memory")) or []:
+            samples.append((device, pool.pool, "memory_used", pool.used))
+            samples.append((device, pool.pool, "memory_util", round(pool.utilization, 4)))
+
+        # Counted over whatever part of the log the scan kept (e.g. its last
+        # 500 lines), so these are gauges of the window, not running totals.
+        log = device_outputs.get("show logging")
+        if isinstance(log, str):
+            counts = [0] * 8
+            for match in LOG_SEVERITY.finditer(log):
+                counts[int(match.group(1))] += 1
+            for severity, count in enumerate(counts):
+                samples.append((device, "log", f"sev{severity}_messages", count))
+    return samples
+
+
+# --- Columnar Store ---
+# One directory per device type with three append-only column files
+# (timestamps, series ids, values as raw C arrays, 20 bytes per sample) and a
+# small JSON catalogue mapping series ids to "device|entity|metric" keys.
+# Reads load whole columns with array.fromfile, which is a single memcpy.
+class MetricStore:
+    COLUMNS = (("ts", "d"), ("series", "I"), ("value", "d"))
+
+    def __init__(self, device_type, root=METRICS_DIR):
+        self.device_type = device_type
+        self.path = os.path.join(root, device_type)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, f"{name}.col")
+
+    def _catalog_path(self):
+        return os.path.join(self.path, "series.json")
+
+    def _load_catalog(self):
+        try:
+            with open(self._catalog_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"series": [], "compacted_at": 0}
+
+    def _save_catalog(self, catalog):
+        tmp = self._catalog_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(catalog, f)
+        os.replace(tmp, self._catalog_path())
+
+    def append(self, timestamp, samples):
+        if not samples:
+            return 0
+        with _lock:
+            os.makedirs(self.path, exist_ok=True)
+            catalog = self._load_catalog()
+            ids = {key: index for index, key in enumerate(catalog["series"])}
+            columns = {name: array(code) for name, code in self.COLUMNS}
+            for device, entity, metric, value in samples:
+                key = f"{device}|{entity}|{metric}"
+                if key not in ids:
+                    ids[key] = len(catalog["series"])
+                    catalog["series"].append(key)
+                columns["ts"].append(timestamp)
+                columns["series"].append(ids[key])
+                columns["value"].append(float(value))
+            self._save_catalog(catalog)
+            self._truncate_uneven_locked()
+            for name, _ in self.COLUMNS:
+                with open(self._column_path(name), "ab") as f:
+                    columns[name].tofile(f)
+            if timestamp - catalog.get("compacted_at", 0) > COMPACT_EVERY:
+                self._compact_locked(catalog, timestamp)
+        return len(samples)
+
+    def _truncate_uneven_locked(self):
+        # A crash between column writes leaves the files at different row
+        # counts; cut them back to the common length so new rows line up.
+        sizes = {}
+        for name, code in self.COLUMNS:
+            path = self._column_path(name)
+            sizes[name] = os.path.getsize(path) // array(code).itemsize if os.path.exists(path) else 0
+        rows = min(sizes.values())
+        for name, code in self.COLUMNS:
+            path = self._column_path(name)
+            if os.path.exists(path) and os.path.getsize(path) != rows * array(code).itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * array(code).itemsize)
+
+    def _read_columns(self):
+        columns = {}
+        for name, code in self.COLUMNS:
+            column = array(code)
+            path = self._column_path(name)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size // column.itemsize
+                    column.fromfile(f, size)
+            columns[name] = column
+        # A crash between column writes leaves them uneven; ignore the tail.
+        length = min(len(column) for column in columns.values())
+        return {name: column[:length] for name, column in columns.items()}
+
+    # --- Downsampling and Retention ---
+    def compact(self, now=None):
+        with _lock:
+            return self._compact_locked(self._load_catalog(), now or time.time())
+
+    def _compact_locked(self, catalog, now):
+        columns = self._read_columns()
+        raw_cutoff, drop_cutoff = now - RAW_RETENTION, now - RETENTION
+        kept = {name: array(code) for name, code in self.COLUMNS}
+        buckets = {}
+        for ts, series, value in zip(columns["ts"], columns["series"], columns["value"]):
+            if ts < drop_cutoff:
+                continue
+            if ts >= raw_cutoff:
+                kept["ts"].append(ts)
+                kept["series"].append(series)
+                kept["value"].append(value)
+                continue
+            # Older points keep one sample per series per rollup bucket: the
+            # last one, which for counters is exact and for gauges is close enough.
+            buckets[(series, int(ts // ROLLUP_SECONDS))] = (ts, value)
+        rolled = sorted((ts, series, value) for (series, _), (ts, value) in buckets.items())
+        rolled_columns = dict(zip(("ts", "series", "value"), zip(*rolled))) if rolled else {}
+        before = len(columns["ts"])
+        for name, code in self.COLUMNS:
+            column = array(code, rolled_columns.get(name, ()))
+            column.extend(kept[name])
+            tmp = self._column_path(name) + ".tmp"
+            with open(tmp, "wb") as f:
+                column.tofile(f)
+            os.replace(tmp, self._column_path(name))
+        catalog["compacted_at"] = now
+        self._save_catalog(catalog)
+        return before - len(rolled) - len(kept["ts"])
+
+    # --- Queries ---
+    def query(self, device=None, entity=None, metric=None, start=None, end=None):
+        catalog = self._load_catalog()
+        wanted = {
+            index for index, key in enumerate(catalog["series"])
+            if _key_matches(key, device, entity, metric)
+        }
+        if not wanted:
+            return {}
+        columns = self._read_columns()
+        start = start if start is not None else float("-inf")
+        end = end if end is not None else float("inf")
+        series = {}
+        for ts, series_id, value in zip(columns["ts"], columns["series"], columns["value"]):
+            if series_id in wanted and start <= ts <= end:
+                points = series.setdefault(catalog["series"][series_id], ([], []))
+                points[0].append(ts)
+                points[1].append(value)
+        return series
+
+
+def _key_matches(key, device, entity, metric):
+    key_device, key_entity, key_metric = key.split("|")
+    return (
+        (device is None or key_device == device)
+        and (entity is None or key_entity == entity or key_entity == short_interface_name(entity))
+        and (metric is None or key_metric == metric)
+    )
+
+
+def series_delta(metric, timestamps, values):
+    # Counter resets (value drops) restart the accumulation from the new value.
+    if metric in COUNTERS:
+        delta = 0.0
+        for before, after in zip(values, values[1:]):
+            delta += after - before if after >= before else after
+    else:
+        delta = values[-1] - values[0]
+    seconds = timestamps[-1] - timestamps[0]
+    return {
+        "first": values[0],
+        "last": values[-1],
+        "delta": delta,
+        "per_hour": delta / seconds * 3600 if seconds > 0 else 0.0,
+        "samples": len(values),
+        "since": timestamps[0],
+    }
+
+
+def deltas(device_type, device=None, entity=None, metric=None, start=None, end=None, root=METRICS_DIR):
+    return {
+        key: series_delta(key.rsplit("|", 1)[1], timestamps, values)
+        for key, (timestamps, values) in MetricStore(device_type, root).query(device, entity, metric, start, end).items()
+    }
+
+
+# --- Feeding and Prompt Context ---
+def record_scan(device_type, outputs, timestamp=None, root=METRICS_DIR):
+    return MetricStore(device_type, root).append(timestamp or time.time(), extract_metrics(device_type, outputs))
+
+
+def trend_context(device_type, devices=None, window=RAW_RETENTION, limit=40, root=METRICS_DIR):
+    now = time.time()
+    lines = []
+    for key, stats in deltas(device_type, start=now - window, root=root).items():
+        device, entity, metric = key.split("|")
+        if (devices and device not in devices) or stats["samples"] < 2:
+            continue
+        if metric in COUNTERS:
+            if stats["delta"] <= 0:
+                continue
+            line = f"{device} {entity} {metric} +{stats['delta']:.0f} ({stats['per_hour']:.2f}/h)"
+        elif metric.endswith("_messages"):
+            if stats["delta"] <= 0:
+                continue
+            severity = metric.split("_")[0]
+            line = (
+                f"{device} {severity} messages in the log window {stats['first']:.0f} -> {stats['last']:.0f}"
+            )
+        elif metric == "memory_util":
+            if abs(stats["delta"]) < 0.05:
+                continue
+            line = f"{device} {entity} memory {stats['first']:.0%} -> {stats['last']:.0%}"
+        elif metric == "up":
+            if stats["delta"] == 0:
+                continue
+            line = f"{device} {entity} went {'up' if stats['delta'] > 0 else 'down'}"
+        else:
+            continue
+        lines.append((abs(stats["per_hour"]), f"{line} since {datetime.fromtimestamp(stats['since']):%Y-%m-%d %H:%M}"))
+    lines.sort(reverse=True)
+    return "\n".join(line for _, line in lines[:limit])
+
+
+def trends_enabled():
+    return os.getenv("TREND_CONTEXT", "on").lower() not in ("0", "off", "false", "no")
+
+
+def backfill(device_type=None, root=METRICS_DIR):
+    from report_index import OUTPUT_DIR, reports_between
+    from report_store import load_report
+
+    count = 0
+    for device_dir in sorted(glob.glob(os.path.join(OUTPUT_DIR, device_type or "*"))):
+        if not os.path.isdir(device_dir):
+            continue
+        dtype = os.path.basename(device_dir)
+        for report in reports_between(dtype):
+            timestamp = datetime.strptime(report["timestamp"], "%Y-%m-%d_%H-%M-%S").timestamp()
+            record_scan(dtype, load_report(report["path"]).get("outputs") or {}, timestamp, root)
+            count += 1
+    return count
+
+
+def _parse_since(value):
+    if value is None:
+        return None
+    units = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if value[-1] in units and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * units[value[-1]]
+    return datetime.fromisoformat(value).timestamp()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query device metric trends extracted from saved scans.")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    for name, help_text in (("query", "Print raw samples"), ("deltas", "Print per-series delta and rate")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument("device_type")
+        sub.add_argument("--device")
+        sub.add_argument("--entity", help="Interface (e.g. Eth1/1), memory pool, or 'log'")
+        sub.add_argument("--metric", help="e.g. crc, in_errors, memory_util, sev2_messages")
+        sub.add_argument("--since", default="7d", help="7d, 12h, 30m or an ISO timestamp")
+    trends = subparsers.add_parser("trends", help="Print the trend context given to the LLM")
+    trends.add_argument("device_type")
+    compact = subparsers.add_parser("compact", help="Downsample old samples and apply retention")
+    compact.add_argument("device_type")
+    fill = subparsers.add_parser("backfill", help="Load metrics from every existing report")
+    fill.add_argument("device_type", nargs="?")
+    args = parser.parse_args()
+
+    if args.action == "query":
+        for key, (timestamps, values) in sorted(
+            MetricStore(args.device_type).query(args.device, args.entity, args.metric, _parse_since(args.since)).items()
+        ):
+            print(key)
+            for ts, value in zip(timestamps, values):
+                print(f"   {datetime.fromtimestamp(ts):%Y-%m-%d %H:%M:%S}  {value:g}")
+    elif args.action == "deltas":
+        for key, stats in sorted(
+            deltas(args.device_type, args.device, args.entity, args.metric, _parse_since(args.since)).items()
+        ):
+            print(f"{key:<50} {stats['first']:>14g} -> {stats['last']:<14g} delta {stats['delta']:>12g}  {stats['per_hour']:.3f}/h")
+    elif args.action == "trends":
+        print(trend_context(args.device_type) or "No notable trends.")
+    elif args.action == "compact":
+        print(f"🗜️ Removed {MetricStore(args.device_type).compact()} samples")
+    else:
+        print(f"📈 Loaded metrics from {backfill(args.device_type)} reports")
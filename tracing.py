@@ -0,0 +1,304 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+TRACE_DIR = os.path.join("output", "traces")
+# Attributes added to the enclosing span when a span ends (and so on up the
+# tree), so e.g. an agent update span carries the tokens of its LLM calls.
+ROLLUP_KEYS = ("bytes", "prompt_tokens", "completion_tokens")
+
+_current = contextvars.ContextVar("trace_span", default=None)
+_ids = itertools.count(1)
+
+
+def tracing_enabled():
+    return os.getenv("TRACE", "off").lower() in ("1", "on", "true", "yes")
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def prometheus_label(name, value):
+    # Label values escape backslash, double quote and newline (text format spec).
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{name}="{value}"'
+
+
+# --- Spans ---
+class Span:
+    __slots__ = ("tracer", "name", "span_id", "parent", "wall_start", "start", "duration", "attrs", "error", "_token")
+
+    def __init__(self, tracer, name, parent, attrs, start=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = next(_ids)
+        self.parent = parent
+        self.start = time.monotonic() if start is None else start
+        self.wall_start = time.time() - (time.monotonic() - self.start)
+        self.duration = None
+        self.attrs = attrs
+        self.error = None
+        self._token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        self.error = str(error)[:300]
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None and self.error is None:
+            self.fail(f"{exc_type.__name__}: {exc}")
+        self.tracer.finish(self)
+        return False
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start": round(self.wall_start, 6),
+            "duration": round(self.duration, 6),
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    # Returned whenever tracing is off: no clock reads, no allocation, no locks.
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+# --- Tracer ---
+# Collects finished spans for one run. At the end they are written as a JSON
+# trace file, summarised per span name, and optionally replayed into
+# OpenTelemetry; cumulative per-name totals are also kept for Prometheus.
+class Tracer:
+    def __init__(self, label="run", trace_dir=TRACE_DIR, exporters=None):
+        self.label = label
+        self.trace_dir = trace_dir
+        self.exporters = exporters if exporters is not None else [
+            name.strip() for name in os.getenv("TRACE_EXPORT", "").split(",") if name.strip()
+        ]
+        self.started = datetime.now()
+        self.spans = []
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def finish(self, span):
+        span.duration = time.monotonic() - span.start
+        with self._lock:
+            self.spans.append(span)
+            total = self.totals.setdefault(span.name, {"count": 0, "seconds": 0.0, "errors": 0})
+            total["count"] += 1
+            total["seconds"] += span.duration
+            total["errors"] += span.error is not None
+            if span.parent is not None:
+                for key in ROLLUP_KEYS:
+                    if isinstance(span.attrs.get(key), int):
+                        span.parent.attrs[key] = span.parent.attrs.get(key, 0) + span.attrs[key]
+
+    # --- reporting ---
+    def summary(self):
+        with self._lock:
+            spans = list(self.spans)
+        grouped = {}
+        for span in spans:
+            grouped.setdefault(span.name, []).append(span)
+        rows = []
+        for name, group in grouped.items():
+            durations = [span.duration for span in group]
+            rows.append({
+                "name": name,
+                "count": len(group),
+                "errors": sum(1 for span in group if span.error),
+                "total_s": sum(durations),
+                "p50_ms": _percentile(durations, 50) * 1000,
+                "p99_ms": _percentile(durations, 99) * 1000,
+                "max_ms": max(durations) * 1000,
+                "bytes": sum(span.attrs.get("bytes", 0) for span in group),
+                "tokens": sum(span.attrs.get("prompt_tokens", 0) + span.attrs.get("completion_tokens", 0) for span in group),
+            })
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        print(f"\n⏱️ Trace summary ({self.label}):")
+        print(f"{'span':<22}{'count':>7}{'errors':>7}{'total_s':>10}{'p50_ms':>10}{'p99_ms':>10}{'max_ms':>10}{'bytes':>12}{'tokens':>9}")
+        for row in rows:
+            print(
+                f"{row['name']:<22}{row['count']:>7}{row['errors']:>7}{row['total_s']:>10.2f}{row['p50_ms']:>10.1f}"
+                f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}{row['bytes']:>12}{row['tokens']:>9}"
+            )
+
+    def write(self, spans):
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f"{datetime.now():%Y-%m-%d_%H-%M-%S}_{self.label}.json")
+        document = {
+            "label": self.label,
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.now().isoformat(timespec="seconds"),
+            "spans": [span.as_dict() for span in sorted(spans, key=lambda span: span.start)],
+        }
+        with open(path, "w") as f:
+            json.dump(document, f, indent=1, default=str)
+        return path
+
+    def flush(self):
+        # Writes and exports the spans finished so far, then drops them; the
+        # Prometheus totals keep accumulating (the daemon flushes per cycle).
+        with self._lock:
+            spans, self.spans = self.spans, []
+        if not spans:
+            return None
+        path = self.write(spans)
+        if "otel" in self.exporters:
+            export_otel(spans)
+        if "prometheus" in self.exporters:
+            self.write_prometheus_file()
+        return path
+
+    def prometheus_text(self):
+        with self._lock:
+            totals = {name: dict(total) for name, total in self.totals.items()}
+        lines = [
+            "# TYPE trace_span_seconds_total counter",
+            "# TYPE trace_spans_total counter",
+            "# TYPE trace_span_errors_total counter",
+        ]
+        for name, total in sorted(totals.items()):
+            label = prometheus_label("span", name)
+            lines.append(f"trace_span_seconds_total{{{label}}} {total['seconds']:.6f}")
+            lines.append(f"trace_spans_total{{{label}}} {total['count']}")
+            lines.append(f"trace_span_errors_total{{{label}}} {total['errors']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self):
+        # node_exporter textfile-collector format; replaced atomically.
+        path = os.getenv("TRACE_PROMETHEUS_FILE", os.path.join(self.trace_dir, "spans.prom"))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(path + ".tmp", path)
+
+
+# --- OpenTelemetry Export (optional) ---
+# Replays finished spans with their original timestamps through the OTLP/HTTP
+# exporter, configured by the standard OTEL_EXPORTER_OTLP_* variables.
+def export_otel(spans):
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        print("⚠️ TRACE_EXPORT includes otel but opentelemetry-sdk / opentelemetry-exporter-otlp is not installed.")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "mistral-4-cisco"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_tracer = provider.get_tracer("mistral-4-cisco")
+    started = {}
+    for span in sorted(spans, key=lambda span: span.start):
+        parent = started.get(span.parent.span_id) if span.parent else None
+        otel_span = otel_tracer.start_span(
+            span.name,
+            context=otel_trace.set_span_in_context(parent) if parent else None,
+            start_time=int(span.wall_start * 1e9),
+            attributes={key: value for key, value in span.attrs.items() if isinstance(value, (str, int, float, bool))},
+        )
+        if span.error:
+            otel_span.set_status(otel_trace.Status(otel_trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.wall_start + span.duration) * 1e9))
+        started[span.span_id] = otel_span
+    provider.shutdown()
+
+
+# --- Module-level API ---
+_tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+def start_tracing(label="run"):
+    # Call once at startup; everything below stays a no-op unless TRACE is on.
+    global _tracer
+    if _tracer is None and tracing_enabled():
+        _tracer = Tracer(label)
+    return _tracer
+
+
+def span(name, **attrs):
+    if _tracer is None:
+        return NOOP_SPAN
+    return Span(_tracer, name, _current.get(), attrs)
+
+
+def record(name, started, error=None, **attrs):
+    # For work timed elsewhere (e.g. on the LLM event loop): `started` is a
+    # time.monotonic() reading and the span ends now.
+    if _tracer is None:
+        return
+    finished = Span(_tracer, name, _current.get(), attrs, start=started)
+    if error:
+        finished.fail(error)
+    _tracer.finish(finished)
+
+
+def bind(coroutine):
+    # Coroutines submitted to another thread's event loop lose the caller's
+    # context; this carries the current span across so their spans nest.
+    if _tracer is None:
+        return coroutine
+    parent = _current.get()
+
+    async def run_under_parent():
+        _current.set(parent)
+        return await coroutine
+
+    return run_under_parent()
+
+
+def write_trace():
+    # Prints the summary table and writes/exports the spans finished so far.
+    if _tracer is None:
+        return None
+    _tracer.print_summary()
+    path = _tracer.flush()
+    if path:
+        print(f"🧭 Trace written to {path}")
+    return path
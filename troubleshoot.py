@@ -1,33 +1,56 @@
 import os
 import yaml
-import argparse
-import glob
 from datetime import datetime
 from mistral_auth import get_mistral_client
-import time  # For handling streaming
+from llm_client import get_llm
+from report_index import latest_reports
+from report_store import load_report
+from timeseries import trend_context
+from retrieval import ensure_indexed, format_excerpts, search
+from agent_registry import get_agent_registry, is_missing_agent
+
+
+TROUBLESHOOTER_AGENT = {
+    "model": "pixtral-12b-2409",
+    "description": "An expert network troubleshooting assistant for Cisco devices.",
+    "name": "Network Troubleshooter",
+    "instructions": (
+        "You are an expert network troubleshooting assistant. "
+        "You analyze network device outputs and provide specific, actionable troubleshooting steps. "
+        "Focus on providing practical guidance that a network engineer can implement."
+    ),
+    "completion_args": {
+        "temperature": 0.3,
+        "top_p": 0.95,
+    },
+}
 
 
 def create_troubleshooting_agent(client):
-    try:
-        agent = client.beta.agents.create(
-            model="pixtral-12b-2409",
-            description="An expert network troubleshooting assistant for Cisco devices.",
-            name="Network Troubleshooter",
-            instructions=(
-                "You are an expert network troubleshooting assistant. "
-                "You analyze network device outputs and provide specific, actionable troubleshooting steps. "
-                "Focus on providing practical guidance that a network engineer can implement."
-            ),
-            completion_args={
-                "temperature": 0.3,
-                "top_p": 0.95,
-            },
-        )
-        print(f"✅ Created agent with ID: {agent.id}")
-        return agent.id
-    except Exception as e:
-        print(f"Error creating agent: {e}")
-        return None
+    # Reuses the registered agent while TROUBLESHOOTER_AGENT is unchanged.
+    return get_agent_registry().get_agent_id(client, "troubleshooter", TROUBLESHOOTER_AGENT)
+
+
+def ask_agent(mistral_client, agent_id, prompt):
+    llm = get_llm(mistral_client)
+    if agent_id:
+        try:
+            return llm.converse_stream(prompt, agent_id=agent_id, label="troubleshoot", store=False)
+        except Exception as e:
+            if not is_missing_agent(e):
+                raise
+            # Deleted remotely: forget it and recreate once.
+            get_agent_registry().invalidate("troubleshooter")
+            agent_id = create_troubleshooting_agent(mistral_client)
+            if agent_id:
+                return llm.converse_stream(prompt, agent_id=agent_id, label="troubleshoot", store=False)
+    # Without an agent, fall back to a plain chat completion.
+    return llm.chat_stream(
+        [{"role": "user", "content": prompt}],
+        model=TROUBLESHOOTER_AGENT["model"],
+        max_tokens=2000,
+        label="troubleshoot",
+    )
 
 
 def get_most_recent_yaml_files(device_type, n=3):
@@ -36,9 +59,7 @@ def get_most_recent_yaml_files(device_type, n=3):
         print(f"❌ Error: Output directory '{output_dir}' not found.")
         return []
 
-    files = glob.glob(os.path.join(output_dir, "*.yaml"))
-    files.sort(key=os.path.getmtime, reverse=True)
-    return files[:n]
+    return [report["path"] for report in latest_reports(device_type, n)]
 
 
 def choose_yaml_file(device_type):
@@ -64,12 +85,26 @@ def choose_yaml_file(device_type):
             print("Invalid input. Please enter a number.")
 
 
+def save_guidance(device_type, yaml_path, user_question, guidance, cancelled=False):
+    output_dir = os.path.join("output", "troubleshooting")
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    path = os.path.join(output_dir, f"{timestamp}_{device_type}.md")
+    with open(path, "w") as f:
+        f.write(f"# Troubleshooting {device_type}\n\n")
+        f.write(f"- Report: `{yaml_path}`\n- Question: {user_question}\n")
+        if cancelled:
+            f.write("- Note: the response was cancelled before it finished\n")
+        f.write(f"\n{guidance}\n")
+    print(f"💾 Guidance saved to {path}")
+    return path
+
+
 def troubleshoot_with_mistral(mistral_client, agent_id, yaml_path, user_question):
     try:
-        with open(yaml_path, "r") as f:
-            data = yaml.safe_load(f)
+        data = load_report(yaml_path)
 
-        if data is None:
+        if not data:
             print(f"❌ Error: Could not load YAML data from {yaml_path}")
             return
 
@@ -77,13 +112,12 @@ def troubleshoot_with_mistral(mistral_client, agent_id, yaml_path, user_question
         outputs = data.get("outputs", {})
         summary = data.get("summary", "No summary available")
 
-        # Format and truncate raw output to avoid prompt overflow
-        outputs_str = yaml.dump(outputs, default_flow_style=False)
-        max_output_chars = 3000
-        if len(outputs_str) > max_output_chars:
-            outputs_str = (
-                outputs_str[:max_output_chars] + "\n... [truncated due to token limit]"
-            )
+        # Only the report sections most relevant to the question (BM25 over
+        # the search index, within RETRIEVAL_TOKEN_BUDGET) go into the prompt.
+        ensure_indexed(yaml_path, data)
+        outputs_str = format_excerpts(search(user_question, path=yaml_path))
+
+        trends = trend_context(device_type, set(outputs)) or "No notable trends recorded."
 
         prompt = f"""You are an expert network troubleshooting assistant. A network engineer has provided you with the following data from devices of type '{device_type}', along with an initial AI-generated summary.
 
@@ -91,24 +125,26 @@ def troubleshoot_with_mistral(mistral_client, agent_id, yaml_path, user_question
 Initial AI Summary:
 {summary}
 
-Raw Device Outputs:
+Trends From Previous Scans (last 7 days):
+{trends}
+
+Relevant Device Output Excerpts:
 {outputs_str}
 
 The engineer has the following question:
 {user_question}
 
-Provide specific, actionable troubleshooting steps to address the engineer's question, referencing the raw device outputs as needed."""
-
-        response = mistral_client.chat.complete(
-            model="pixtral-12b-2409",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=2000,
-        )
-
-        troubleshooting_guidance = response.choices[0].message.content.strip()
+Provide specific, actionable troubleshooting steps to address the engineer's question, referencing the device output excerpts as needed."""
 
+        # Streamed so the first lines show up while the rest is generated;
+        # Ctrl-C stops the answer and keeps what arrived so far.
         print("\n✅ Troubleshooting Guidance:\n")
-        print(troubleshooting_guidance)
+        result = ask_agent(mistral_client, agent_id, prompt)
+        print()
+        if result.first_token is not None:
+            print(f"\n⏱️ First token after {result.first_token:.2f}s")
+        if result.text:
+            save_guidance(device_type, yaml_path, user_question, result.text, result.cancelled)
 
     except FileNotFoundError:
         print(f"❌ Error: File '{yaml_path}' not found")
@@ -118,20 +154,28 @@ Provide specific, actionable troubleshooting steps to address the engineer's que
         print(f"❌ Error during Mistral analysis: {e}")
 
 
+# `cli.py troubleshoot` lands here (as does `python troubleshoot.py`).
+def main(args):
+    device_type = input("Enter the device type (e.g., nxos, iosxe): ")
+    yaml_path = choose_yaml_file(device_type)
+
+    if yaml_path:
+        user_question = input("What would you like help troubleshooting? ")
+        # Created after the prompts, so they appear without waiting on the SDK import.
+        mistral_client = get_mistral_client()
+        # Resolved only now, and from the local registry when it is still fresh.
+        agent_id = create_troubleshooting_agent(mistral_client)
+        if not agent_id:
+            print("⚠️ No troubleshooting agent available; using a plain chat completion.")
+        troubleshoot_with_mistral(
+            mistral_client, agent_id, yaml_path, user_question
+        )
+    else:
+        print("❌ No YAML file selected. Exiting.")
+
+
 if __name__ == "__main__":
-    mistral_client = get_mistral_client()
+    import sys
+    from cli import main as cli_main
 
-    agent_id = create_troubleshooting_agent(mistral_client)
-    if agent_id:
-        device_type = input("Enter the device type (e.g., nxos, iosxe): ")
-        yaml_path = choose_yaml_file(device_type)
-
-        if yaml_path:
-            user_question = input("What would you like help troubleshooting? ")
-            troubleshoot_with_mistral(
-                mistral_client, agent_id, yaml_path, user_question
-            )
-        else:
-            print("❌ No YAML file selected. Exiting.")
-    else:
-        print("❌ Failed to create troubleshooting agent. Exiting.")
+    cli_main(["troubleshoot", *sys.argv[1:]])